@@ -3,9 +3,12 @@ from django.contrib import admin
 from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.sessions.models import Session
+from django.db.models import Count, Q
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.html import format_html
+from catalogo.imagenes import url_rendicion
+
 from .models import Profile
 
 User = get_user_model()
@@ -37,17 +40,17 @@ class SessionAdmin(RowActionsMixin, admin.ModelAdmin):
     search_fields = ("session_key",)
     ordering = ("-expire_date",)
 
+    def get_queryset(self, request):
+        # Usuario de cada sesión vía el índice UserSession: un JOIN, sin decodificar
+        return super().get_queryset(request).select_related("usuario__user")
+
     def user_link(self, obj):
-        data = obj.get_decoded()
-        uid = data.get("_auth_user_id")
-        if not uid:
-            return "— anónima —"
         try:
-            u = User.objects.get(pk=uid)
-            # link a la ficha del usuario en el admin
-            return format_html('<a href="/admin/auth/user/{}/change/">{}</a>', u.pk, u.get_username())
-        except User.DoesNotExist:
-            return f"(id {uid})"
+            u = obj.usuario.user
+        except Session.usuario.RelatedObjectDoesNotExist:
+            return "— anónima —"
+        # link a la ficha del usuario en el admin
+        return format_html('<a href="/admin/auth/user/{}/change/">{}</a>', u.pk, u.get_username())
     user_link.short_description = "Usuario"
 
     def estado(self, obj):
@@ -73,16 +76,16 @@ class MyUserAdmin(UserAdmin):
     list_display = UserAdmin.list_display + ("active_sessions", "last_login",)
     ordering = ("-date_joined",)
 
+    def get_queryset(self, request):
+        # Un solo COUNT anotado para toda la página (índice user, expire_date)
+        return super().get_queryset(request).annotate(
+            num_sesiones=Count("sesiones", filter=Q(sesiones__expire_date__gt=timezone.now()))
+        )
+
     def active_sessions(self, obj):
-        # Recorre sesiones no expiradas y cuenta cuántas pertenecen al usuario.
-        now = timezone.now()
-        total = 0
-        for s in Session.objects.filter(expire_date__gt=now).only("session_key", "expire_date"):
-            data = s.get_decoded()
-            if data.get("_auth_user_id") == str(obj.pk):
-                total += 1
-        return total
+        return obj.num_sesiones
     active_sessions.short_description = "Sesiones activas"
+    active_sessions.admin_order_field = "num_sesiones"
 
 
 # Re-registrar el admin de User con nuestra clase
@@ -101,7 +104,7 @@ class ProfileAdmin(admin.ModelAdmin):
 
     def avatar_preview(self, obj):
         if obj.avatar:
-            return format_html('<img src="{}" style="width:40px;height:40px;border-radius:50%;object-fit:cover;">', obj.avatar.url)
+            return format_html('<img src="{}" style="width:40px;height:40px;border-radius:50%;object-fit:cover;">', url_rendicion(obj.avatar, "admin"))
         return "—"
     avatar_preview.short_description = "Avatar"
 
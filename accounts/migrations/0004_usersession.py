@@ -0,0 +1,67 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def indexar_sesiones(apps, schema_editor):
+    """Decodifica UNA vez las sesiones vigentes para poblar el índice."""
+    from django.contrib.auth import SESSION_KEY
+    from django.contrib.sessions.backends.db import SessionStore
+
+    Session = apps.get_model("sessions", "Session")
+    UserSession = apps.get_model("accounts", "UserSession")
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split("."))
+    store = SessionStore()
+
+    def guardar(lote):
+        existentes = set(User.objects.filter(pk__in=[u for _, u, _ in lote]).values_list("pk", flat=True))
+        UserSession.objects.bulk_create(
+            [UserSession(session_id=k, user_id=u, expire_date=e)
+             for k, u, e in lote if u in existentes],
+            ignore_conflicts=True,
+        )
+
+    lote = []
+    vigentes = Session.objects.filter(expire_date__gt=timezone.now())
+    for s in vigentes.iterator(chunk_size=2000):
+        uid = store.decode(s.session_data).get(SESSION_KEY)
+        if not uid:
+            continue
+        try:
+            lote.append((s.session_key, int(uid), s.expire_date))
+        except (TypeError, ValueError):
+            continue
+        if len(lote) >= 1000:
+            guardar(lote)
+            lote = []
+    if lote:
+        guardar(lote)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_profile_rol'),
+        ('sessions', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSession',
+            fields=[
+                ('session', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='usuario', serialize=False, to='sessions.session')),
+                ('expire_date', models.DateTimeField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sesiones', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Sesión de usuario',
+                'verbose_name_plural': 'Sesiones de usuario',
+                'indexes': [models.Index(fields=['user', 'expire_date'], name='usersession_user_expira')],
+            },
+        ),
+        migrations.RunPython(indexar_sesiones, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,7 @@
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction
+from django.contrib.auth.signals import user_logged_in, user_logged_out
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
@@ -60,6 +61,15 @@ class Profile(models.Model):
         return self.display_name or self.user.get_full_name() or self.user.username
 
 
+# Derivadas del avatar (miniaturas WebP) al subirlo
+@receiver(post_save, sender=Profile)
+def encolar_avatar(sender, instance, raw=False, **kwargs):
+    if instance.avatar and not raw:
+        from catalogo.imagenes import encolar
+        nombre = instance.avatar.name
+        transaction.on_commit(lambda: encolar(nombre))
+
+
 # Auto-crear perfil
 @receiver(post_save, sender=User)
 def create_or_update_profile(sender, instance, created, **kwargs):
@@ -67,3 +77,50 @@ def create_or_update_profile(sender, instance, created, **kwargs):
         Profile.objects.create(user=instance)
     else:
         Profile.objects.get_or_create(user=instance)
+
+
+# ========= Índice sesión -> usuario =========
+class UserSession(models.Model):
+    """
+    A qué usuario pertenece cada sesión autenticada. Lo mantiene
+    accounts.sessions.SessionStore (y las señales de login/logout); al
+    borrarse la sesión (logout, clearsessions) la fila cae por CASCADE.
+    """
+    session = models.OneToOneField(
+        "sessions.Session", on_delete=models.CASCADE, primary_key=True,
+        # Sin FK en la BD: el login indexa antes de que el middleware guarde
+        # los datos de la sesión. El CASCADE lo resuelve Django al borrar.
+        related_name="usuario", db_constraint=False,
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="sesiones",
+    )
+    expire_date = models.DateTimeField()  # copia de Session.expire_date
+
+    class Meta:
+        verbose_name = "Sesión de usuario"
+        verbose_name_plural = "Sesiones de usuario"
+        indexes = [models.Index(fields=["user", "expire_date"], name="usersession_user_expira")]
+
+    def __str__(self):
+        return f"{self.session_id} -> {self.user_id}"
+
+
+@receiver(user_logged_in)
+def indexar_sesion_login(sender, request, user, **kwargs):
+    # login() ya rotó la llave; la fila de sesión se guarda al final del
+    # request, pero dejamos el índice listo desde ahora.
+    session = getattr(request, "session", None)
+    if session is None or not session.session_key:
+        return
+    from .sessions import indexar_sesion
+    indexar_sesion(session.session_key, user.pk, session.get_expiry_date())
+
+
+@receiver(user_logged_out)
+def desindexar_sesion_logout(sender, request, user, **kwargs):
+    session = getattr(request, "session", None)
+    if session is None or not session.session_key:
+        return
+    from .sessions import desindexar_sesion
+    desindexar_sesion(session.session_key)
@@ -0,0 +1,48 @@
+# accounts/sessions.py
+"""
+SessionStore de base de datos que además mantiene el índice UserSession
+(sesión -> usuario). Así el admin puede contar/mostrar sesiones por
+usuario con JOINs en vez de decodificar cada sesión.
+
+Se activa con SESSION_ENGINE = "accounts.sessions".
+"""
+from django.contrib.auth import SESSION_KEY
+from django.contrib.sessions.backends.db import SessionStore as DBSessionStore
+
+
+def indexar_sesion(session_key, user_id, expire_date):
+    """Crea/actualiza la fila del índice (un solo upsert)."""
+    from django.db import connection
+    from .models import UserSession
+
+    unique = ["session"] if connection.features.supports_update_conflicts_with_target else None
+    UserSession.objects.bulk_create(
+        [UserSession(session_id=session_key, user_id=user_id, expire_date=expire_date)],
+        update_conflicts=True,
+        unique_fields=unique,
+        update_fields=["user", "expire_date"],
+    )
+
+
+def desindexar_sesion(session_key):
+    from .models import UserSession
+    UserSession.objects.filter(session_id=session_key).delete()
+
+
+class SessionStore(DBSessionStore):
+    def load(self):
+        data = super().load()
+        self._indexada = SESSION_KEY in data
+        return data
+
+    def save(self, must_create=False):
+        super().save(must_create=must_create)
+        user_id = self._get_session(no_load=must_create).get(SESSION_KEY)
+        if user_id:
+            indexar_sesion(self.session_key, user_id, self.get_expiry_date())
+            self._indexada = True
+        elif getattr(self, "_indexada", False):
+            # Sesión que dejó de estar autenticada: sale del índice.
+            # (Las anónimas no tocan la tabla.)
+            desindexar_sesion(self.session_key)
+            self._indexada = False
@@ -1,3 +1,61 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import UserSession
+from .sessions import SessionStore
+
+User = get_user_model()
+
+
+# =======================
+# Índice sesión -> usuario
+# =======================
+@override_settings(SESSION_ENGINE="accounts.sessions")
+class UserSessionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("ana", password="clave-segura-1")
+
+    def test_login_indexa_y_logout_desindexa(self):
+        self.assertTrue(self.client.login(username="ana", password="clave-segura-1"))
+        key = self.client.session.session_key
+        fila = UserSession.objects.get()
+        self.assertEqual(fila.session_id, key)
+        self.assertEqual(fila.user_id, self.user.pk)
+        self.assertTrue(Session.objects.filter(session_key=key).exists())
+
+        self.client.post(reverse("logout"))
+        self.assertFalse(UserSession.objects.exists())
+
+    def test_sesion_anonima_no_toca_el_indice(self):
+        s = SessionStore()
+        s["carrito"] = 1
+        s.save()
+        self.assertTrue(Session.objects.filter(session_key=s.session_key).exists())
+        self.assertFalse(UserSession.objects.exists())
+
+    def test_borrar_la_sesion_borra_la_fila(self):
+        self.client.login(username="ana", password="clave-segura-1")
+        Session.objects.all().delete()
+        self.assertFalse(UserSession.objects.exists())
+
+    def test_admin_cuenta_solo_sesiones_vigentes(self):
+        otro = User.objects.create_user("beto", password="x")
+        for dias in (1, 2, -1):
+            s = SessionStore()
+            s["_auth_user_id"] = str(otro.pk)
+            s.set_expiry(timezone.now() + timedelta(days=dias))
+            s.save()
+        admin = User.objects.create_superuser("admin", "a@a.com", "clave-admin-1")
+        self.client.force_login(admin)
+
+        r = self.client.get(reverse("admin:auth_user_changelist"))
+        self.assertEqual(r.status_code, 200)
+        cuentas = {u.username: u.num_sesiones for u in r.context["cl"].result_list}
+        self.assertEqual(cuentas["beto"], 2)
+        self.assertEqual(cuentas["ana"], 0)
+        self.assertEqual(cuentas["admin"], 1)
@@ -1,3 +1,117 @@
-from django.test import TestCase
+# api/tests.py
+import json
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from catalogo.exportar import acepta_gzip
+from catalogo.models import Categoria, Producto
+
+
+class ExportarProductosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        categoria = Categoria.objects.create(nombre="Tazas", slug="tazas")
+        Producto.objects.create(nombre="Visible", slug="visible", precio=Decimal("10"), stock=1, categoria=categoria)
+        Producto.objects.create(nombre="Borrador", slug="borrador", precio=Decimal("10"), stock=1,
+                                categoria=categoria, activo=False)
+        cls.url = reverse("productos_export_api")
+
+    def _cuerpo(self, respuesta):
+        return b"".join(respuesta.streaming_content).decode()
+
+    def test_inactivos_solo_para_staff(self):
+        self.assertEqual(self.client.get(self.url, {"inactivos": "1"}).status_code, 403)
+
+        staff = get_user_model().objects.create_user("admin", "admin@example.com", "x", is_staff=True)
+        self.client.force_login(staff)
+        respuesta = self.client.get(self.url, {"inactivos": "1", "fields": "slug"})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn("borrador", self._cuerpo(respuesta))
+
+    def test_sin_inactivos_no_sale_el_borrador(self):
+        respuesta = self.client.get(self.url, {"fields": "slug"})
+        self.assertNotIn("borrador", self._cuerpo(respuesta))
+
+    def test_gzip_respeta_q_values(self):
+        respuesta = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip;q=0, identity")
+        self.assertFalse(respuesta.has_header("Content-Encoding"))
+        self.assertIn("Accept-Encoding", respuesta["Vary"])
+
+        respuesta = self.client.get(self.url, HTTP_ACCEPT_ENCODING="br, gzip;q=0.5")
+        self.assertEqual(respuesta["Content-Encoding"], "gzip")
+
+    def test_lotes_por_pk_sin_huecos_ni_repetidos(self):
+        categoria = Categoria.objects.get(slug="tazas")
+        for i in range(4):
+            Producto.objects.create(nombre=f"Taza {i}", slug=f"taza-{i}", precio=Decimal("5"), stock=1,
+                                    categoria=categoria)
+        esperados = list(Producto.objects.filter(activo=True).order_by("pk").values_list("pk", flat=True))
+        with mock.patch("catalogo.exportar.CHUNK_SIZE", 2):
+            respuesta = self.client.get(self.url, {"formato": "json", "fields": "id"})
+            ids = [p["id"] for p in json.loads(self._cuerpo(respuesta))]
+        self.assertEqual(ids, esperados)
+
+    def test_acepta_gzip(self):
+        self.assertTrue(acepta_gzip("gzip, deflate"))
+        self.assertTrue(acepta_gzip("*"))
+        self.assertFalse(acepta_gzip("gzip;q=0"))
+        self.assertFalse(acepta_gzip("*;q=0.5, gzip;q=0"))
+        self.assertFalse(acepta_gzip("deflate, br"))
+        self.assertFalse(acepta_gzip(""))
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                                       "LOCATION": "api-productos"}})
+class ProductosApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        categoria = Categoria.objects.create(nombre="Tazas", slug="tazas")
+        ahora = timezone.now()
+        for i in range(8):
+            p = Producto.objects.create(nombre=f"Taza {i}", slug=f"taza-{i}", precio=Decimal("10"),
+                                        stock=1, categoria=categoria, activo=i != 5)
+            # Empates de `creado` de a dos: el cursor tiene que desempatar por id
+            Producto.objects.filter(pk=p.pk).update(creado=ahora - timedelta(minutes=i // 2))
+        cls.url = reverse("productos_api")
+
+    def _paginas(self, **params):
+        ids, cursor = [], None
+        while True:
+            datos = self.client.get(self.url, {**params, **({"cursor": cursor} if cursor else {})}).json()
+            ids.append([p["id"] for p in datos["productos"]])
+            cursor = datos["siguiente"]
+            if not cursor:
+                return ids
+
+    def test_cursor_sin_huecos_ni_repetidos(self):
+        paginas = self._paginas(limit=3, fields="id")
+        esperados = list(Producto.objects.filter(activo=True).order_by("-creado", "-id").values_list("pk", flat=True))
+        self.assertEqual([len(p) for p in paginas], [3, 3, 1])
+        self.assertEqual(sum(paginas, []), esperados)
+
+    def test_campos_pedidos_y_no_validos(self):
+        datos = self.client.get(self.url, {"limit": 1, "fields": "slug,precio_final"}).json()
+        self.assertEqual(set(datos["productos"][0]), {"slug", "precio_final"})
+        self.assertEqual(self.client.get(self.url, {"fields": "slug,clave"}).status_code, 400)
+
+    def test_etag_304_hasta_que_cambia_el_catalogo(self):
+        primera = self.client.get(self.url, {"fields": "id"})
+        etag = primera["ETag"]
+        repetida = self.client.get(self.url, {"fields": "id"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(repetida.status_code, 304)
+        self.assertEqual(repetida.content, b"")
+        # Otros parámetros, otra ETag
+        self.assertEqual(self.client.get(self.url, {"fields": "slug"}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Producto.objects.filter(slug="taza-0").update(precio=Decimal("12"))
+        cambiada = self.client.get(self.url, {"fields": "id"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cambiada.status_code, 200)
+        self.assertNotEqual(cambiada["ETag"], etag)
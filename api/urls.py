@@ -4,4 +4,6 @@ from . import views
 urlpatterns = [
     path("login/", views.login_api, name="login_api"),
     path("productos/", views.productos_api, name="productos_api"),
+    path("productos/changes/", views.productos_cambios_api, name="productos_cambios_api"),
+    path("productos/export/", views.productos_export_api, name="productos_export_api"),
 ]
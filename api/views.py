@@ -1,8 +1,17 @@
+import hashlib
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime, timezone as dt_timezone
+
+from django.db.models import Q
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
 from django.contrib.auth import get_user_model
 
-from catalogo.models import Producto      # ⚠️ confirma que tu modelo se llama Producto
+from catalogo.cache import get_version
+from catalogo.exportar import CAMPOS_PRODUCTO, CAMPOS_DEFAULT, serializar_producto, exportar_productos
+from catalogo.filtros import leer_filtros, filtrar_productos
+from catalogo.models import Producto, ProductoCambio  # ⚠️ confirma que tu modelo se llama Producto
 from accounts.models import Profile       # ⚠️ si en accounts/models.py el modelo se llama distinto, cámbialo
 
 User = get_user_model()
@@ -47,20 +56,186 @@ def login_api(request):
     return JsonResponse({"ok": True, "user": data_user})
 
 
+# =======================
+# CATÁLOGO PARA LA APP
+# =======================
+LIMITE_DEFAULT = 50
+LIMITE_MAX = 200
+
+def _codificar_cursor(producto):
+    crudo = f"{producto.creado.isoformat()}|{producto.id}"
+    return urlsafe_b64encode(crudo.encode()).decode().rstrip("=")
+
+
+def _decodificar_cursor(token):
+    """(creado, id) del último producto de la página anterior o ValueError."""
+    crudo = urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+    creado, pk = crudo.rsplit("|", 1)
+    return datetime.fromisoformat(creado), int(pk)
+
+
+def _campos(request):
+    pedidos = [c.strip() for c in (request.GET.get("fields") or "").split(",") if c.strip()]
+    if not pedidos:
+        return list(CAMPOS_DEFAULT)
+    invalidos = [c for c in pedidos if c not in CAMPOS_PRODUCTO]
+    if invalidos:
+        raise ValueError(f"Campos no válidos: {', '.join(invalidos)}")
+    return pedidos
+
+
+def _catalogo_etag(request):
+    # Cambia con la versión del catálogo y con los parámetros de la consulta
+    base = f"{get_version()}|{request.GET.urlencode()}"
+    return hashlib.md5(base.encode()).hexdigest()
+
+
+def _catalogo_last_modified(request):
+    return datetime.fromtimestamp(get_version() / 1000, tz=dt_timezone.utc)
+
+
+@condition(etag_func=_catalogo_etag, last_modified_func=_catalogo_last_modified)
 def productos_api(request):
     """
     GET /api/productos/
-    Devuelve catálogo simplificado para la app.
+    Catálogo paginado para la app (solo productos activos).
+    Parámetros:
+      - limit:  tamaño de página (1..200, default 50)
+      - cursor: token "siguiente" de la respuesta anterior
+      - fields: campos separados por coma (default: id,nombre,precio,imagen)
+      - q, cat, marca, estudio, tematica, segmento, destacados, ofertas:
+        mismos filtros que /productos/
+    Responde con ETag/Last-Modified; si la app los reenvía y nada cambió
+    recibe un 304 vacío.
+    """
+    if request.method != "GET":
+        return JsonResponse({"ok": False, "error": "Método no permitido"}, status=405)
+
+    try:
+        campos = _campos(request)
+        limite = min(max(int(request.GET.get("limit") or LIMITE_DEFAULT), 1), LIMITE_MAX)
+        cursor = request.GET.get("cursor")
+        despues_de = _decodificar_cursor(cursor) if cursor else None
+    except ValueError as exc:
+        return JsonResponse({"ok": False, "error": str(exc) or "Parámetros inválidos"}, status=400)
+
+    # Token leído ANTES del listado: lo que cambie mientras tanto llegará por
+    # /api/productos/changes/ aunque ya venga en esta página.
+    sync_token = ProductoCambio.ultimo_token()
+
+    qs = (Producto.objects
+          .filter(activo=True)
+          .select_related("categoria", "marca", "estudio", "segmento")
+          .con_portada())
+    qs = filtrar_productos(qs, leer_filtros(request.GET))
+
+    # Paginación por llave (creado, id): sin OFFSET ni COUNT
+    if despues_de:
+        creado, pk = despues_de
+        qs = qs.filter(Q(creado__lt=creado) | Q(creado=creado, id__lt=pk))
+    pagina = list(qs.order_by("-creado", "-id")[:limite + 1])
+
+    siguiente = None
+    if len(pagina) > limite:
+        pagina = pagina[:limite]
+        siguiente = _codificar_cursor(pagina[-1])
+
+    productos = [serializar_producto(p, request, campos) for p in pagina]
+    return JsonResponse({
+        "ok": True,
+        "productos": productos,
+        "siguiente": siguiente,
+        "sync_token": sync_token,
+    })
+
+
+LIMITE_CAMBIOS = 500
+
+
+def productos_cambios_api(request):
+    """
+    GET /api/productos/changes/?since=<sync_token>
+    Productos creados/modificados/eliminados después del token.
+    - Los eliminados o desactivados vienen como {"id": N, "eliminado": true}.
+    - `sync_token` es el nuevo token; si `mas` es true hay que volver a
+      pedir con él antes de dar la sincronización por terminada.
+    Acepta `fields` igual que /api/productos/.
     """
     if request.method != "GET":
         return JsonResponse({"ok": False, "error": "Método no permitido"}, status=405)
 
-    # ⚠️ Ajusta nombres de campos según catalogo/models.py
-    qs = Producto.objects.all().values(
-        "id",
-        "nombre",       # por ejemplo: nombre, titulo, nombre_producto...
-        "precio",       # por ejemplo: precio, precio_unitario...
-        "imagen",       # por ejemplo: imagen, imagen_url, foto...
-    )
+    since = (request.GET.get("since") or "").strip()
+    if not since.isdigit():
+        return JsonResponse(
+            {"ok": False, "error": "Falta since (usa el sync_token de /api/productos/)"},
+            status=400,
+        )
+    since = int(since)
+
+    try:
+        campos = _campos(request)
+        limite = min(max(int(request.GET.get("limit") or LIMITE_CAMBIOS), 1), LIMITE_CAMBIOS)
+    except ValueError as exc:
+        return JsonResponse({"ok": False, "error": str(exc) or "Parámetros inválidos"}, status=400)
+
+    # Nunca pasa un hueco de ids reciente (transacción sin confirmar): ver ProductoCambio
+    cambios, token, mas = ProductoCambio.leer(since, limite)
+    if not cambios:
+        return JsonResponse({"ok": True, "productos": [], "sync_token": since, "mas": False})
+
+    # Varios cambios del mismo producto = una sola fila con su estado actual
+    ids = list(dict.fromkeys(pid for _cid, pid in cambios))
+    vivos = (Producto.objects
+             .filter(pk__in=ids, activo=True)
+             .select_related("categoria", "marca", "estudio", "segmento")
+             .con_portada()
+             .in_bulk())
+
+    productos = []
+    for pid in ids:
+        p = vivos.get(pid)
+        if p is None:
+            productos.append({"id": pid, "eliminado": True})
+        else:
+            productos.append(serializar_producto(p, request, campos))
+
+    return JsonResponse({
+        "ok": True,
+        "productos": productos,
+        "sync_token": token,
+        "mas": mas,
+    })
+
+
+def productos_export_api(request):
+    """
+    GET /api/productos/export/?formato=ndjson|json
+    Catálogo completo en streaming (para socios y la app): NDJSON por
+    defecto, gzip si el cliente manda Accept-Encoding: gzip. Acepta los
+    mismos `fields` y filtros que /api/productos/ y `inactivos=1` para
+    incluir productos desactivados (solo staff con sesión iniciada).
+    """
+    if request.method != "GET":
+        return JsonResponse({"ok": False, "error": "Método no permitido"}, status=405)
+
+    formato = (request.GET.get("formato") or "ndjson").strip().lower()
+    if formato not in ("ndjson", "json"):
+        return JsonResponse({"ok": False, "error": "Formato no válido (ndjson o json)"}, status=400)
+    try:
+        campos = _campos(request)
+    except ValueError as exc:
+        return JsonResponse({"ok": False, "error": str(exc)}, status=400)
+
+    qs = (Producto.objects
+          .select_related("categoria", "marca", "estudio", "segmento")
+          .con_portada()
+          .order_by("id"))
+    if request.GET.get("inactivos") in ("1", "true", "True"):
+        # Lo no publicado no sale a clientes anónimos
+        if not (request.user.is_authenticated and request.user.is_staff):
+            return JsonResponse({"ok": False, "error": "inactivos=1 requiere una cuenta de staff"}, status=403)
+    else:
+        qs = qs.filter(activo=True)
+    qs = filtrar_productos(qs, leer_filtros(request.GET))
 
-    return JsonResponse({"ok": True, "productos": list(qs)})
+    return exportar_productos(request, qs, campos, formato)
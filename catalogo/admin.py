@@ -1,11 +1,24 @@
 # admin.py
 from django.contrib import admin
+from django.db.models import Count, Q, Sum
 from django.utils.html import format_html
 from django.utils.text import slugify
 from django.utils import timezone 
+import secrets
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from . import ajustes
+from .exportar import CAMPOS_PRODUCTO, exportar_productos
+from .imagenes import url_rendicion
+from .tareas import enviar_campania_tarea
+from tareas.cola import encolar
+from .forms import CsvAjusteForm, ReglaAjusteForm
 from .models import (
     Categoria, Producto, Marca, Estudio, Tematica, ProductoImagen, Segmento,
-    NewsletterSubscriber, Order,
+    NewsletterSubscriber, NewsletterCampaign, Order, OrderItem, Cart, CartLine,
 )
 
 # ======================
@@ -29,9 +42,66 @@ class RowActionsMixin:
     acciones.short_description = "Acciones"
 
 
+# ======================
+# CONTEOS DE PRODUCTOS (taxonomías)
+# ======================
+class TieneProductosFilter(admin.SimpleListFilter):
+    title = "Productos"
+    parameter_name = "con_productos"
+
+    def lookups(self, request, model_admin):
+        return (
+            ("disponibles", "Con productos disponibles"),
+            ("activos", "Con productos activos"),
+            ("sin_disponibles", "Sin productos disponibles"),
+            ("vacias", "Sin productos"),
+        )
+
+    def queryset(self, request, queryset):
+        # Filtra sobre las anotaciones de ConteoProductosMixin
+        value = self.value()
+        if value == "disponibles":
+            return queryset.filter(num_disponibles__gt=0)
+        if value == "activos":
+            return queryset.filter(num_activos__gt=0)
+        if value == "sin_disponibles":
+            return queryset.filter(num_disponibles=0)
+        if value == "vacias":
+            return queryset.filter(num_productos=0)
+        return queryset
+
+
+class ConteoProductosMixin:
+    """
+    Anota en el listado cuántos productos tiene cada fila (total, activos y
+    disponibles) con un solo GROUP BY, en vez de un COUNT por fila.
+    """
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            num_productos=Count("productos"),
+            num_activos=Count("productos", filter=Q(productos__activo=True)),
+            num_disponibles=Count(
+                "productos", filter=Q(productos__activo=True, productos__stock__gt=0)
+            ),
+        )
+
+    def get_list_filter(self, request):
+        return (*super().get_list_filter(request), TieneProductosFilter)
+
+    def productos_count(self, obj):
+        return obj.num_productos
+    productos_count.short_description = "Productos"
+    productos_count.admin_order_field = "num_productos"
+
+    def productos_disponibles(self, obj):
+        return obj.num_disponibles
+    productos_disponibles.short_description = "Disponibles"
+    productos_disponibles.admin_order_field = "num_disponibles"
+
+
 @admin.register(Marca)
-class MarcaAdmin(RowActionsMixin, admin.ModelAdmin):
-    list_display = ("nombre", "slug", "logo_thumb", "productos_count", "acciones")
+class MarcaAdmin(ConteoProductosMixin, RowActionsMixin, admin.ModelAdmin):
+    list_display = ("nombre", "slug", "logo_thumb", "productos_count", "productos_disponibles", "acciones")
     search_fields = ("nombre", "slug")
     prepopulated_fields = {"slug": ("nombre",)}
     ordering = ("nombre",)
@@ -48,7 +118,7 @@ class MarcaAdmin(RowActionsMixin, admin.ModelAdmin):
             return format_html(
                 '<img src="{}" style="height:28px;border-radius:6px;object-fit:contain;'
                 'background:#fff;padding:2px;border:1px solid #e5e7eb;" />',
-                logo.url,
+                url_rendicion(logo, "admin"),
             )
         return "—"
     logo_thumb.short_description = "Logo"
@@ -67,17 +137,13 @@ class MarcaAdmin(RowActionsMixin, admin.ModelAdmin):
         return "—"
     logo_preview.short_description = "Vista previa"
 
-    def productos_count(self, obj):
-        return obj.productos.count()
-    productos_count.short_description = "Productos"
-
 
 # ======================
 # ESTUDIO
 # ======================
 @admin.register(Estudio)
-class EstudioAdmin(admin.ModelAdmin):
-    list_display = ("nombre", "slug", "logo_preview", "productos_count")
+class EstudioAdmin(ConteoProductosMixin, admin.ModelAdmin):
+    list_display = ("nombre", "slug", "logo_preview", "productos_count", "productos_disponibles")
     search_fields = ("nombre", "slug")
     prepopulated_fields = {"slug": ("nombre",)}
     ordering = ("nombre",)
@@ -85,21 +151,17 @@ class EstudioAdmin(admin.ModelAdmin):
 
     def logo_preview(self, obj):
         if getattr(obj, "logo", None):
-            return format_html('<img src="{}" style="height:28px;border-radius:4px;" />', obj.logo.url)
+            return format_html('<img src="{}" style="height:28px;border-radius:4px;" />', url_rendicion(obj.logo, "admin"))
         return "—"
     logo_preview.short_description = "Logo"
 
-    def productos_count(self, obj):
-        return obj.productos.count()
-    productos_count.short_description = "Productos"
-
 
 # ======================
 # TEMÁTICA
 # ======================
 @admin.register(Tematica)
-class TematicaAdmin(admin.ModelAdmin):
-    list_display = ("nombre", "slug", "icono_preview", "productos_count")
+class TematicaAdmin(ConteoProductosMixin, admin.ModelAdmin):
+    list_display = ("nombre", "slug", "icono_preview", "productos_count", "productos_disponibles")
     search_fields = ("nombre", "slug")
     prepopulated_fields = {"slug": ("nombre",)}
     ordering = ("nombre",)
@@ -107,21 +169,17 @@ class TematicaAdmin(admin.ModelAdmin):
 
     def icono_preview(self, obj):
         if getattr(obj, "icono", None):
-            return format_html('<img src="{}" style="height:24px;border-radius:4px;" />', obj.icono.url)
+            return format_html('<img src="{}" style="height:24px;border-radius:4px;" />', url_rendicion(obj.icono, "admin"))
         return "—"
     icono_preview.short_description = "Icono"
 
-    def productos_count(self, obj):
-        return obj.productos.count()
-    productos_count.short_description = "Productos"
-
 
 # ======================
 # CATEGORÍA
 # ======================
 @admin.register(Categoria)
-class CategoriaAdmin(admin.ModelAdmin):
-    list_display = ("nombre", "slug", "imagen_preview", "productos_count")
+class CategoriaAdmin(ConteoProductosMixin, admin.ModelAdmin):
+    list_display = ("nombre", "slug", "imagen_preview", "productos_count", "productos_disponibles")
     search_fields = ("nombre", "slug")
     prepopulated_fields = {"slug": ("nombre",)}
     ordering = ("nombre",)
@@ -130,21 +188,17 @@ class CategoriaAdmin(admin.ModelAdmin):
     def imagen_preview(self, obj):
         img = getattr(obj, "imagen", None)
         if img:
-            return format_html('<img src="{}" style="height:28px;border-radius:4px;" />', img.url)
+            return format_html('<img src="{}" style="height:28px;border-radius:4px;" />', url_rendicion(img, "admin"))
         return "—"
     imagen_preview.short_description = "Imagen"
 
-    def productos_count(self, obj):
-        return obj.productos.count()
-    productos_count.short_description = "N.º de productos"
-
 
 # ======================
 # SEGMENTO (Hombres/Mujeres/Niños/Unisex)
 # ======================
 @admin.register(Segmento)
-class SegmentoAdmin(admin.ModelAdmin):
-    list_display = ("nombre", "slug", "icono_preview", "productos_count")
+class SegmentoAdmin(ConteoProductosMixin, admin.ModelAdmin):
+    list_display = ("nombre", "slug", "icono_preview", "productos_count", "productos_disponibles")
     search_fields = ("nombre", "slug")
     prepopulated_fields = {"slug": ("nombre",)}
     ordering = ("nombre",)
@@ -152,14 +206,10 @@ class SegmentoAdmin(admin.ModelAdmin):
 
     def icono_preview(self, obj):
         if getattr(obj, "icono", None):
-            return format_html('<img src="{}" style="height:24px;border-radius:4px;" />', obj.icono.url)
+            return format_html('<img src="{}" style="height:24px;border-radius:4px;" />', url_rendicion(obj.icono, "admin"))
         return "—"
     icono_preview.short_description = "Icono"
 
-    def productos_count(self, obj):
-        return obj.productos.count()
-    productos_count.short_description = "Productos"
-
 
 # ======================
 # FILTRO PERSONALIZADO
@@ -192,7 +242,7 @@ class ProductoImagenInline(admin.TabularInline):
 
     def preview(self, obj):
         if getattr(obj, "imagen", None):
-            return format_html('<img src="{}" style="height:60px;border-radius:6px;" />', obj.imagen.url)
+            return format_html('<img src="{}" style="height:60px;border-radius:6px;" />', url_rendicion(obj.imagen, "thumb"))
         return "—"
     preview.short_description = "Vista"
 
@@ -242,12 +292,18 @@ class ProductoAdmin(admin.ModelAdmin):
     )
 
     inlines = [ProductoImagenInline]
+    actions = ["exportar_ndjson"]
+
+    def get_queryset(self, request):
+        # Miniatura de galería en la misma consulta (evita N+1 en el listado)
+        return super().get_queryset(request).con_portada()
 
     # --- Presentación ---
     def precio_final_admin(self, obj):
-        final = obj.precio_final()
+        final = obj.precio_final
         return f"$ {final:,.2f}"
     precio_final_admin.short_description = "Precio final"
+    precio_final_admin.admin_order_field = "precio_final"
 
     def disponible_icono(self, obj):
         color = "#16a34a" if obj.disponible() else "#ef4444"
@@ -259,16 +315,14 @@ class ProductoAdmin(admin.ModelAdmin):
     disponible_icono.short_description = "Disponible"
 
     def miniatura(self, obj):
-        url = getattr(obj, "portada_url", None)
-        url = url() if callable(url) else None
+        url = url_rendicion(obj.portada(), "admin")
         if url:
             return format_html('<img src="{}" style="height:45px;border-radius:6px;" />', url)
         return "—"
     miniatura.short_description = "Imagen"
 
     def preview(self, obj):
-        url = getattr(obj, "portada_url", None)
-        url = url() if callable(url) else None
+        url = url_rendicion(obj.portada(), "zoom") if obj.pk else None
         if url:
             return format_html('<img src="{}" style="max-height:220px;border-radius:10px;" />', url)
         return "Sin imagen"
@@ -280,6 +334,90 @@ class ProductoAdmin(admin.ModelAdmin):
             obj.slug = slugify(obj.nombre)
         super().save_model(request, obj, form, change)
 
+    # --- Acciones ---
+    def exportar_ndjson(self, request, queryset):
+        # Streaming: no carga todo el catálogo en memoria aunque se elijan todos
+        qs = queryset.select_related("categoria", "marca", "estudio", "segmento").order_by("id")
+        return exportar_productos(
+            request, qs, list(CAMPOS_PRODUCTO), "ndjson",
+            nombre_archivo=f"productos-{timezone.now():%Y%m%d-%H%M}.ndjson",
+        )
+    exportar_ndjson.short_description = "Exportar seleccionados (NDJSON)"
+
+    # --- Ajuste masivo (precio / descuento / stock) ---
+    AJUSTE_CACHE_KEY = "catalogo:ajuste:{}"
+
+    def get_urls(self):
+        urls = [
+            path("ajuste-masivo/", self.admin_site.admin_view(self.ajuste_masivo_view),
+                 name="catalogo_producto_ajuste_masivo"),
+        ]
+        return urls + super().get_urls()
+
+    def ajuste_masivo_view(self, request):
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+
+        regla_form = ReglaAjusteForm(prefix="regla")
+        csv_form = CsvAjusteForm(prefix="csv")
+        preview = None
+        modo = request.POST.get("modo")
+        accion = request.POST.get("accion")
+
+        if request.method == "POST" and modo == "regla":
+            regla_form = ReglaAjusteForm(request.POST, prefix="regla")
+            if regla_form.is_valid():
+                d = regla_form.cleaned_data
+                qs = ajustes.productos_regla(**regla_form.filtros())
+                args = (d["campo"], d["operacion"], d["valor"])
+                if accion == "aplicar":
+                    n = ajustes.aplicar_regla(qs, *args)
+                    self.message_user(request, f"{n} producto(s) actualizados con la regla.")
+                    return redirect("admin:catalogo_producto_changelist")
+                total, filas = ajustes.previsualizar_regla(qs, *args)
+                preview = {"modo": "regla", "total": total, "filas": filas, "campo": d["campo"]}
+
+        elif request.method == "POST" and modo == "csv" and accion == "aplicar":
+            key = self.AJUSTE_CACHE_KEY.format(request.POST.get("token", ""))
+            cambios = cache.get(key)
+            if cambios is None:
+                self.message_user(request, "La previsualización expiró; sube el CSV de nuevo.", level="error")
+            else:
+                cache.delete(key)
+                n = ajustes.aplicar_diferencias(cambios)
+                self.message_user(request, f"{n} producto(s) actualizados desde el CSV.")
+                return redirect("admin:catalogo_producto_changelist")
+
+        elif request.method == "POST" and modo == "csv":
+            csv_form = CsvAjusteForm(request.POST, request.FILES, prefix="csv")
+            if csv_form.is_valid():
+                try:
+                    contenido = csv_form.cleaned_data["archivo"].read().decode("utf-8-sig")
+                    filas, errores = ajustes.leer_csv(contenido)
+                except (UnicodeDecodeError, ajustes.AjusteInvalido) as exc:
+                    csv_form.add_error("archivo", str(exc) if isinstance(exc, ajustes.AjusteInvalido)
+                                       else "El archivo debe estar en UTF-8.")
+                else:
+                    cambios, desconocidos = ajustes.diferencias(filas)
+                    token = secrets.token_urlsafe(16)
+                    cache.set(self.AJUSTE_CACHE_KEY.format(token), cambios, 3600)
+                    preview = {
+                        "modo": "csv", "token": token, "total": len(cambios),
+                        "filas": cambios[:ajustes.LIMITE_PREVIEW], "leidas": len(filas),
+                        "errores": errores[:20], "desconocidos": desconocidos[:20],
+                        "num_desconocidos": len(desconocidos),
+                    }
+
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Ajuste masivo de precios y stock",
+            "regla_form": regla_form,
+            "csv_form": csv_form,
+            "preview": preview,
+        }
+        return TemplateResponse(request, "admin/catalogo/producto/ajuste_masivo.html", context)
+
 # NEWSLETTER (Suscriptores)
 @admin.register(NewsletterSubscriber)
 class NewsletterSubscriberAdmin(admin.ModelAdmin):
@@ -305,6 +443,56 @@ class NewsletterSubscriberAdmin(admin.ModelAdmin):
         self.message_user(request, f"{updated} suscriptor(es) marcados como confirmados.")
     mark_confirmed.short_description = "Marcar como confirmados"
 
+
+@admin.register(NewsletterCampaign)
+class NewsletterCampaignAdmin(admin.ModelAdmin):
+    list_display = ("subject", "status", "progreso", "batches", "created_at", "finished_at")
+    list_filter = ("status",)
+    search_fields = ("subject",)
+    readonly_fields = ("status", "progreso", "batches", "last_error", "ultimos_lotes",
+                       "started_at", "finished_at")
+    actions = ["enviar", "pausar"]
+
+    @admin.display(description="Progreso")
+    def progreso(self, obj):
+        return f"{obj.sent_count}/{obj.total}" if obj.total else obj.sent_count
+
+    @admin.display(description="Últimos lotes")
+    def ultimos_lotes(self, obj):
+        return "\n".join(
+            f"#{m['lote']}: {m['enviados']}/{m['destinatarios']} en {m['segundos']}s"
+            for m in obj.metrics[-10:]
+        ) or "—"
+
+    @admin.action(description="Enviar / reanudar (en segundo plano)")
+    def enviar(self, request, queryset):
+        n = 0
+        for campania in queryset.exclude(status__in=("SENDING", "SENT")):
+            # UPDATE condicionado: dos clics seguidos no encolan dos envíos
+            if NewsletterCampaign.objects.filter(pk=campania.pk).exclude(
+                status__in=("SENDING", "SENT")
+            ).update(status="SENDING"):
+                encolar(enviar_campania_tarea, args=[campania.pk])
+                n += 1
+        self.message_user(request, f"{n} campaña(s) en cola de envío.")
+
+    @admin.action(description="Pausar")
+    def pausar(self, request, queryset):
+        n = queryset.filter(status="SENDING").update(status="PAUSED")
+        self.message_user(request, f"{n} campaña(s) pausadas (se detienen al terminar el lote).")
+
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    extra = 0
+    can_delete = False
+    fields = ("producto", "name", "unit_price", "discount", "qty", "created_at")
+    readonly_fields = fields
+    raw_id_fields = ("producto",)
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ("id", "user", "created_at", "total", "status", "items_count")
@@ -318,12 +506,22 @@ class OrderAdmin(admin.ModelAdmin):
         ("Contenido (snapshot JSON)", {"fields": ("items_pretty",)}),
     )
 
+    inlines = [OrderItemInline]
+
+    def get_queryset(self, request):
+        # Suma de cantidades en la misma consulta del listado
+        return super().get_queryset(request).annotate(num_items=Sum("order_items__qty"))
+
     def items_count(self, obj):
+        if obj.num_items is not None:
+            return obj.num_items
+        # Pedido aún sin líneas (antes del backfill): se lee el JSON
         try:
             return sum(int(i.get("qty", 1)) for i in (obj.items or []))
         except Exception:
             return 0
     items_count.short_description = "Artículos"
+    items_count.admin_order_field = "num_items"
 
     def items_pretty(self, obj):
         import json
@@ -335,3 +533,27 @@ class OrderAdmin(admin.ModelAdmin):
 
 
 
+
+
+# CARRITOS
+class CartLineInline(admin.TabularInline):
+    model = CartLine
+    extra = 0
+    raw_id_fields = ("producto",)
+    readonly_fields = ("unit_price",)
+
+
+@admin.register(Cart)
+class CartAdmin(admin.ModelAdmin):
+    list_display = ("id", "user", "item_count", "subtotal", "updated_at")
+    list_filter = (("user", admin.EmptyFieldListFilter), "updated_at")
+    search_fields = ("user__username", "user__email")
+    raw_id_fields = ("user",)
+    readonly_fields = ("item_count", "subtotal", "created_at", "updated_at")
+    inlines = [CartLineInline]
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Las líneas editadas a mano no pasan por catalogo.carrito
+        from .carrito import recalcular
+        recalcular(form.instance)
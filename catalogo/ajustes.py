@@ -0,0 +1,205 @@
+# catalogo/ajustes.py
+"""
+Ajustes masivos de precio, descuento y stock.
+
+Dos entradas:
+  - Reglas: "descuento = 10 para marca X en categoría Y", "precio +5 %",
+    "stock +20"... Se ejecutan como un único UPDATE ... WHERE con la
+    expresión calculada en la base de datos.
+  - CSV de diferencias (slug + columnas a cambiar): se compara contra los
+    valores actuales y solo se escriben las filas que cambian, con
+    UPDATE ... CASE por lotes (bulk_update).
+
+Todo corre dentro de una transacción; el versionado del catálogo junta
+los avisos y los caches se invalidan una vez al confirmar.
+"""
+import csv
+import io
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import DecimalField, F, IntegerField, Value
+from django.db.models.functions import Greatest, Least, Round
+
+from .models import Producto
+
+CAMPOS = ("precio", "descuento", "stock")
+OPERACIONES = {
+    "precio": ("porcentaje", "sumar", "fijar"),
+    "descuento": ("fijar", "sumar"),
+    "stock": ("fijar", "sumar"),
+}
+LIMITE_PREVIEW = 50
+LOTE_CSV = 1000
+
+
+class AjusteInvalido(ValueError):
+    pass
+
+
+# =======================
+# REGLAS
+# =======================
+def productos_regla(categoria=None, marca=None, estudio=None, segmento=None,
+                    tematica=None, solo_activos=False):
+    """Productos a los que aplica una regla (cualquier filtro puede faltar)."""
+    qs = Producto.objects.all()
+    for campo, valor in (("categoria", categoria), ("marca", marca),
+                         ("estudio", estudio), ("segmento", segmento)):
+        if valor is not None:
+            qs = qs.filter(**{campo: valor})
+    if tematica is not None:
+        # Subconsulta sobre la tabla intermedia: sin JOIN ni DISTINCT
+        Through = Producto.tematicas.through
+        qs = qs.filter(pk__in=Through.objects.filter(tematica=tematica).values("producto_id"))
+    if solo_activos:
+        qs = qs.filter(activo=True)
+    return qs
+
+
+def validar_regla(campo, operacion, valor):
+    if campo not in OPERACIONES or operacion not in OPERACIONES[campo]:
+        raise AjusteInvalido(f"Operación «{operacion}» no válida para {campo}.")
+    # NaN / Infinity pasan por Decimal() pero revientan al comparar o redondear
+    if not Decimal(valor).is_finite():
+        raise AjusteInvalido(f"{campo} debe ser un número finito.")
+    if operacion == "fijar":
+        if valor < 0:
+            raise AjusteInvalido(f"{campo} no puede ser negativo.")
+        if campo == "descuento" and valor > 100:
+            raise AjusteInvalido("El descuento va de 0 a 100.")
+    if campo == "stock" and valor != int(valor):
+        raise AjusteInvalido("El stock debe ser un número entero.")
+    if operacion == "porcentaje" and valor <= -100:
+        raise AjusteInvalido("Un porcentaje de -100 o menos deja el precio en cero.")
+
+
+def expresion(campo, operacion, valor):
+    """Expresión SQL del nuevo valor; los resultados quedan en rango."""
+    validar_regla(campo, operacion, valor)
+    if campo == "stock":
+        valor = int(valor)
+        if operacion == "fijar":
+            return Value(valor, output_field=IntegerField())
+        # Se acota antes de sumar: stock es UNSIGNED en MySQL y `stock - n`
+        # con n > stock da "out of range" en vez de quedar en 0
+        return Greatest(F("stock"), Value(-valor), output_field=IntegerField()) + Value(valor)
+
+    salida = DecimalField(max_digits=10, decimal_places=2)
+    valor = Decimal(valor)
+    if operacion == "fijar":
+        return Value(valor, output_field=salida)
+    if operacion == "porcentaje":
+        nuevo = F(campo) * Value(Decimal("1") + valor / Decimal("100"), output_field=salida)
+    else:
+        nuevo = F(campo) + Value(valor, output_field=salida)
+    nuevo = Greatest(Round(nuevo, 2, output_field=salida), Value(Decimal("0")), output_field=salida)
+    if campo == "descuento":
+        nuevo = Least(nuevo, Value(Decimal("100")), output_field=salida)
+    return nuevo
+
+
+def previsualizar_regla(qs, campo, operacion, valor, limite=LIMITE_PREVIEW):
+    """(total afectado, primeras filas con valor actual y nuevo)."""
+    filas = list(
+        qs.annotate(nuevo=expresion(campo, operacion, valor))
+        .order_by("nombre", "pk")
+        .values("pk", "slug", "nombre", campo, "nuevo")[:limite]
+    )
+    for fila in filas:
+        fila["actual"] = fila.pop(campo)
+    return qs.count(), filas
+
+
+def aplicar_regla(qs, campo, operacion, valor):
+    """Un solo UPDATE ... WHERE. Devuelve cuántas filas cambiaron."""
+    with transaction.atomic():
+        return qs.update(**{campo: expresion(campo, operacion, valor)})
+
+
+# =======================
+# CSV DE DIFERENCIAS
+# =======================
+def _valor_csv(campo, texto):
+    texto = (texto or "").strip()
+    if not texto:
+        return None  # celda vacía = no tocar
+    try:
+        if campo == "stock":
+            valor = int(texto)
+        else:
+            valor = Decimal(texto)
+            if not valor.is_finite():
+                raise AjusteInvalido(f"{campo} inválido: {texto!r}")
+            valor = valor.quantize(Decimal("0.01"))
+    except (ValueError, InvalidOperation):
+        raise AjusteInvalido(f"{campo} inválido: {texto!r}")
+    validar_regla(campo, "fijar", valor)
+    return valor
+
+
+def leer_csv(contenido):
+    """
+    Lee un CSV con columna `slug` y alguna de precio/descuento/stock.
+    Devuelve ({slug: {campo: valor}}, [errores]).
+    """
+    lector = csv.DictReader(io.StringIO(contenido))
+    columnas = [c for c in CAMPOS if c in (lector.fieldnames or [])]
+    if "slug" not in (lector.fieldnames or []) or not columnas:
+        raise AjusteInvalido("El CSV necesita la columna slug y al menos precio, descuento o stock.")
+
+    filas, errores = {}, []
+    for n, fila in enumerate(lector, start=2):
+        slug = (fila.get("slug") or "").strip()
+        if not slug:
+            continue
+        try:
+            valores = {c: _valor_csv(c, fila.get(c)) for c in columnas}
+        except AjusteInvalido as exc:
+            errores.append(f"línea {n}: {exc}")
+            continue
+        valores = {c: v for c, v in valores.items() if v is not None}
+        if valores:
+            filas[slug] = valores
+    return filas, errores
+
+
+def diferencias(filas):
+    """
+    Compara el CSV con la base de datos. Devuelve (cambios, slugs
+    desconocidos); cada cambio es {pk, slug, nombre, campos: {campo: (antes, después)}}.
+    """
+    cambios = []
+    slugs = list(filas)
+    encontrados = set()
+    for i in range(0, len(slugs), LOTE_CSV):
+        lote = slugs[i:i + LOTE_CSV]
+        for p in Producto.objects.filter(slug__in=lote).values("pk", "slug", "nombre", *CAMPOS):
+            encontrados.add(p["slug"])
+            campos = {
+                c: (p[c], v) for c, v in filas[p["slug"]].items() if p[c] != v
+            }
+            if campos:
+                cambios.append({"pk": p["pk"], "slug": p["slug"],
+                                "nombre": p["nombre"], "campos": campos})
+    return cambios, [s for s in slugs if s not in encontrados]
+
+
+def aplicar_diferencias(cambios):
+    """
+    Escribe los cambios agrupados por columnas: UPDATE ... SET campo = CASE
+    id WHEN ... END WHERE id IN (...) por lote. Devuelve cuántos productos.
+    """
+    grupos = {}
+    for cambio in cambios:
+        grupos.setdefault(tuple(sorted(cambio["campos"])), []).append(cambio)
+
+    with transaction.atomic():
+        for columnas, lote in grupos.items():
+            Producto.objects.bulk_update(
+                [Producto(pk=c["pk"], **{k: nuevo for k, (_antes, nuevo) in c["campos"].items()})
+                 for c in lote],
+                list(columnas),
+                batch_size=LOTE_CSV,
+            )
+    return len(cambios)
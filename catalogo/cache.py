@@ -0,0 +1,204 @@
+# catalogo/cache.py
+"""
+Versionado del catálogo para invalidar caches.
+
+Cada modelo del catálogo tiene una "etiqueta" (producto, marca, tematica,
+categoria, segmento) con un contador de versión guardado en el cache de
+Django. Cuando algo cambia se sube la versión de su etiqueta y la global
+"catalogo"; cualquier entrada que incluya la versión en su llave queda
+obsoleta sin tener que borrarla.
+
+Las versiones son milisegundos de época (siempre crecientes), así que
+también sirven como fecha de última modificación.
+"""
+import hashlib
+import math
+import random
+import time
+from functools import lru_cache, wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+CATALOGO = "catalogo"
+VERSION_KEY = "catalogo:version:{}"
+
+
+def _ahora_ms():
+    return int(time.time() * 1000)
+
+
+def get_version(tag=CATALOGO):
+    """Versión actual de una etiqueta (la crea si el cache no la tiene)."""
+    key = VERSION_KEY.format(tag)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _ahora_ms(), None)
+        version = cache.get(key) or _ahora_ms()
+    return version
+
+
+def get_versiones(tags):
+    """Versiones de varias etiquetas con un solo viaje al cache."""
+    keys = {tag: VERSION_KEY.format(tag) for tag in tags}
+    guardadas = cache.get_many(keys.values())
+    return tuple(
+        guardadas[key] if key in guardadas else get_version(tag)
+        for tag, key in keys.items()
+    )
+
+
+def _bump(tags):
+    for tag in tags:
+        key = VERSION_KEY.format(tag)
+        nueva = max(_ahora_ms(), (cache.get(key) or 0) + 1)
+        cache.set(key, nueva, None)
+
+
+def _pendientes(conn):
+    """Etiquetas por subir al próximo commit de `conn` (atributo propio)."""
+    if not hasattr(conn, "catalogo_bump_pendiente"):
+        conn.catalogo_bump_pendiente = set()
+    return conn.catalogo_bump_pendiente
+
+
+def _bump_pendientes(conn):
+    """Callback on_commit: sube lo acumulado; los siguientes ya no encuentran nada."""
+    tags = _pendientes(conn)
+    if tags:
+        conn.catalogo_bump_pendiente = set()
+        _bump(tags)
+
+
+def bump_version(*tags):
+    """
+    Sube la versión de las etiquetas indicadas (y siempre la global).
+    Si hay una transacción abierta espera al commit, para que nadie
+    reconstruya un cache con datos que todavía no son visibles.
+
+    Dentro de una misma transacción los avisos se acumulan en la
+    conexión y el primer callback que corre los sube todos juntos: un
+    lote de mil UPDATE invalida una vez, no mil. Cada aviso registra su
+    propio callback (son no-ops si ya se subió), así un rollback de un
+    savepoint no deja etiquetas sin nadie que las suba; lo que quede de
+    una transacción revertida sale con el commit siguiente (invalidar de
+    más no rompe nada).
+    """
+    conn = transaction.get_connection()
+    _pendientes(conn).update(tags, {CATALOGO})
+    transaction.on_commit(lambda: _bump_pendientes(conn))
+
+
+# =======================
+# CONSULTAS CACHEADAS
+# =======================
+QUERY_CACHE_KEY = "catalogo:q:{}:{}"
+ESPERA_LOCK = 2.0  # segundos que se espera a otro proceso antes de calcular igual
+
+
+def _query_timeout():
+    return getattr(settings, "CATALOGO_QUERY_CACHE_TIMEOUT", 600)
+
+
+def _vencida(entrada, beta):
+    """
+    Expiración anticipada probabilística (XFetch): cuanto más cerca del
+    vencimiento y más caro el cálculo, más probable que ESTA petición lo
+    rehaga mientras las demás siguen usando el valor guardado.
+    """
+    azar = random.random() or 1e-12
+    return time.time() - entrada["delta"] * beta * math.log(azar) >= entrada["expira"]
+
+
+def _calcular(key, fn, timeout):
+    inicio = time.monotonic()
+    valor = fn()
+    delta = time.monotonic() - inicio
+    cache.set(key, {"valor": valor, "delta": delta, "expira": time.time() + timeout}, timeout)
+    return valor
+
+
+def _consultar(nombre, fn, tags, timeout, beta):
+    timeout = timeout or _query_timeout()
+    versiones = ".".join(str(v) for v in get_versiones(tags))
+    key = QUERY_CACHE_KEY.format(nombre, hashlib.md5(versiones.encode()).hexdigest())
+    lock = key + ":lock"
+
+    entrada = cache.get(key)
+    if entrada is not None and not _vencida(entrada, beta):
+        return entrada["valor"]
+
+    # Solo un proceso recalcula; el resto sirve lo viejo o espera un poco
+    if cache.add(lock, 1, 30):
+        try:
+            return _calcular(key, fn, timeout)
+        finally:
+            cache.delete(lock)
+    if entrada is not None:
+        return entrada["valor"]
+
+    limite = time.monotonic() + ESPERA_LOCK
+    while time.monotonic() < limite:
+        time.sleep(0.05)
+        entrada = cache.get(key)
+        if entrada is not None:
+            return entrada["valor"]
+    return _calcular(key, fn, timeout)
+
+
+def cached_query(nombre, fn=None, tags=(), timeout=None, beta=1.0):
+    """
+    Cache-aside compartido entre procesos para resultados de consultas.
+
+    La llave incluye la versión de `tags` (más la global del catálogo), así
+    que los signals que ya suben versiones invalidan el resultado. Contra
+    la estampida: un lock en el cache para el primer cálculo y expiración
+    anticipada probabilística para los siguientes.
+
+        marcas = cached_query("marcas", lambda: list(Marca.objects...), tags=("marca",))
+
+        @cached_query("populares", tags=("producto",))
+        def populares(n): ...     # los argumentos (valores simples) van en la llave
+
+    El resultado debe poder picklearse: materializar los querysets en listas.
+    """
+    tags = tuple(sorted(set(tags) | {CATALOGO}))
+    if fn is not None:
+        return _consultar(nombre, fn, tags, timeout, beta)
+
+    def decorator(func):
+        @wraps(func)
+        def _wrapped(*args, **kwargs):
+            sufijo = hashlib.md5(repr((args, sorted(kwargs.items()))).encode()).hexdigest()
+            return _consultar(
+                f"{nombre}:{sufijo}", lambda: func(*args, **kwargs), tags, timeout, beta
+            )
+        return _wrapped
+
+    return decorator
+
+
+# =======================
+# MENÚ (cache local + compartido)
+# =======================
+def _menu_timeout():
+    # Red de seguridad: el menú nunca vive más que esto aunque nadie lo invalide.
+    return getattr(settings, "CATALOGO_MENU_CACHE_TIMEOUT", 300)
+
+
+@lru_cache(maxsize=4)
+def _menu_local(version, ventana):
+    from .context_processors import construir_menu
+
+    return cached_query("menu", construir_menu, timeout=_menu_timeout())
+
+
+def menu_catalogo():
+    """
+    Datos del menú para la versión vigente del catálogo.
+    Primero busca en el LRU del proceso, luego en el cache compartido y
+    solo si no está en ninguno lo arma con consultas.
+    """
+    ventana = int(time.time() // max(_menu_timeout(), 1))
+    return _menu_local(get_version(), ventana)
@@ -0,0 +1,143 @@
+# catalogo/campanias.py
+"""
+Envío de campañas de newsletter por lotes.
+
+Los suscriptores confirmados se leen por id ascendente en lotes de
+NEWSLETTER_LOTE (una consulta por lote). Cada lote abre UNA conexión con
+el backend real (get_connection) y manda todos sus mensajes con
+send_messages(). Tras cada
+lote se guarda el checkpoint (último id enviado) y sus métricas; si el
+envío se corta o se pausa, el siguiente arranque sigue desde ahí.
+
+El ritmo se limita a NEWSLETTER_TASA mensajes por segundo (0 = sin
+límite). Si un lote falla, la campaña queda pausada con el error y ese
+lote se repite al reanudar (entrega "al menos una vez").
+"""
+import time
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import F
+from django.utils import timezone
+
+from .models import NewsletterCampaign, NewsletterSubscriber
+
+MAX_METRICAS = 500  # lotes guardados en NewsletterCampaign.metrics
+
+
+def _backend():
+    # El EMAIL_BACKEND del sitio encola; las campañas ya van en lotes y usan el real
+    return (
+        getattr(settings, "NEWSLETTER_EMAIL_BACKEND", None)
+        or getattr(settings, "TAREAS_EMAIL_BACKEND", None)
+        or settings.EMAIL_BACKEND
+    )
+
+
+def destinatarios(campania):
+    """Suscriptores confirmados que faltan, por id ascendente."""
+    return (
+        NewsletterSubscriber.objects
+        .filter(is_confirmed=True, pk__gt=campania.last_subscriber_id)
+        .order_by("pk")
+    )
+
+
+def _lotes(campania, tam):
+    """
+    Lotes de (id, email) por keyset (id > último enviado): cada lote es su
+    propia consulta, así no queda un cursor abierto durante las pausas del
+    límite de ritmo (en SQLite bloquearía las escrituras de otros hilos).
+    """
+    while True:
+        lote = list(
+            destinatarios(campania).values_list("pk", "email")[:tam].iterator(chunk_size=tam)
+        )
+        if not lote:
+            return
+        yield lote
+
+
+def _mensaje(campania, email):
+    mensaje = EmailMultiAlternatives(campania.subject, campania.body_text, None, [email])
+    if campania.body_html:
+        mensaje.attach_alternative(campania.body_html, "text/html")
+    return mensaje
+
+
+def enviar_campania(campania, lote=None, tasa=None, backend=None,
+                    max_segundos=None, al_terminar_lote=None):
+    """
+    Envía (o reanuda) la campaña. Se detiene al terminar, si alguien la
+    pausa, si falla un lote o si pasan `max_segundos`. Devuelve la campaña
+    actualizada.
+    """
+    lote = lote or getattr(settings, "NEWSLETTER_LOTE", 200)
+    tasa = getattr(settings, "NEWSLETTER_TASA", 0) if tasa is None else tasa
+    backend = backend or _backend()
+
+    if campania.status == "SENT":
+        return campania
+    if campania.started_at is None:
+        campania.started_at = timezone.now()
+        campania.total = destinatarios(campania).count()
+    campania.status = "SENDING"
+    campania.last_error = ""
+    campania.save(update_fields=["status", "started_at", "total", "last_error"])
+
+    inicio = time.monotonic()
+    enviados_ahora = 0
+    for filas in _lotes(campania, lote):
+        # Pausa desde el admin (otro proceso): se respeta entre lotes
+        if NewsletterCampaign.objects.filter(pk=campania.pk, status="PAUSED").exists():
+            campania.refresh_from_db()
+            return campania
+
+        t0 = time.monotonic()
+        try:
+            with get_connection(backend) as conexion:
+                enviados = conexion.send_messages([_mensaje(campania, e) for _pk, e in filas]) or 0
+        except Exception as exc:
+            NewsletterCampaign.objects.filter(pk=campania.pk).update(
+                status="PAUSED", last_error=f"Lote tras id {campania.last_subscriber_id}: {exc}"
+            )
+            campania.refresh_from_db()
+            return campania
+        segundos = time.monotonic() - t0
+
+        metrica = {
+            "lote": campania.batches + 1,
+            "destinatarios": len(filas),
+            "enviados": enviados,
+            "hasta_id": filas[-1][0],
+            "segundos": round(segundos, 3),
+            "por_segundo": round(enviados / segundos, 1) if segundos else None,
+        }
+        campania.last_subscriber_id = filas[-1][0]
+        campania.batches += 1
+        campania.metrics = (campania.metrics + [metrica])[-MAX_METRICAS:]
+        NewsletterCampaign.objects.filter(pk=campania.pk).update(
+            last_subscriber_id=campania.last_subscriber_id,
+            sent_count=F("sent_count") + enviados,
+            batches=campania.batches,
+            metrics=campania.metrics,
+        )
+        campania.sent_count += enviados
+        enviados_ahora += enviados
+        if al_terminar_lote:
+            al_terminar_lote(campania, metrica)
+
+        if max_segundos and time.monotonic() - inicio >= max_segundos:
+            return campania
+
+        # Límite de ritmo: no adelantarse a `tasa` mensajes/segundo
+        if tasa:
+            adelanto = inicio + enviados_ahora / tasa - time.monotonic()
+            if adelanto > 0:
+                time.sleep(adelanto)
+
+    NewsletterCampaign.objects.filter(pk=campania.pk).update(
+        status="SENT", finished_at=timezone.now()
+    )
+    campania.refresh_from_db()
+    return campania
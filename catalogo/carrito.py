@@ -0,0 +1,213 @@
+# catalogo/carrito.py
+"""
+Carrito guardado en la base de datos.
+
+Cada cambio toca solo su línea (CartLine) y los contadores del carrito
+(item_count, subtotal) con un UPDATE ... SET x = x + delta; la sesión ya
+no se reescribe al agregar o quitar. Un visitante guarda en su sesión
+solo el id de su carrito (una vez); al iniciar sesión ese carrito se
+funde con el del usuario.
+
+Las funciones que modifican reciben el carrito y bloquean su fila
+(SELECT ... FOR UPDATE) para que dos pestañas no se pisen los contadores.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+from django.utils import timezone
+
+from .models import Cart, CartLine, Producto
+
+SESSION_KEY = "carrito_id"
+LEGACY_SESSION_KEY = "cart"  # {str(id): qty} de antes
+CENTAVOS = Decimal("0.01")
+
+
+# =======================
+# OBTENER
+# =======================
+def obtener_carrito(request, crear=False):
+    """
+    Carrito del usuario (o del visitante). Sin `crear` devuelve None si
+    no hay; así el badge de un visitante nuevo no escribe nada.
+    Se memoriza en el request.
+    """
+    carrito = getattr(request, "_carrito", None)
+    if carrito is not None:
+        return carrito
+
+    session = request.session
+    legacy = session.get(LEGACY_SESSION_KEY)
+    if request.user.is_authenticated:
+        carrito = Cart.objects.filter(user=request.user).first()
+        if carrito is None and (crear or legacy):
+            carrito, _ = Cart.objects.get_or_create(user=request.user)
+    else:
+        carrito_id = session.get(SESSION_KEY)
+        if carrito_id:
+            carrito = Cart.objects.filter(pk=carrito_id, user__isnull=True).first()
+        if carrito is None and (crear or legacy):
+            carrito = Cart.objects.create()
+            session[SESSION_KEY] = carrito.pk
+
+    if carrito is not None and legacy:
+        # Carrito de sesión del formato anterior: se migra una sola vez
+        for pid, qty in legacy.items():
+            try:
+                agregar(carrito, int(pid), int(qty))
+            except (TypeError, ValueError, Producto.DoesNotExist):
+                continue
+        session.pop(LEGACY_SESSION_KEY, None)
+        carrito.refresh_from_db()
+
+    request._carrito = carrito
+    return carrito
+
+
+def como_dict(carrito):
+    """{str(id): qty} como lo espera catalogo.checkout."""
+    if carrito is None:
+        return {}
+    return {str(pid): qty for pid, qty in carrito.lineas.values_list("producto_id", "qty")}
+
+
+# =======================
+# MODIFICAR (O(1) por línea)
+# =======================
+def _mover_contadores(carrito, delta_qty, delta_dinero):
+    if delta_qty or delta_dinero:
+        Cart.objects.filter(pk=carrito.pk).update(
+            item_count=F("item_count") + delta_qty,
+            subtotal=F("subtotal") + delta_dinero,
+            updated_at=timezone.now(),
+        )
+    carrito.item_count += delta_qty
+    carrito.subtotal += delta_dinero
+
+
+def _fijar(carrito, producto, qty):
+    """Deja la línea de `producto` en `qty` (0 = borrarla). Dentro de atomic."""
+    linea = CartLine.objects.filter(cart=carrito, producto=producto).first()
+    antes_qty = linea.qty if linea else 0
+    antes_dinero = linea.qty * linea.unit_price if linea else Decimal("0")
+
+    if qty <= 0:
+        if linea:
+            linea.delete()
+        _mover_contadores(carrito, -antes_qty, -antes_dinero)
+        return 0
+
+    precio = producto.precio_final.quantize(CENTAVOS)
+    if linea:
+        linea.qty, linea.unit_price = qty, precio
+        linea.save(update_fields=["qty", "unit_price"])
+    else:
+        CartLine.objects.create(cart=carrito, producto=producto, qty=qty, unit_price=precio)
+    _mover_contadores(carrito, qty - antes_qty, qty * precio - antes_dinero)
+    return qty
+
+
+def _bloquear(carrito):
+    Cart.objects.select_for_update().filter(pk=carrito.pk).exists()
+
+
+def agregar(carrito, producto, qty=1):
+    """Suma `qty` (tope: el stock). Devuelve la cantidad final de la línea."""
+    if not isinstance(producto, Producto):
+        producto = Producto.objects.get(pk=producto, activo=True)
+    with transaction.atomic():
+        _bloquear(carrito)
+        actual = (CartLine.objects.filter(cart=carrito, producto=producto)
+                  .values_list("qty", flat=True).first() or 0)
+        # Tope orientativo: la reserva real (con bloqueo) se hace en el checkout
+        return _fijar(carrito, producto, min(actual + qty, producto.stock))
+
+
+def quitar(carrito, producto_id, todo=False):
+    """Resta una unidad (o toda la línea)."""
+    with transaction.atomic():
+        _bloquear(carrito)
+        linea = (CartLine.objects.select_related("producto")
+                 .filter(cart=carrito, producto_id=producto_id).first())
+        if linea is None:
+            return 0
+        return _fijar(carrito, linea.producto, 0 if todo else linea.qty - 1)
+
+
+def vaciar(carrito):
+    with transaction.atomic():
+        _bloquear(carrito)
+        carrito.lineas.all().delete()
+        Cart.objects.filter(pk=carrito.pk).update(
+            item_count=0, subtotal=Decimal("0"), updated_at=timezone.now()
+        )
+    carrito.item_count, carrito.subtotal = 0, Decimal("0")
+
+
+def ajustar(carrito, error):
+    """Deja solo lo que sí hay, según un StockInsuficiente del checkout."""
+    with transaction.atomic():
+        _bloquear(carrito)
+        for producto, pid, _pedida, disponible in error.faltantes:
+            if producto is None:  # ya no existe: solo se quita la línea
+                producto = Producto(pk=pid)
+                disponible = 0
+            _fijar(carrito, producto, max(disponible, 0))
+
+
+def recalcular(carrito):
+    """Rehace los contadores desde las líneas (tras fusionar, o si se desfasan)."""
+    totales = carrito.lineas.aggregate(
+        piezas=Sum("qty"),
+        dinero=Sum(ExpressionWrapper(F("qty") * F("unit_price"),
+                                     output_field=DecimalField(max_digits=12, decimal_places=2))),
+    )
+    carrito.item_count = totales["piezas"] or 0
+    carrito.subtotal = (totales["dinero"] or Decimal("0")).quantize(CENTAVOS)
+    Cart.objects.filter(pk=carrito.pk).update(
+        item_count=carrito.item_count, subtotal=carrito.subtotal, updated_at=timezone.now()
+    )
+
+
+# =======================
+# LOGIN / LIMPIEZA
+# =======================
+def fusionar_al_login(request, user):
+    """Pasa el carrito de invitado de esta sesión al carrito del usuario."""
+    carrito_id = request.session.pop(SESSION_KEY, None)
+    invitado = Cart.objects.filter(pk=carrito_id, user__isnull=True).first() if carrito_id else None
+    if invitado is None:
+        return None
+
+    with transaction.atomic():
+        carrito = Cart.objects.filter(user=user).first()
+        if carrito is None or not carrito.lineas.exists():
+            # Caso común: el carrito del invitado pasa entero al usuario
+            if carrito is not None:
+                carrito.delete()
+            Cart.objects.filter(pk=invitado.pk).update(user=user)
+            invitado.user = user
+            return invitado
+
+        _bloquear(carrito)
+        existentes = {l.producto_id: l for l in carrito.lineas.all()}
+        for linea in invitado.lineas.select_related("producto"):
+            previa = existentes.get(linea.producto_id)
+            if previa:
+                previa.qty = min(previa.qty + linea.qty, max(linea.producto.stock, previa.qty))
+                previa.save(update_fields=["qty"])
+            else:
+                linea.cart = carrito
+                linea.save(update_fields=["cart"])
+        invitado.delete()
+        recalcular(carrito)
+    return carrito
+
+
+def purgar_invitados(dias=30):
+    """Borra carritos de invitados sin cambios en `dias` días."""
+    limite = timezone.now() - timedelta(days=dias)
+    borrados, _ = Cart.objects.filter(user__isnull=True, updated_at__lt=limite).delete()
+    return borrados
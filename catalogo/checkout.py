@@ -0,0 +1,131 @@
+# catalogo/checkout.py
+"""
+Checkout con reserva de stock.
+
+Todo ocurre en una transacción: se bloquean las filas de los productos del
+carrito (SELECT ... FOR UPDATE, siempre en orden de id para no provocar
+deadlocks), se valida el stock contra esas filas ya bloqueadas y se descuenta
+con un único UPDATE para todas las líneas. Dos compras simultáneas del
+último artículo no pueden pasar las dos: la segunda espera el bloqueo y ve
+el stock ya descontado.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .models import Order, OrderItem, Producto
+
+
+class StockInsuficiente(Exception):
+    """Alguna línea del carrito pide más de lo que hay."""
+
+    def __init__(self, faltantes):
+        # faltantes: lista de (producto o None, id, cantidad pedida, disponible)
+        self.faltantes = faltantes
+        super().__init__(self.mensaje())
+
+    def mensaje(self):
+        partes = []
+        for producto, pid, pedida, disponible in self.faltantes:
+            nombre = producto.nombre if producto else f"producto #{pid}"
+            if disponible <= 0:
+                partes.append(f"{nombre} (agotado)")
+            else:
+                partes.append(f"{nombre} (pediste {pedida}, quedan {disponible})")
+        return "Sin stock suficiente para: " + ", ".join(partes)
+
+
+def _limpiar_carrito(cart):
+    """{str(id): qty} -> {int(id): qty} solo con cantidades positivas."""
+    lineas = {}
+    for pid, qty in (cart or {}).items():
+        try:
+            pid, qty = int(pid), int(qty)
+        except (TypeError, ValueError):
+            continue
+        if qty > 0:
+            lineas[pid] = qty
+    return lineas
+
+
+def reservar_stock(lineas):
+    """
+    Bloquea, valida y descuenta el stock de {producto_id: cantidad}.
+    Debe llamarse dentro de transaction.atomic(). Devuelve los productos
+    bloqueados (con el stock ANTES del descuento) o lanza StockInsuficiente
+    sin tocar nada.
+    """
+    ids = sorted(lineas)
+    productos = {
+        p.pk: p
+        for p in Producto.objects.select_for_update().filter(pk__in=ids).order_by("pk")
+    }
+
+    faltantes = []
+    for pid in ids:
+        p = productos.get(pid)
+        disponible = p.stock if (p and p.activo) else 0
+        if lineas[pid] > disponible:
+            faltantes.append((p, pid, lineas[pid], disponible))
+    if faltantes:
+        raise StockInsuficiente(faltantes)
+
+    # Un solo UPDATE para todas las líneas: stock = stock - CASE id WHEN ... END
+    Producto.objects.filter(pk__in=ids).update(
+        stock=F("stock") - Case(
+            *[When(pk=pid, then=Value(qty)) for pid, qty in lineas.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    )
+    return [productos[pid] for pid in ids]
+
+
+def crear_pedido(user, cart):
+    """
+    Convierte el carrito ({str(id): qty}) en un Order pagado (simulado) reservando
+    el stock. Precios y total salen de las filas bloqueadas, no de lo que
+    se vio en el carrito. Devuelve el Order o lanza StockInsuficiente.
+    """
+    lineas = _limpiar_carrito(cart)
+    if not lineas:
+        return None
+
+    with transaction.atomic():
+        productos = reservar_stock(lineas)
+
+        items = []
+        order_items = []
+        total = Decimal("0.00")
+        for p in productos:
+            qty = lineas[p.pk]
+            precio_unit = p.precio_final.quantize(Decimal("0.01"))
+            total += (precio_unit * qty).quantize(Decimal("0.01"))
+            items.append({
+                "id": p.id,
+                "name": p.nombre,
+                "price": float(precio_unit),  # JSON serializable
+                "qty": qty,
+            })
+            order_items.append(OrderItem(
+                producto=p,
+                name=p.nombre,
+                unit_price=precio_unit,
+                discount=p.descuento or 0,
+                qty=qty,
+            ))
+
+        order = Order.objects.create(
+            user=user,
+            total=total.quantize(Decimal("0.01")),
+            items=items,
+            status="PAID",  # simulamos pago aprobado
+        )
+        # Mismas líneas en forma relacional, en un solo INSERT
+        for item in order_items:
+            item.order = order
+            item.created_at = order.created_at
+        OrderItem.objects.bulk_create(order_items)
+        return order
+
@@ -1,8 +1,17 @@
 # catalogo/context_processors.py
 from django.db.models import Count, Q
+from django.utils.functional import SimpleLazyObject
+
+from .cache import menu_catalogo
+from .carrito import obtener_carrito
 from .models import Marca, Categoria, Tematica, Producto, Segmento  # 👈 añade Segmento
 
-def menu_data(request):
+
+def construir_menu():
+    """
+    Arma (con consultas) los datos del menú. Los querysets se materializan
+    en listas para poder guardarlos en cache; ver catalogo.cache.menu_catalogo.
+    """
     # criterio de "disponible"
     disponibles = Q(productos__activo=True, productos__stock__gt=0)
 
@@ -47,17 +56,34 @@ def menu_data(request):
         activo=True, stock__gt=0, descuento__gt=0
     ).count()
 
-    # (Opcional) cantidad total en carrito para badge
-    cart = request.session.get("cart", {})
-    cart_count = sum(int(q) for q in cart.values()) if cart else 0
-
     return {
-        "marcas_menu": marcas,
-        "tematicas_menu": tematicas,
-        "categorias_menu": categorias,
-        "segmentos_menu": segmentos,             # 👈 ahora disponible en templates
-        "menu_destacados_count": destacados_count,
-        "menu_ofertas_count": ofertas_count,
-        "menu_cart_count": cart_count,           # 👈 úsalo en el botón Carrito
+        "marcas": list(marcas),
+        "tematicas": list(tematicas),
+        "categorias": list(categorias),
+        "segmentos": list(segmentos),
+        "destacados_count": destacados_count,
+        "ofertas_count": ofertas_count,
     }
 
+
+def _cart_count(request):
+    # Contador mantenido en la fila del carrito: sin sumar líneas ni leer la sesión entera
+    cart = obtener_carrito(request)
+    return cart.item_count if cart else 0
+
+
+def menu_data(request):
+    # Todo es perezoso: si el template no usa el menú no se toca ni el cache
+    # ni la sesión.
+    menu = SimpleLazyObject(menu_catalogo)
+
+    return {
+        "marcas_menu": SimpleLazyObject(lambda: menu["marcas"]),
+        "tematicas_menu": SimpleLazyObject(lambda: menu["tematicas"]),
+        "categorias_menu": SimpleLazyObject(lambda: menu["categorias"]),
+        "segmentos_menu": SimpleLazyObject(lambda: menu["segmentos"]),  # 👈 ahora disponible en templates
+        "menu_destacados_count": SimpleLazyObject(lambda: menu["destacados_count"]),
+        "menu_ofertas_count": SimpleLazyObject(lambda: menu["ofertas_count"]),
+        # (Opcional) cantidad total en carrito para badge
+        "menu_cart_count": SimpleLazyObject(lambda: _cart_count(request)),  # 👈 úsalo en el botón Carrito
+    }
@@ -0,0 +1,153 @@
+# catalogo/exportar.py
+"""
+Serialización de productos para la API y exportación en streaming.
+
+exportar_productos() recorre el queryset por lotes de pk (keyset: pk > el
+último visto) y va escribiendo NDJSON (una línea por producto) o un
+arreglo JSON, comprimido con gzip al vuelo si el cliente lo acepta. La
+memoria no crece con el tamaño del catálogo: nunca hay más de un lote de
+productos cargado. No se usa .iterator(): con MySQL/PyMySQL no hay cursor
+de servidor y el cliente traería el resultado completo de una vez.
+"""
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+
+
+def _url_absoluta(request, url):
+    try:
+        return request.build_absolute_uri(url) if url else None
+    except ValueError:
+        return None
+
+
+# Campos que puede pedir la app con ?fields=; el default es el de siempre.
+CAMPOS_PRODUCTO = {
+    "id": lambda p, r: p.id,
+    "nombre": lambda p, r: p.nombre,
+    "slug": lambda p, r: p.slug,
+    "precio": lambda p, r: p.precio,
+    "descuento": lambda p, r: p.descuento,
+    "precio_final": lambda p, r: p.precio_final,
+    "stock": lambda p, r: p.stock,
+    "imagen": lambda p, r: _url_absoluta(r, p.portada_url()),
+    "categoria": lambda p, r: p.categoria.slug,
+    "marca": lambda p, r: p.marca.slug if p.marca_id else None,
+    "estudio": lambda p, r: p.estudio.slug if p.estudio_id else None,
+    "segmento": lambda p, r: p.segmento.slug if p.segmento_id else None,
+    "destacado": lambda p, r: p.destacado,
+    "activo": lambda p, r: p.activo,
+    "creado": lambda p, r: p.creado,
+    "modificado": lambda p, r: p.modificado,
+    "url": lambda p, r: r.build_absolute_uri(p.get_absolute_url()),
+}
+CAMPOS_DEFAULT = ("id", "nombre", "precio", "imagen")
+
+
+def serializar_producto(producto, request, campos):
+    return {c: CAMPOS_PRODUCTO[c](producto, request) for c in campos}
+
+
+# =======================
+# STREAMING
+# =======================
+CHUNK_SIZE = 2000          # filas por consulta a la BD
+BUFFER_BYTES = 64 * 1024   # tamaño aproximado de cada trozo enviado
+
+FORMATOS = {
+    "ndjson": "application/x-ndjson; charset=utf-8",
+    "json": "application/json; charset=utf-8",
+}
+
+
+def _por_lotes(qs):
+    """Productos de `qs` en orden de pk, CHUNK_SIZE por consulta."""
+    qs = qs.order_by("pk")
+    ultimo = None
+    while True:
+        lote = list((qs if ultimo is None else qs.filter(pk__gt=ultimo))[:CHUNK_SIZE])
+        yield from lote
+        if len(lote) < CHUNK_SIZE:
+            return
+        ultimo = lote[-1].pk
+
+
+def _lineas(qs, request, campos, formato):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    if formato == "json":
+        yield "["
+    primero = True
+    for p in _por_lotes(qs):
+        fila = encoder.encode(serializar_producto(p, request, campos))
+        if formato == "json":
+            yield fila if primero else "," + fila
+        else:
+            yield fila + "\n"
+        primero = False
+    if formato == "json":
+        yield "]"
+
+
+def _agrupar(partes, comprimir):
+    """Junta las líneas en trozos de ~64 KB y, si toca, los comprime con gzip."""
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31) if comprimir else None  # 31 = cabecera gzip
+    buffer = []
+    tam = 0
+    for parte in partes:
+        datos = parte.encode("utf-8")
+        buffer.append(datos)
+        tam += len(datos)
+        if tam >= BUFFER_BYTES:
+            bloque = b"".join(buffer)
+            buffer, tam = [], 0
+            bloque = gz.compress(bloque) if gz else bloque
+            if bloque:
+                yield bloque
+    bloque = b"".join(buffer)
+    if gz:
+        bloque = gz.compress(bloque) + gz.flush()
+    if bloque:
+        yield bloque
+
+
+def acepta_gzip(accept_encoding):
+    """
+    ¿El Accept-Encoding admite gzip? Respeta los q-values: "gzip;q=0" es
+    un rechazo explícito y "*" vale para gzip si no se lo nombra.
+    """
+    pesos = {}
+    for parte in accept_encoding.split(","):
+        nombre, _, params = parte.strip().partition(";")
+        nombre = nombre.strip().lower()
+        if not nombre:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            clave, _, valor = param.strip().partition("=")
+            if clave.strip().lower() == "q":
+                try:
+                    q = float(valor)
+                except ValueError:
+                    q = 0.0
+        pesos[nombre] = q
+    for nombre in ("gzip", "x-gzip", "*"):
+        if nombre in pesos:
+            return pesos[nombre] > 0
+    return False
+
+
+def exportar_productos(request, qs, campos, formato="ndjson", nombre_archivo=None):
+    """StreamingHttpResponse con los productos de `qs` en NDJSON o JSON."""
+    comprimir = acepta_gzip(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+    response = StreamingHttpResponse(
+        _agrupar(_lineas(qs, request, campos, formato), comprimir),
+        content_type=FORMATOS[formato],
+    )
+    if comprimir:
+        response["Content-Encoding"] = "gzip"
+    patch_vary_headers(response, ("Accept-Encoding",))
+    if nombre_archivo:
+        response["Content-Disposition"] = f'attachment; filename="{nombre_archivo}"'
+    return response
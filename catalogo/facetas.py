@@ -0,0 +1,278 @@
+# catalogo/facetas.py
+"""
+Conteos por faceta (marca, estudio, categoría, segmento, temática) en una
+sola pasada y sin consultas por dimensión.
+
+Cada proceso guarda un índice de bits: por cada valor de cada taxonomía,
+un entero de Python cuyo bit N está encendido si el producto de la
+posición N está disponible y tiene ese valor. Las posiciones son densas
+(0..disponibles-1, las que libera una baja se reutilizan), así que el
+ancho de cada entero depende de cuántos productos hay y no de su pk.
+Filtrar es un AND entre enteros y contar es int.bit_count(); para unos
+miles de productos son microsegundos.
+
+El índice se mantiene al día leyendo la bitácora ProductoCambio: solo se
+recargan los productos que cambiaron desde el último token. Si cambia una
+taxonomía (nombre, alta, baja) o pasa CATALOGO_FACETAS_TTL se reconstruye
+entero.
+
+Los conteos son "disyuntivos": los de una dimensión aplican los filtros de
+todas las demás menos el suyo, así cada opción muestra cuántos productos
+quedarían si se eligiera.
+"""
+import copy
+import threading
+import time
+
+from django.conf import settings
+
+from .cache import get_versiones
+from .filtros import ACTIVADO, rango_precio
+from .models import Categoria, Estudio, Marca, Producto, ProductoCambio, Segmento, Tematica
+
+# dimensión -> (campo FK en Producto o None si es M2M, modelo)
+DIMENSIONES = {
+    "marca": ("marca_id", Marca),
+    "estudio": ("estudio_id", Estudio),
+    "categoria": ("categoria_id", Categoria),
+    "segmento": ("segmento_id", Segmento),
+    "tematica": (None, Tematica),
+}
+DIMS_FK = [dim for dim, (campo, _modelo) in DIMENSIONES.items() if campo]
+FKS = [DIMENSIONES[dim][0] for dim in DIMS_FK]
+# ?param= de catalogo.filtros para cada dimensión
+PARAMETROS = {"marca": "marca", "estudio": "estudio", "categoria": "cat",
+              "segmento": "segmento", "tematica": "tematica"}
+TAGS_TAXONOMIA = ("marca", "estudio", "categoria", "segmento", "tematica")
+
+# Con más cambios pendientes que esto sale más barato reconstruir
+MAX_CAMBIOS_INCREMENTAL = 2000
+
+
+def _ttl():
+    return getattr(settings, "CATALOGO_FACETAS_TTL", 600)
+
+
+def bits_de(posiciones):
+    """Bitset (int) con los bits de `posiciones` encendidos."""
+    bits = 0
+    for pos in posiciones:
+        bits |= 1 << pos
+    return bits
+
+
+class IndiceFacetas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.bits = {dim: {} for dim in DIMENSIONES}   # dim -> {valor_id: bitset}
+        self.flags = {"destacados": 0, "ofertas": 0}
+        self.disponibles = 0
+        self.miembros = {}      # producto_id -> (valores por dimensión, flags) para poder quitarlo
+        self.posicion = {}      # producto_id -> bit que ocupa
+        self.libres = []        # posiciones liberadas por bajas, para reutilizar
+        self.precios = {}       # producto_id -> precio_final (para ?precio_min= / ?precio_max=)
+        self.valores = {}       # dim -> [instancias ordenadas por nombre]
+        self.por_clave = {}     # dim -> {slug/nombre en minúsculas: id}
+        self.token = None
+        self.version = None
+        self.construido = 0.0
+
+    # =======================
+    # CARGA
+    # =======================
+    def _leer(self, ids=None):
+        """{producto_id: ({dim: {ids}}, {flags}, precio_final)} de los productos disponibles."""
+        qs = Producto.objects.filter(activo=True, stock__gt=0)
+        if ids is not None:
+            qs = qs.filter(pk__in=ids)
+        filas = {}
+        campos = ("pk", "destacado", "descuento", "precio_final", *FKS)
+        for pk, destacado, descuento, precio_final, *fks in qs.values_list(*campos):
+            dims = {dim: {valor} for dim, valor in zip(DIMS_FK, fks) if valor is not None}
+            dims["tematica"] = set()
+            flags = {"destacados"} if destacado else set()
+            if descuento and descuento > 0:
+                flags.add("ofertas")
+            filas[pk] = (dims, flags, precio_final)
+
+        if filas:
+            tematicas = Producto.tematicas.through.objects.values_list("producto_id", "tematica_id")
+            if ids is not None:
+                tematicas = tematicas.filter(producto_id__in=list(filas))
+            for pk, tematica_id in tematicas:
+                if pk in filas:
+                    filas[pk][0]["tematica"].add(tematica_id)
+        return filas
+
+    def _poner(self, pk, dims, flags, precio_final):
+        pos = self.posicion.get(pk)
+        if pos is None:
+            pos = self.libres.pop() if self.libres else len(self.posicion)
+            self.posicion[pk] = pos
+        bit = 1 << pos
+        self.disponibles |= bit
+        for dim, valores in dims.items():
+            tabla = self.bits[dim]
+            for valor in valores:
+                tabla[valor] = tabla.get(valor, 0) | bit
+        for flag in flags:
+            self.flags[flag] |= bit
+        self.miembros[pk] = (dims, flags)
+        self.precios[pk] = precio_final
+
+    def _quitar(self, pk):
+        anterior = self.miembros.pop(pk, None)
+        if anterior is None:
+            return
+        self.precios.pop(pk, None)
+        pos = self.posicion.pop(pk)
+        self.libres.append(pos)
+        bit = 1 << pos
+        self.disponibles &= ~bit
+        dims, flags = anterior
+        for dim, valores in dims.items():
+            tabla = self.bits[dim]
+            for valor in valores:
+                tabla[valor] = tabla.get(valor, 0) & ~bit
+        for flag in flags:
+            self.flags[flag] &= ~bit
+
+    def _reconstruir(self, version):
+        # El token se toma antes de leer: lo que cambie durante la lectura se reaplica
+        token = ProductoCambio.ultimo_token()
+        self.bits = {dim: {} for dim in DIMENSIONES}
+        self.flags = {flag: 0 for flag in self.flags}
+        self.disponibles = 0
+        self.miembros = {}
+        self.posicion, self.libres = {}, []
+        self.precios = {}
+        for pk, fila in self._leer().items():
+            self._poner(pk, *fila)
+
+        self.valores, self.por_clave = {}, {}
+        for dim, (_campo, modelo) in DIMENSIONES.items():
+            instancias = list(modelo.objects.order_by("nombre"))
+            self.valores[dim] = instancias
+            claves = {}
+            for obj in instancias:
+                claves.setdefault(obj.nombre.lower(), obj.pk)
+                claves[obj.slug.lower()] = obj.pk
+            self.por_clave[dim] = claves
+        self.token, self.version, self.construido = token, version, time.monotonic()
+
+    def _aplicar_cambios(self):
+        # Mismo token que la sincronización de la app: no pasa huecos recientes
+        cambios, token, mas = ProductoCambio.leer(self.token, MAX_CAMBIOS_INCREMENTAL)
+        if mas:
+            return False
+        if not cambios:
+            return True
+        ids = {producto_id for _pk, producto_id in cambios}
+        for pk in ids:
+            self._quitar(pk)
+        for pk, fila in self._leer(ids).items():
+            self._poner(pk, *fila)
+        self.token = token
+        return True
+
+    def _al_dia(self):
+        version = get_versiones(TAGS_TAXONOMIA)
+        vencido = time.monotonic() - self.construido > _ttl()
+        if self.token is None or version != self.version or vencido or not self._aplicar_cambios():
+            self._reconstruir(version)
+
+    # =======================
+    # CONSULTA
+    # =======================
+    def _resolver(self, dim, valor):
+        """Id de un valor de `dim`: el id tal cual, o su slug/nombre (sin mayúsculas)."""
+        if isinstance(valor, int):
+            return valor
+        return self.por_clave[dim].get(str(valor).strip().lower(), -1)
+
+    def _bits_productos(self, ids):
+        """Bitset de los productos `ids` (los no disponibles no tienen posición)."""
+        posicion = self.posicion
+        return bits_de(posicion[pk] for pk in ids if pk in posicion)
+
+    def _rango(self, minimo, maximo):
+        """Bitset de los productos con precio final entre `minimo` y `maximo` (None = sin límite)."""
+        return self._bits_productos(
+            pk for pk, precio in self.precios.items()
+            if (minimo is None or precio >= minimo) and (maximo is None or precio <= maximo)
+        )
+
+    def contar(self, seleccion=None, flags=(), universo=None, dimensiones=None, precio=None):
+        """
+        seleccion: {dim: [ids, slugs o nombres]} (varios en una dimensión = OR;
+        uno que no existe no encuentra nada, igual que el filtro).
+        flags: "destacados" / "ofertas" a exigir.
+        universo: ids de producto opcionales que acotan todo (p. ej. resultados de ?q=).
+        precio: (mínimo, máximo) opcional de precio final; cualquiera puede ser None.
+        Devuelve {"total": n, dim: [instancias con .num_prod], ...}.
+        """
+        seleccion = {dim: ids for dim, ids in (seleccion or {}).items() if ids}
+        dimensiones = dimensiones or list(DIMENSIONES)
+
+        with self._lock:
+            self._al_dia()
+            base = self.disponibles
+            if universo is not None:
+                base &= self._bits_productos(universo)
+            for flag in flags:
+                base &= self.flags[flag]
+            if precio and any(limite is not None for limite in precio):
+                base &= self._rango(*precio)
+
+            # Filtro de cada dimensión (OR de sus valores elegidos)
+            filtros = {}
+            for dim, valores in seleccion.items():
+                bits = 0
+                for valor in valores:
+                    bits |= self.bits[dim].get(self._resolver(dim, valor), 0)
+                filtros[dim] = bits
+
+            todos = base
+            for bits in filtros.values():
+                todos &= bits
+            resultado = {"total": todos.bit_count()}
+
+            for dim in dimensiones:
+                # Todos los filtros menos el de esta dimensión
+                parcial = base
+                for otra, bits in filtros.items():
+                    if otra != dim:
+                        parcial &= bits
+                tabla = self.bits[dim]
+                opciones = []
+                for obj in self.valores[dim]:
+                    n = (tabla.get(obj.pk, 0) & parcial).bit_count()
+                    if n:
+                        obj = copy.copy(obj)
+                        obj.num_prod = n
+                        opciones.append(obj)
+                resultado[dim] = opciones
+        return resultado
+
+
+_indice = IndiceFacetas()
+
+
+def facetas(seleccion=None, flags=(), universo=None, dimensiones=None, precio=None):
+    """Conteos por faceta con el índice de este proceso (ver IndiceFacetas.contar)."""
+    return _indice.contar(seleccion, flags, universo, dimensiones, precio)
+
+
+def facetas_de_filtros(f, ids_busqueda=None, dimensiones=None):
+    """
+    Conteos para los filtros de catalogo.filtros.leer_filtros: slug o
+    nombre de cada dimensión, ?destacados= / ?ofertas=, el rango de precio
+    y los ids de ?q=.
+    """
+    seleccion = {dim: [f[param]] for dim, param in PARAMETROS.items() if f.get(param)}
+    flags = []
+    if f.get("destacados") in ACTIVADO:
+        flags.append("destacados")
+    elif f.get("ofertas") in ACTIVADO:
+        flags.append("ofertas")
+    return facetas(seleccion, flags, ids_busqueda, dimensiones, rango_precio(f))
@@ -0,0 +1,107 @@
+# catalogo/filtros.py
+"""
+Filtros de productos por querystring (?q=&cat=&marca=...), compartidos por
+ProductoLista y la API para que ambos devuelvan lo mismo.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q
+
+from .models import Producto
+from .search import filtro_ids, relevancia
+
+FILTROS = ("q", "cat", "marca", "estudio", "tematica", "segmento", "destacados", "ofertas",
+           "orden", "precio_min", "precio_max")
+ACTIVADO = ("1", "true", "True")
+
+# ?orden= -> campos (sobre Producto.precio_final, con su índice prod_disp_precio)
+ORDENES = {
+    "precio_asc": ("precio_final", "id"),
+    "precio_desc": ("-precio_final", "-id"),
+}
+
+
+def leer_filtros(GET):
+    """Dict con todos los filtros (limpios, "" si no vienen)."""
+    return {k: (GET.get(k) or "").strip() for k in FILTROS}
+
+
+def _precio(valor):
+    """Decimal de ?precio_min= / ?precio_max= o None si no es un número válido."""
+    try:
+        precio = Decimal(valor.replace(",", "."))
+    except (InvalidOperation, AttributeError):
+        return None
+    return precio if precio.is_finite() and precio >= 0 else None
+
+
+def rango_precio(f):
+    """(mínimo, máximo) de precio final pedidos; cada uno None si no aplica."""
+    return _precio(f.get("precio_min") or ""), _precio(f.get("precio_max") or "")
+
+
+def _slug_o_nombre(campo, valor):
+    return Q(**{f"{campo}__slug__iexact": valor}) | Q(**{f"{campo}__nombre__iexact": valor})
+
+
+def filtrar_productos(qs, f):
+    """Aplica los filtros de `f` (ver leer_filtros) a un queryset de productos."""
+    if f["q"]:
+        # Índice de texto completo (nombre, descripción y taxonomías) como
+        # subconsulta: los ids no pasan por Python; ver catalogo.search
+        coinciden = filtro_ids(f["q"])
+        qs = qs.filter(pk__in=coinciden) if coinciden is not None else qs.none()
+
+    if f["cat"]:
+        qs = qs.filter(_slug_o_nombre("categoria", f["cat"]))
+    if f["marca"]:
+        qs = qs.filter(_slug_o_nombre("marca", f["marca"]))
+    if f["estudio"]:
+        qs = qs.filter(_slug_o_nombre("estudio", f["estudio"]))
+    if f["segmento"]:
+        qs = qs.filter(_slug_o_nombre("segmento", f["segmento"]))
+    if f["tematica"]:
+        # Subconsulta sobre la tabla intermedia: sin JOIN M2M ni DISTINCT
+        con_tematica = (Producto.tematicas.through.objects
+                        .filter(_slug_o_nombre("tematica", f["tematica"]))
+                        .values("producto_id"))
+        qs = qs.filter(pk__in=con_tematica)
+
+    if f["destacados"] in ACTIVADO:
+        qs = qs.filter(destacado=True)
+    elif f["ofertas"] in ACTIVADO:
+        qs = qs.filter(descuento__gt=0)
+
+    minimo, maximo = rango_precio(f)
+    if minimo is not None:
+        qs = qs.filter(precio_final__gte=minimo)
+    if maximo is not None:
+        qs = qs.filter(precio_final__lte=maximo)
+    return qs
+
+
+def orden_listado(f):
+    """
+    Campos del orden del listado, con `id` al final para que sea total (lo
+    necesita la paginación por cursor). None si se ordena por relevancia.
+    Un ?orden= explícito manda sobre el orden propio de cada filtro.
+    """
+    if f.get("orden") in ORDENES:
+        return ORDENES[f["orden"]]
+    if f["destacados"] in ACTIVADO:
+        return ("destacado_orden", "-creado", "id")
+    if f["ofertas"] in ACTIVADO:
+        return ("-descuento", "-creado", "id")
+    if f["q"]:
+        return None
+    return ("-creado", "id")
+
+
+def ordenar_productos(qs, f):
+    """Orden del listado: ?orden=, destacados, ofertas, relevancia o más nuevos."""
+    orden = orden_listado(f)
+    if orden is None:
+        # Puntaje del motor calculado en la BD (ver catalogo.search.relevancia)
+        puntaje = relevancia(f["q"], qs.model)
+        return qs.order_by(puntaje.desc(), "-id") if puntaje is not None else qs.order_by("-id")
+    return qs.order_by(*orden)
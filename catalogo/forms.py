@@ -0,0 +1,46 @@
+# catalogo/forms.py
+from django import forms
+
+from .ajustes import AjusteInvalido, validar_regla
+from .models import Categoria, Estudio, Marca, Segmento, Tematica
+
+
+class ReglaAjusteForm(forms.Form):
+    """Regla de ajuste masivo: a qué productos y qué se les hace."""
+    CAMPOS = [("precio", "Precio"), ("descuento", "Descuento (%)"), ("stock", "Stock")]
+    OPERACIONES = [
+        ("porcentaje", "± % sobre el valor actual (solo precio)"),
+        ("sumar", "Sumar / restar"),
+        ("fijar", "Fijar valor"),
+    ]
+
+    categoria = forms.ModelChoiceField(Categoria.objects.all(), required=False, label="Categoría")
+    marca = forms.ModelChoiceField(Marca.objects.all(), required=False)
+    estudio = forms.ModelChoiceField(Estudio.objects.all(), required=False)
+    segmento = forms.ModelChoiceField(Segmento.objects.all(), required=False)
+    tematica = forms.ModelChoiceField(Tematica.objects.all(), required=False, label="Temática")
+    solo_activos = forms.BooleanField(required=False, initial=True, label="Solo productos activos")
+
+    campo = forms.ChoiceField(choices=CAMPOS)
+    operacion = forms.ChoiceField(choices=OPERACIONES, label="Operación")
+    valor = forms.DecimalField(max_digits=10, decimal_places=2)
+
+    def clean(self):
+        data = super().clean()
+        if {"campo", "operacion", "valor"} <= data.keys():
+            try:
+                validar_regla(data["campo"], data["operacion"], data["valor"])
+            except AjusteInvalido as exc:
+                raise forms.ValidationError(str(exc))
+        return data
+
+    def filtros(self):
+        return {k: self.cleaned_data[k] for k in
+                ("categoria", "marca", "estudio", "segmento", "tematica", "solo_activos")}
+
+
+class CsvAjusteForm(forms.Form):
+    archivo = forms.FileField(
+        label="CSV",
+        help_text="Columnas: slug y cualquiera de precio, descuento, stock. Celda vacía = no cambiar.",
+    )
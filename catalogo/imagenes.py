@@ -0,0 +1,243 @@
+# catalogo/imagenes.py
+"""
+Derivadas de imágenes (rendiciones) para no servir los originales.
+
+Cada imagen subida (productos, galería, logos, iconos, avatares) se
+reduce a varios anchos con nombre —admin, thumb, card, zoom— en WebP (y
+AVIF si Pillow lo soporta). Se guardan en el mismo storage bajo
+`derivadas/<rendición>/<ruta original>.<formato>`.
+
+La generación corre en un pool de hilos: se encola al subir la imagen y,
+si una plantilla pide una imagen que aún no tiene derivadas, se encola en
+ese momento y mientras tanto se sirve el original.
+"""
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+# Ancho máximo en px (se conserva la proporción y nunca se amplía)
+RENDICIONES = {
+    "admin": 96,
+    "thumb": 240,
+    "card": 480,
+    "zoom": 1400,
+}
+PREFIJO = "derivadas"
+CALIDAD = {"webp": 80, "avif": 55}
+LISTA_KEY = "catalogo:img:{}"
+SIN_ARCHIVO = "sin-archivo"
+
+
+def formatos():
+    """Formatos de salida disponibles, del más al menos eficiente."""
+    disponibles = []
+    try:
+        if features.check_module("avif"):  # Pillow >= 11.2
+            disponibles.append("avif")
+    except ValueError:
+        pass
+    if features.check_module("webp"):
+        disponibles.append("webp")
+    return disponibles
+
+
+FORMATOS = formatos()
+
+
+def _nombre(archivo):
+    """Acepta un FieldFile o una ruta dentro del storage."""
+    return getattr(archivo, "name", archivo) or ""
+
+
+def ruta_derivada(nombre, rendicion, formato):
+    base, _ext = os.path.splitext(nombre)
+    return f"{PREFIJO}/{rendicion}/{base}.{formato}"
+
+
+def _lista_key(nombre):
+    return LISTA_KEY.format(hashlib.md5(nombre.encode("utf-8")).hexdigest())
+
+
+def _lista_ttl():
+    return getattr(settings, "CATALOGO_IMAGENES_LISTA_TTL", 86400)
+
+
+# =======================
+# GENERACIÓN
+# =======================
+def generar(nombre, forzar=False, storage=None):
+    """
+    Genera todas las rendiciones de `nombre`. Devuelve cuántos archivos
+    escribió (0 si ya existían o no hay formatos disponibles).
+    """
+    storage = storage or default_storage
+    if not nombre or not FORMATOS:
+        return 0
+
+    escritos = 0
+    with storage.open(nombre, "rb") as f:
+        original = Image.open(f)
+        original = ImageOps.exif_transpose(original)
+        modo = "RGBA" if original.mode in ("RGBA", "LA", "P") else "RGB"
+        original = original.convert(modo)
+
+        # De la más grande a la más chica: cada una se reduce de la anterior
+        img = original
+        for rendicion, ancho in sorted(RENDICIONES.items(), key=lambda r: -r[1]):
+            img = img.copy()
+            img.thumbnail((ancho, ancho * 4), Image.LANCZOS)
+            for formato in FORMATOS:
+                destino = ruta_derivada(nombre, rendicion, formato)
+                if not forzar and storage.exists(destino):
+                    continue
+                opciones = {"quality": CALIDAD[formato]}
+                if formato == "webp":
+                    opciones["method"] = 4
+                buffer = BytesIO()
+                img.save(buffer, formato.upper(), **opciones)
+                if storage.exists(destino):
+                    storage.delete(destino)
+                storage.save(destino, ContentFile(buffer.getvalue()))
+                escritos += 1
+
+    cache.set(_lista_key(nombre), True, _lista_ttl())
+    return escritos
+
+
+def lista(nombre, storage=None):
+    """¿Ya existen las derivadas? (cache primero, luego un stat al storage)."""
+    if not nombre or not FORMATOS:
+        return False
+    key = _lista_key(nombre)
+    hecho = cache.get(key)
+    if hecho is None:
+        storage = storage or default_storage
+        hecho = storage.exists(ruta_derivada(nombre, "card", FORMATOS[-1]))
+        # Si faltan, se vuelve a mirar pronto (el pool puede estar en ello);
+        # si están, también caduca por si alguien las borra del storage
+        cache.set(key, hecho, _lista_ttl() if hecho else 60)
+    return hecho is True
+
+
+# =======================
+# POOL DE TRABAJO
+# =======================
+_pool = None
+_en_curso = set()
+_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=getattr(settings, "CATALOGO_IMAGENES_WORKERS", 2),
+                thread_name_prefix="derivadas",
+            )
+    return _pool
+
+
+def _trabajo(nombre):
+    try:
+        generar(nombre)
+    except FileNotFoundError:
+        # Ruta sin archivo (p. ej. datos de seed): no reintentar en cada request
+        logger.warning("Imagen sin archivo: %s", nombre)
+        cache.set(_lista_key(nombre), SIN_ARCHIVO, 3600)
+    except Exception:
+        logger.exception("No se pudieron generar derivadas de %s", nombre)
+    finally:
+        with _lock:
+            _en_curso.discard(nombre)
+
+
+def encolar(archivo):
+    """Programa la generación de derivadas (sin bloquear la petición)."""
+    nombre = _nombre(archivo)
+    if not nombre or not FORMATOS or lista(nombre):
+        return
+    if cache.get(_lista_key(nombre)) == SIN_ARCHIVO:
+        return
+    if not getattr(settings, "CATALOGO_IMAGENES_ASYNC", True):
+        _trabajo(nombre)
+        return
+    with _lock:
+        if nombre in _en_curso:
+            return
+        _en_curso.add(nombre)
+    _get_pool().submit(_trabajo, nombre)
+
+
+# =======================
+# URLS
+# =======================
+def urls_rendicion(archivo, rendicion):
+    """
+    {formato: url} de una rendición, o None si aún no hay derivadas (en
+    ese caso se encolan y el llamador usa el original).
+    """
+    nombre = _nombre(archivo)
+    if not nombre:
+        return None
+    if not lista(nombre):
+        encolar(nombre)
+        return None
+    return {f: default_storage.url(ruta_derivada(nombre, rendicion, f)) for f in FORMATOS}
+
+
+def url_rendicion(archivo, rendicion):
+    """URL de la rendición en el formato más compatible, o la del original."""
+    nombre = _nombre(archivo)
+    if not nombre:
+        return ""
+    urls = urls_rendicion(nombre, rendicion)
+    if urls:
+        return urls[FORMATOS[-1]]
+    try:
+        return default_storage.url(nombre)
+    except ValueError:
+        return ""
+
+
+def srcset(archivo, rendicion):
+    """
+    {formato: "url 240w, url 480w"} con las rendiciones hasta `rendicion`
+    (el navegador elige según `sizes`), o None si no hay derivadas.
+    """
+    nombre = _nombre(archivo)
+    if not nombre or not lista(nombre):
+        if nombre:
+            encolar(nombre)
+        return None
+    tope = RENDICIONES[rendicion]
+    anchos = [(r, a) for r, a in RENDICIONES.items() if r != "admin" and a <= tope] or [(rendicion, tope)]
+    return {
+        f: ", ".join(f"{default_storage.url(ruta_derivada(nombre, r, f))} {a}w" for r, a in anchos)
+        for f in FORMATOS
+    }
+
+
+# Campos de imagen que tienen derivadas (para el comando de regeneración)
+CAMPOS_IMAGEN = (
+    ("catalogo.Producto", "imagen"),
+    ("catalogo.ProductoImagen", "imagen"),
+    ("catalogo.Marca", "logo"),
+    ("catalogo.Estudio", "logo"),
+    ("catalogo.Estudio", "banner"),
+    ("catalogo.Categoria", "imagen"),
+    ("catalogo.Tematica", "icono"),
+    ("catalogo.Segmento", "icono"),
+    ("accounts.Profile", "avatar"),
+)
@@ -0,0 +1,371 @@
+# catalogo/importar.py
+"""
+Importación masiva del catálogo (CSV, NDJSON o fixture de Django).
+
+Los archivos se leen en streaming y los productos se escriben por lotes:
+cada lote es una transacción con un upsert (bulk_create con
+update_conflicts sobre `slug`), el reemplazo de sus temáticas y una sola
+resincronización del buscador. Las taxonomías se resuelven por slug con
+diccionarios cargados una vez al inicio; no hay consultas por fila.
+
+Formato de cada registro (CSV: una columna por campo, temáticas separadas
+por "|"):
+
+    slug, nombre, precio, descuento, descripcion, imagen, stock,
+    categoria, marca, estudio, segmento   (slugs de las taxonomías)
+    tematicas                              (lista de slugs)
+    destacado, destacado_orden, activo
+
+Solo se actualizan las columnas presentes, así que un CSV con
+`slug,stock` sirve para refrescar existencias.
+"""
+import csv
+import json
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.utils.text import slugify
+
+from . import search
+from .models import (
+    Categoria, Estudio, Marca, Producto, ProductoCambio, Segmento, Tematica,
+)
+
+TAXONOMIAS = {
+    "categoria": Categoria,
+    "marca": Marca,
+    "estudio": Estudio,
+    "segmento": Segmento,
+}
+CAMPOS_TEXTO = ("nombre", "descripcion", "imagen")
+CAMPOS_DECIMAL = ("precio", "descuento")
+CAMPOS_ENTERO = ("stock", "destacado_orden")
+CAMPOS_BOOL = ("destacado", "activo")
+OBLIGATORIOS_ALTA = ("nombre", "precio", "categoria")
+LARGO_SLUG = Producto._meta.get_field("slug").max_length
+
+VERDADERO = {"1", "true", "si", "sí", "s", "yes", "y", "x"}
+
+
+class RegistroInvalido(ValueError):
+    pass
+
+
+# =======================
+# LECTORES (streaming)
+# =======================
+def leer_csv(archivo):
+    for fila in csv.DictReader(archivo):
+        yield {k.strip(): v for k, v in fila.items() if k}
+
+
+def leer_ndjson(archivo):
+    for linea in archivo:
+        linea = linea.strip()
+        if linea:
+            yield json.loads(linea)
+
+
+def _objetos_json(archivo, tam=64 * 1024):
+    """Recorre un arreglo JSON grande objeto por objeto, sin cargarlo entero."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    dentro = False
+    while True:
+        bloque = archivo.read(tam)
+        buffer += bloque
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if not dentro:
+                if pos < len(buffer) and buffer[pos] == "[":
+                    dentro = True
+                    pos += 1
+                    continue
+                if pos < len(buffer):
+                    raise RegistroInvalido("El fixture debe ser un arreglo JSON.")
+                break
+            if pos < len(buffer) and buffer[pos] == "]":
+                return
+            try:
+                obj, fin = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                break  # objeto incompleto: falta leer más
+            yield obj
+            pos = fin
+        buffer = buffer[pos:]
+        if not bloque:
+            if buffer.strip():
+                raise RegistroInvalido("Fixture JSON truncado.")
+            return
+
+
+LECTORES = {"csv": leer_csv, "ndjson": leer_ndjson, "fixture": _objetos_json}
+
+
+def formato_por_extension(ruta):
+    ruta = ruta.lower()
+    if ruta.endswith(".csv"):
+        return "csv"
+    if ruta.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    return "fixture"
+
+
+# =======================
+# CONVERSIÓN DE VALORES
+# =======================
+def _vacio(valor):
+    return valor is None or str(valor).strip() == ""
+
+
+def _decimal(valor, campo):
+    try:
+        n = Decimal(str(valor).strip())
+    except InvalidOperation:
+        raise RegistroInvalido(f"{campo} no es un número: {valor!r}")
+    if not n.is_finite():
+        raise RegistroInvalido(f"{campo} no es un número: {valor!r}")
+    return n.quantize(Decimal("0.01"))
+
+
+def _entero(valor, campo):
+    try:
+        n = int(str(valor).strip())
+    except ValueError:
+        raise RegistroInvalido(f"{campo} no es un entero: {valor!r}")
+    if n < 0:
+        raise RegistroInvalido(f"{campo} no puede ser negativo")
+    return n
+
+
+def _bool(valor):
+    if isinstance(valor, bool):
+        return valor
+    return str(valor).strip().lower() in VERDADERO
+
+
+def _lista_slugs(valor):
+    if isinstance(valor, (list, tuple)):
+        return [str(v).strip() for v in valor if str(v).strip()]
+    return [s.strip() for s in str(valor or "").split("|") if s.strip()]
+
+
+# =======================
+# IMPORTADOR
+# =======================
+class Importador:
+    def __init__(self, lote=1000, dry_run=False):
+        self.lote = max(lote, 1)
+        self.dry_run = dry_run
+        self.unique = ["slug"] if connection.features.supports_update_conflicts_with_target else None
+        # slug -> id por taxonomía (una consulta por modelo)
+        self.mapas = {
+            campo: dict(modelo.objects.values_list("slug", "id"))
+            for campo, modelo in TAXONOMIAS.items()
+        }
+        self.mapas["tematicas"] = dict(Tematica.objects.values_list("slug", "id"))
+        # pk del fixture -> slug, para traducir las FKs de los productos
+        self.pk_fixture = {}
+        self.stats = {"leidos": 0, "creados": 0, "actualizados": 0,
+                      "rechazados": 0, "ignorados": 0, "taxonomias": 0}
+        self.errores = []
+        self.inicio = time.perf_counter()
+
+    # ----- entrada -----
+    def importar(self, registros, formato):
+        pendientes = {}
+        for n, registro in enumerate(registros, start=1):
+            self.stats["leidos"] += 1
+            try:
+                if formato == "fixture":
+                    registro = self._desde_fixture(registro)
+                    if registro is None:
+                        continue
+                datos = self._limpiar(registro)
+            except RegistroInvalido as exc:
+                self._rechazar(n, exc)
+                continue
+            # Filas repetidas del mismo slug dentro de un lote se combinan
+            # (las columnas de la última ganan)
+            previo = pendientes.get(datos["slug"])
+            if previo:
+                datos = {**previo[1], **datos}
+            pendientes[datos["slug"]] = (n, datos)
+            if len(pendientes) >= self.lote:
+                self._escribir(pendientes)
+                pendientes = {}
+        if pendientes:
+            self._escribir(pendientes)
+        return self.stats
+
+    def _rechazar(self, n, motivo):
+        self.stats["rechazados"] += 1
+        if len(self.errores) < 50:
+            self.errores.append(f"registro {n}: {motivo}")
+
+    def _desde_fixture(self, obj):
+        """Convierte un objeto de fixture en registro (o importa la taxonomía)."""
+        modelo = (obj.get("model") or "").lower()
+        campos = dict(obj.get("fields") or {})
+        _app, _, nombre = modelo.partition(".")
+
+        if nombre == "producto":
+            for campo in TAXONOMIAS:
+                if campos.get(campo) is not None:
+                    campos[campo] = self.pk_fixture.get((campo, campos[campo]), campos[campo])
+            campos["tematicas"] = [
+                self.pk_fixture.get(("tematicas", pk), pk) for pk in campos.get("tematicas") or []
+            ]
+            campos.pop("creado", None)
+            campos.pop("modificado", None)
+            return campos
+
+        destino = "tematicas" if nombre == "tematica" else nombre
+        if destino in self.mapas and campos.get("slug"):
+            self._importar_taxonomia(destino, obj.get("pk"), campos)
+        else:
+            self.stats["ignorados"] += 1  # imágenes de galería, suscriptores, etc.
+        return None
+
+    def _importar_taxonomia(self, destino, pk, campos):
+        slug = campos["slug"]
+        self.pk_fixture[(destino, pk)] = slug
+        self.stats["taxonomias"] += 1
+        if self.dry_run:
+            self.mapas[destino].setdefault(slug, None)
+            return
+        modelo = Tematica if destino == "tematicas" else TAXONOMIAS[destino]
+        obj, _ = modelo.objects.update_or_create(
+            slug=slug, defaults={k: v for k, v in campos.items() if k != "slug"},
+        )
+        self.mapas[destino][slug] = obj.pk
+
+    def _limpiar(self, registro):
+        """Valida y tipa un registro; devuelve solo los campos presentes."""
+        datos = {}
+        for campo in CAMPOS_TEXTO:
+            if campo in registro:
+                datos[campo] = str(registro[campo] or "").strip()
+        # Celda numérica vacía = "no cambiar" (en un alta, el default o el
+        # rechazo por OBLIGATORIOS_ALTA si es el precio)
+        for campo in CAMPOS_DECIMAL:
+            if campo in registro and not _vacio(registro[campo]):
+                datos[campo] = _decimal(registro[campo], campo)
+        for campo in CAMPOS_ENTERO:
+            if campo in registro and not _vacio(registro[campo]):
+                datos[campo] = _entero(registro[campo], campo)
+        for campo in CAMPOS_BOOL:
+            if campo in registro:
+                datos[campo] = _bool(registro[campo])
+
+        for campo in TAXONOMIAS:
+            if campo not in registro:
+                continue
+            slug = str(registro[campo] or "").strip()
+            if not slug:
+                if campo == "categoria":
+                    raise RegistroInvalido("categoria vacía")
+                datos[f"{campo}_id"] = None
+            elif slug in self.mapas[campo]:
+                datos[f"{campo}_id"] = self.mapas[campo][slug]
+            else:
+                raise RegistroInvalido(f"{campo} desconocida: {slug!r}")
+
+        if "tematicas" in registro:
+            ids = []
+            for slug in _lista_slugs(registro["tematicas"]):
+                if slug not in self.mapas["tematicas"]:
+                    raise RegistroInvalido(f"temática desconocida: {slug!r}")
+                ids.append(self.mapas["tematicas"][slug])
+            datos["tematicas"] = ids
+
+        slug = str(registro.get("slug") or "").strip() or slugify(datos.get("nombre", ""))
+        if not slug:
+            raise RegistroInvalido("sin slug ni nombre")
+        if len(slug) > LARGO_SLUG:
+            # Recortarlo juntaría en una fila productos distintos con el mismo prefijo
+            raise RegistroInvalido(f"slug de más de {LARGO_SLUG} caracteres: {slug!r}")
+        datos["slug"] = slug
+        return datos
+
+    # ----- escritura por lotes -----
+    def _escribir(self, pendientes):
+        existentes = dict(
+            Producto.objects.filter(slug__in=list(pendientes)).values_list("slug", "id")
+        )
+        validos = {}
+        for slug, (n, datos) in pendientes.items():
+            faltan = [c for c in OBLIGATORIOS_ALTA
+                      if slug not in existentes and c not in datos and f"{c}_id" not in datos]
+            if faltan:
+                self._rechazar(n, f"producto nuevo sin {', '.join(faltan)}")
+            else:
+                validos[slug] = datos
+
+        nuevos = [s for s in validos if s not in existentes]
+        self.stats["creados"] += len(nuevos)
+        self.stats["actualizados"] += len(validos) - len(nuevos)
+        if self.dry_run or not validos:
+            return
+
+        with transaction.atomic():
+            # Una escritura por combinación de columnas (solo se pisa lo que vino)
+            grupos = {}
+            for slug, datos in validos.items():
+                columnas = tuple(sorted(k for k in datos if k not in ("slug", "tematicas")))
+                grupos.setdefault(columnas, []).append(datos)
+
+            parciales = set()
+            for columnas, filas in grupos.items():
+                campos = [c.removesuffix("_id") for c in columnas]
+                if all(c in campos for c in OBLIGATORIOS_ALTA):
+                    Producto.objects.bulk_create(
+                        [Producto(**{k: v for k, v in d.items() if k != "tematicas"}) for d in filas],
+                        update_conflicts=True,
+                        unique_fields=self.unique,
+                        update_fields=campos + ["modificado"],
+                    )
+                elif campos:
+                    # Filas parciales (p. ej. slug,stock): todas existen y el
+                    # INSERT del upsert no pasaría los NOT NULL -> UPDATE ... CASE.
+                    # bulk_update ya deja su rastro en la bitácora.
+                    Producto.objects.bulk_update(
+                        [Producto(pk=existentes[d["slug"]],
+                                  **{k: v for k, v in d.items() if k != "tematicas"})
+                         for d in filas],
+                        campos,
+                        batch_size=500,
+                    )
+                    parciales.update(d["slug"] for d in filas)
+
+            ids = dict(Producto.objects.filter(slug__in=list(validos)).values_list("slug", "id"))
+            self._reemplazar_tematicas(
+                {ids[s]: d["tematicas"] for s, d in validos.items() if "tematicas" in d}
+            )
+
+            ProductoCambio.registrar([ids[s] for s in nuevos], ProductoCambio.CREADO)
+            ProductoCambio.registrar(
+                [ids[s] for s in validos if s in existentes and s not in parciales],
+                ProductoCambio.ACTUALIZADO,
+            )
+            search.sincronizar_al_confirmar(ids.values())
+
+    def _reemplazar_tematicas(self, por_producto):
+        if not por_producto:
+            return
+        Through = Producto.tematicas.through
+        Through.objects.filter(producto_id__in=list(por_producto)).delete()
+        Through.objects.bulk_create(
+            [Through(producto_id=pid, tematica_id=tid)
+             for pid, tematicas in por_producto.items() for tid in set(tematicas)],
+            batch_size=2000,
+        )
+
+    # ----- resumen -----
+    def resumen(self):
+        segundos = max(time.perf_counter() - self.inicio, 1e-6)
+        return {**self.stats, "segundos": round(segundos, 2),
+                "por_segundo": round(self.stats["leidos"] / segundos)}
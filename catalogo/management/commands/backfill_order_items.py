@@ -0,0 +1,72 @@
+# catalogo/management/commands/backfill_order_items.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from catalogo.models import Order, OrderItem, Producto
+
+
+class Command(BaseCommand):
+    help = (
+        "Crea las líneas OrderItem de los pedidos antiguos a partir del JSON "
+        "Order.items. Va por lotes y es reanudable: cada lote se confirma por "
+        "separado y los pedidos que ya tienen líneas se saltan."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=500, help="Pedidos por transacción.")
+        parser.add_argument(
+            "--desde", type=int, default=0,
+            help="Empieza después de este id de pedido (para retomar a mano).",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Solo cuenta, no escribe.")
+
+    def handle(self, *args, **opts):
+        lote = max(opts["lote"], 1)
+        ultimo_id = opts["desde"]
+        pendientes = (Order.objects
+                      .annotate(tiene_lineas=Exists(OrderItem.objects.filter(order=OuterRef("pk"))))
+                      .filter(tiene_lineas=False)
+                      .only("id", "items", "created_at")
+                      .order_by("id"))
+
+        pedidos_total = lineas_total = 0
+        omitidas = []
+        while True:
+            pedidos = list(pendientes.filter(id__gt=ultimo_id)[:lote])
+            if not pedidos:
+                break
+
+            ids_json = set()
+            for order in pedidos:
+                for item in order.items or []:
+                    try:
+                        ids_json.add(int(item.get("id")))
+                    except (AttributeError, TypeError, ValueError):
+                        pass
+            existentes = set(
+                Producto.objects.filter(pk__in=ids_json).values_list("pk", flat=True)
+            )
+
+            lineas = []
+            for order in pedidos:
+                lineas.extend(OrderItem.desde_snapshot(order, existentes, omitidas))
+
+            if not opts["dry_run"]:
+                with transaction.atomic():
+                    OrderItem.objects.bulk_create(lineas, batch_size=1000)
+
+            ultimo_id = pedidos[-1].id
+            pedidos_total += len(pedidos)
+            lineas_total += len(lineas)
+            self.stdout.write(f"  … hasta pedido #{ultimo_id}: {pedidos_total} pedidos, {lineas_total} líneas")
+
+        if omitidas:
+            # Líneas del JSON ilegibles: no frenan el backfill, pero hay que revisarlas
+            self.stderr.write(self.style.WARNING(f"{len(omitidas)} líneas omitidas por datos inválidos:"))
+            for order_id, item, motivo in omitidas[:50]:
+                self.stderr.write(f"  pedido #{order_id}: {motivo}: {item!r}")
+        accion = "Se crearían" if opts["dry_run"] else "Creadas"
+        self.stdout.write(self.style.SUCCESS(
+            f"{accion} {lineas_total} líneas para {pedidos_total} pedidos."
+        ))
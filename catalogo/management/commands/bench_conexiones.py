@@ -0,0 +1,75 @@
+# catalogo/management/commands/bench_conexiones.py
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_finished, request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide el costo de conexión por petición en cada base de datos: simula "
+        "N peticiones (con las mismas señales que usa Django para abrir/cerrar "
+        "conexiones) sin reutilizar la conexión y con CONN_MAX_AGE."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--peticiones", type=int, default=200)
+        parser.add_argument("--consultas", type=int, default=3, help="Consultas por petición.")
+        parser.add_argument("--alias", nargs="*", help="Bases a medir (default: todas).")
+
+    def handle(self, *args, **opts):
+        aliases = opts["alias"] or list(connections)
+        for alias in aliases:
+            if alias not in connections:
+                raise CommandError(f"No existe la base {alias!r}.")
+
+        for alias in aliases:
+            conexion = connections[alias]
+            ajustes = conexion.settings_dict
+            original = (ajustes.get("CONN_MAX_AGE", 0), ajustes.get("CONN_HEALTH_CHECKS", False))
+            self.stdout.write(f"\n{alias} ({conexion.vendor}) - {opts['peticiones']} peticiones, "
+                              f"{opts['consultas']} consultas c/u")
+
+            modos = [("sin reutilizar", 0, False), ("persistente", 600, True)]
+            if ajustes.get("OPTIONS", {}).get("pool"):
+                modos.append(("pool", 0, original[1]))
+            try:
+                base = None
+                for nombre, max_age, health in modos:
+                    ajustes["CONN_MAX_AGE"], ajustes["CONN_HEALTH_CHECKS"] = max_age, health
+                    conexion.close()
+                    mediana, nuevas = self._medir(conexion, opts["peticiones"], opts["consultas"])
+                    base = base or mediana
+                    self.stdout.write(
+                        f"  {nombre:<15} mediana {mediana * 1000:7.3f} ms/petición · "
+                        f"{nuevas:>4} conexiones abiertas · x{base / mediana:.1f}"
+                    )
+            finally:
+                ajustes["CONN_MAX_AGE"], ajustes["CONN_HEALTH_CHECKS"] = original
+                conexion.close()
+
+    def _medir(self, conexion, peticiones, consultas):
+        nuevas = []
+
+        def contar(sender, connection, **kwargs):
+            if connection.alias == conexion.alias:
+                nuevas.append(1)
+
+        connection_created.connect(contar)
+        tiempos = []
+        try:
+            for _ in range(peticiones):
+                inicio = time.perf_counter()
+                request_started.send(sender=self.__class__)
+                for _ in range(consultas):
+                    with conexion.cursor() as cursor:
+                        cursor.execute("SELECT 1")
+                        cursor.fetchone()
+                request_finished.send(sender=self.__class__)
+                tiempos.append(time.perf_counter() - inicio)
+        finally:
+            connection_created.disconnect(contar)
+        return statistics.median(tiempos), len(nuevas)
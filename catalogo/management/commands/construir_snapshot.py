@@ -0,0 +1,23 @@
+# catalogo/management/commands/construir_snapshot.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from catalogo import snapshot
+from catalogo.cache import get_versiones
+
+
+class Command(BaseCommand):
+    help = (
+        "Arma la foto columnar de productos disponibles (catalogo.snapshot) con "
+        "la versión actual del catálogo. Útil al desplegar, antes de levantar workers."
+    )
+
+    def handle(self, *args, **opts):
+        inicio = time.perf_counter()
+        ruta = snapshot.construir(get_versiones(snapshot.TAGS))
+        foto = snapshot.Snapshot(ruta)
+        self.stdout.write(self.style.SUCCESS(
+            f"Foto en {ruta}: {foto.n} productos, {ruta.stat().st_size} bytes "
+            f"({(time.perf_counter() - inicio) * 1000:.0f} ms)"
+        ))
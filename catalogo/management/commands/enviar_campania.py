@@ -0,0 +1,51 @@
+# catalogo/management/commands/enviar_campania.py
+from django.core.management.base import BaseCommand, CommandError
+
+from catalogo.campanias import enviar_campania
+from catalogo.models import NewsletterCampaign
+
+
+class Command(BaseCommand):
+    help = (
+        "Envía (o reanuda desde el último lote) una campaña de newsletter a los "
+        "suscriptores confirmados, por lotes y con límite de ritmo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("campania", type=int, help="id de la campaña")
+        parser.add_argument("--lote", type=int, help="Destinatarios por conexión (NEWSLETTER_LOTE).")
+        parser.add_argument("--tasa", type=float, help="Mensajes por segundo, 0 = sin límite (NEWSLETTER_TASA).")
+        parser.add_argument("--backend", help="Backend de correo, p. ej. django.core.mail.backends.locmem.EmailBackend")
+        parser.add_argument("--max-segundos", type=float, help="Parar tras este tiempo (se reanuda luego).")
+
+    def handle(self, *args, **opts):
+        campania = NewsletterCampaign.objects.filter(pk=opts["campania"]).first()
+        if campania is None:
+            raise CommandError(f"No existe la campaña {opts['campania']}.")
+        if campania.status == "SENT":
+            self.stdout.write("La campaña ya se envió.")
+            return
+        if campania.last_subscriber_id:
+            self.stdout.write(f"Reanudando tras el suscriptor #{campania.last_subscriber_id}.")
+
+        def reportar(c, m):
+            self.stdout.write(
+                f"  lote {m['lote']}: {m['enviados']}/{m['destinatarios']} en {m['segundos']}s "
+                f"({m['por_segundo'] or '-'} msg/s) · {c.sent_count}/{c.total}"
+            )
+
+        campania = enviar_campania(
+            campania, lote=opts["lote"], tasa=opts["tasa"], backend=opts["backend"],
+            max_segundos=opts["max_segundos"], al_terminar_lote=reportar,
+        )
+        if campania.status == "SENT":
+            self.stdout.write(self.style.SUCCESS(
+                f"Campaña enviada: {campania.sent_count} correos en {campania.batches} lotes."
+            ))
+        elif campania.last_error:
+            raise CommandError(f"Campaña pausada: {campania.last_error}")
+        else:
+            self.stdout.write(self.style.WARNING(
+                f"Campaña detenida ({campania.get_status_display()}): "
+                f"{campania.sent_count}/{campania.total}. Vuelve a ejecutar para seguir."
+            ))
@@ -0,0 +1,65 @@
+# catalogo/management/commands/generar_derivadas.py
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.apps import apps
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from catalogo import imagenes
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera las rendiciones (admin/thumb/card/zoom en WebP/AVIF) de todas "
+        "las imágenes subidas, en paralelo, y reporta el ahorro en bytes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--forzar", action="store_true", help="Regenera aunque ya existan.")
+
+    def handle(self, *args, **opts):
+        if not imagenes.FORMATOS:
+            self.stderr.write("Pillow no tiene soporte WebP/AVIF: nada que hacer.")
+            return
+
+        nombres = set()
+        for modelo, campo in imagenes.CAMPOS_IMAGEN:
+            Modelo = apps.get_model(modelo)
+            nombres.update(
+                n for n in Modelo.objects.exclude(**{campo: ""})
+                .exclude(**{f"{campo}__isnull": True}).values_list(campo, flat=True) if n
+            )
+
+        inicio = time.perf_counter()
+        escritos = errores = 0
+        with ThreadPoolExecutor(max_workers=max(opts["workers"], 1)) as pool:
+            futuros = {pool.submit(imagenes.generar, n, opts["forzar"]): n for n in sorted(nombres)}
+            for futuro in as_completed(futuros):
+                try:
+                    escritos += futuro.result()
+                except Exception as exc:
+                    errores += 1
+                    self.stderr.write(f"  {futuros[futuro]}: {exc}")
+
+        # Comparación de bytes: original vs. rendición "card" (lo que va a los listados)
+        original = card = 0
+        formato = imagenes.FORMATOS[-1]
+        for n in nombres:
+            destino = imagenes.ruta_derivada(n, "card", formato)
+            try:
+                original += default_storage.size(n)
+                card += default_storage.size(destino)
+            except (OSError, NotImplementedError):
+                continue
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(nombres)} imágenes, {escritos} archivos escritos, {errores} errores "
+            f"en {time.perf_counter() - inicio:.1f}s. Formatos: {', '.join(imagenes.FORMATOS)}."
+        ))
+        if original:
+            self.stdout.write(
+                f"Bytes originales: {original:,} -> card {formato}: {card:,} "
+                f"({card / original:.0%})"
+            )
@@ -0,0 +1,43 @@
+# catalogo/management/commands/import_catalog.py
+from django.core.management.base import BaseCommand, CommandError
+
+from catalogo.importar import LECTORES, Importador, RegistroInvalido, formato_por_extension
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa productos desde CSV, NDJSON o un fixture JSON (p. ej. seed.json) "
+        "con upserts por lotes. Las taxonomías se resuelven por slug."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("archivo")
+        parser.add_argument(
+            "--formato", choices=sorted(LECTORES),
+            help="Por defecto se deduce de la extensión (.csv, .ndjson/.jsonl, .json).",
+        )
+        parser.add_argument("--lote", type=int, default=1000, help="Productos por transacción.")
+        parser.add_argument("--encoding", default="utf-8")
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="Valida y cuenta altas/cambios sin escribir nada.",
+        )
+
+    def handle(self, *args, **opts):
+        formato = opts["formato"] or formato_por_extension(opts["archivo"])
+        importador = Importador(lote=opts["lote"], dry_run=opts["dry_run"])
+        try:
+            with open(opts["archivo"], encoding=opts["encoding"], newline="") as f:
+                importador.importar(LECTORES[formato](f), formato)
+        except (OSError, UnicodeDecodeError, RegistroInvalido, ValueError) as exc:
+            raise CommandError(f"No se pudo leer {opts['archivo']}: {exc}")
+
+        r = importador.resumen()
+        for error in importador.errores:
+            self.stdout.write(self.style.WARNING(f"  {error}"))
+        prefijo = "[dry-run] " if opts["dry_run"] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefijo}{r['leidos']} registros en {r['segundos']}s ({r['por_segundo']}/s): "
+            f"{r['creados']} altas, {r['actualizados']} cambios, {r['rechazados']} rechazados, "
+            f"{r['taxonomias']} taxonomías, {r['ignorados']} ignorados."
+        ))
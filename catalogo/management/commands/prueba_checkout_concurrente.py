@@ -0,0 +1,93 @@
+# catalogo/management/commands/prueba_checkout_concurrente.py
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from catalogo.checkout import StockInsuficiente, crear_pedido
+from catalogo.models import Categoria, Order, Producto
+
+
+class Command(BaseCommand):
+    help = (
+        "Prueba de carga del checkout: N compradores simultáneos compiten por "
+        "un producto temporal con stock limitado y se verifica que no haya sobreventa."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--compradores", type=int, default=50)
+        parser.add_argument("--stock", type=int, default=10)
+        parser.add_argument("--cantidad", type=int, default=1, help="Unidades por compra")
+
+    def handle(self, *args, **opts):
+        if connection.vendor == "sqlite":
+            self.stdout.write(self.style.WARNING(
+                "SQLite serializa las escrituras: sirve para validar el resultado, "
+                "no para medir concurrencia real."
+            ))
+
+        categoria = Categoria.objects.order_by("pk").first()
+        if categoria is None:
+            raise CommandError("Se necesita al menos una Categoría.")
+
+        slug = f"prueba-checkout-{int(time.time() * 1000)}"
+        producto = Producto.objects.create(
+            nombre="Prueba checkout", slug=slug, precio=100,
+            stock=opts["stock"], categoria=categoria, activo=True,
+        )
+        cart = {str(producto.pk): opts["cantidad"]}
+        resultados = {"ok": [], "sin_stock": 0, "errores": []}
+        lock = threading.Lock()
+        salida = threading.Barrier(opts["compradores"])
+
+        def comprar():
+            try:
+                salida.wait()  # todos arrancan a la vez
+                order = crear_pedido(None, dict(cart))
+                with lock:
+                    resultados["ok"].append(order.pk)
+            except StockInsuficiente:
+                with lock:
+                    resultados["sin_stock"] += 1
+            except Exception as exc:  # bloqueos, timeouts, etc.
+                with lock:
+                    resultados["errores"].append(repr(exc))
+            finally:
+                connections.close_all()
+
+        inicio = time.perf_counter()
+        hilos = [threading.Thread(target=comprar) for _ in range(opts["compradores"])]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+        duracion = time.perf_counter() - inicio
+
+        producto.refresh_from_db()
+        vendidas = len(resultados["ok"]) * opts["cantidad"]
+        esperado = min(opts["stock"] // opts["cantidad"], opts["compradores"])
+
+        self.stdout.write(
+            f"Compras OK: {len(resultados['ok'])} | sin stock: {resultados['sin_stock']} | "
+            f"errores: {len(resultados['errores'])} | stock final: {producto.stock} | "
+            f"{duracion:.2f}s"
+        )
+        for err in resultados["errores"][:5]:
+            self.stdout.write(f"  {err}")
+
+        # Limpieza
+        Order.objects.filter(pk__in=resultados["ok"]).delete()
+        producto.delete()
+
+        # Cualquier excepción invalida la prueba: no se sabe si hubo sobreventa
+        problemas = []
+        if vendidas + producto.stock != opts["stock"] or producto.stock < 0:
+            problemas.append("¡Sobreventa o stock inconsistente!")
+        if resultados["errores"]:
+            problemas.append(f"{len(resultados['errores'])} compradores fallaron con una excepción.")
+        elif len(resultados["ok"]) != esperado:
+            problemas.append(f"Se esperaban {esperado} compras y hubo {len(resultados['ok'])}.")
+        if problemas:
+            raise CommandError(" ".join(problemas))
+        self.stdout.write(self.style.SUCCESS("Sin sobreventa."))
@@ -0,0 +1,15 @@
+# catalogo/management/commands/purgar_carritos.py
+from django.core.management.base import BaseCommand
+
+from catalogo.carrito import purgar_invitados
+
+
+class Command(BaseCommand):
+    help = "Borra los carritos de invitados sin cambios en N días (los de usuarios se conservan)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dias", type=int, default=30)
+
+    def handle(self, *args, **opts):
+        borrados = purgar_invitados(opts["dias"])
+        self.stdout.write(self.style.SUCCESS(f"{borrados} filas borradas (carritos y líneas)."))
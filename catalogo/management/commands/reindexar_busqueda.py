@@ -0,0 +1,31 @@
+# catalogo/management/commands/reindexar_busqueda.py
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from catalogo import search
+
+
+class Command(BaseCommand):
+    help = "Regenera los documentos e índice de búsqueda de texto completo del catálogo."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--recrear-indice", action="store_true",
+            help="Borra y vuelve a crear el índice propio del motor antes de indexar.",
+        )
+        parser.add_argument(
+            "ids", nargs="*", type=int,
+            help="Ids de producto a reindexar (por defecto, todos).",
+        )
+
+    def handle(self, *args, **opts):
+        if opts["recrear_indice"]:
+            motor = search.motor_para()
+            with connection.cursor() as cursor:
+                motor.borrar_indice(cursor)
+                motor.crear_indice(cursor)
+
+        total = search.sincronizar(opts["ids"] or None)
+        self.stdout.write(self.style.SUCCESS(
+            f"Productos indexados: {total} (motor: {connection.vendor})"
+        ))
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from catalogo import search
+
+
+def crear_indice(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        search.motor_para(schema_editor.connection).crear_indice(cursor)
+
+    # Documentos iniciales para los productos existentes
+    Producto = apps.get_model("catalogo", "Producto")
+    ProductoBusqueda = apps.get_model("catalogo", "ProductoBusqueda")
+    search.guardar_documentos(
+        ProductoBusqueda,
+        search.filas_documento(Producto.objects.all()),
+        schema_editor.connection,
+    )
+
+
+def borrar_indice(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        search.motor_para(schema_editor.connection).borrar_indice(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogo', '0010_order'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductoBusqueda',
+            fields=[
+                ('producto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='busqueda', serialize=False, to='catalogo.producto')),
+                ('texto', models.TextField(blank=True)),
+                ('raices', models.TextField(blank=True)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Documento de búsqueda',
+                'verbose_name_plural': 'Documentos de búsqueda',
+            },
+        ),
+        migrations.RunPython(crear_indice, borrar_indice),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogo', '0011_productobusqueda'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductoCambio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('producto_id', models.BigIntegerField(db_index=True)),
+                ('accion', models.CharField(choices=[('C', 'Creado'), ('U', 'Actualizado'), ('D', 'Eliminado')], max_length=1)),
+                ('momento', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Cambio de producto',
+                'verbose_name_plural': 'Cambios de producto',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='modificado',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
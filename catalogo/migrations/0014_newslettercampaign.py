@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogo', '0013_orderitem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NewsletterCampaign',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=200, verbose_name='Asunto')),
+                ('body_text', models.TextField(verbose_name='Texto')),
+                ('body_html', models.TextField(blank=True, verbose_name='HTML')),
+                ('status', models.CharField(choices=[('DRAFT', 'Borrador'), ('SENDING', 'Enviando'), ('PAUSED', 'Pausada'), ('SENT', 'Enviada')], default='DRAFT', max_length=10)),
+                ('last_subscriber_id', models.BigIntegerField(default=0, editable=False)),
+                ('total', models.PositiveIntegerField(default=0, editable=False)),
+                ('sent_count', models.PositiveIntegerField(default=0, editable=False, verbose_name='Enviados')),
+                ('batches', models.PositiveIntegerField(default=0, editable=False, verbose_name='Lotes')),
+                ('metrics', models.JSONField(blank=True, default=list, editable=False)),
+                ('last_error', models.TextField(blank=True, editable=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, editable=False, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, editable=False, null=True)),
+            ],
+            options={
+                'verbose_name': 'Campaña',
+                'verbose_name_plural': 'Campañas',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
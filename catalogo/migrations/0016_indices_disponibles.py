@@ -0,0 +1,42 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:34
+
+import catalogo.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogo', '0015_cart'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='producto',
+            index=catalogo.models.IndiceDisponible(condition=models.Q(('activo', True), ('stock__gt', 0)), fields=['-creado'], name='prod_disp_creado', respaldo=('activo',)),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=catalogo.models.IndiceDisponible(condition=models.Q(('activo', True), ('stock__gt', 0), ('destacado', True)), fields=['destacado_orden', '-creado'], name='prod_disp_destacados', respaldo=('activo', 'destacado')),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=catalogo.models.IndiceDisponible(condition=models.Q(('activo', True), ('stock__gt', 0)), fields=['-destacado', 'destacado_orden', '-creado'], name='prod_disp_populares', respaldo=('activo',)),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=catalogo.models.IndiceDisponible(condition=models.Q(('activo', True), ('stock__gt', 0), ('descuento__gt', 0)), fields=['-descuento', '-creado'], name='prod_disp_ofertas', respaldo=('activo',)),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=catalogo.models.IndiceDisponible(condition=models.Q(('activo', True), ('stock__gt', 0)), fields=['marca', '-creado'], name='prod_disp_marca', respaldo=('activo',)),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=catalogo.models.IndiceDisponible(condition=models.Q(('activo', True), ('stock__gt', 0)), fields=['categoria', '-creado'], name='prod_disp_categoria', respaldo=('activo',)),
+        ),
+        migrations.AddIndex(
+            model_name='productoimagen',
+            index=models.Index(fields=['producto', 'orden', 'id'], name='galeria_producto_orden'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:43
+
+import catalogo.models
+from decimal import Decimal
+from django.db import migrations, models
+
+from catalogo.models import calcular_precio_final
+
+
+def calcular_existentes(apps, schema_editor):
+    # Con el modelo histórico: save() y ProductoQuerySet no existen aquí
+    Producto = apps.get_model("catalogo", "Producto")
+    productos = []
+    for pk, precio, descuento in Producto.objects.values_list("pk", "precio", "descuento").iterator():
+        productos.append(Producto(pk=pk, precio_final=calcular_precio_final(precio, descuento)))
+    Producto.objects.bulk_update(productos, ["precio_final"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogo', '0016_indices_disponibles'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='precio_final',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, help_text='Precio con descuento (se calcula solo)', max_digits=10),
+        ),
+        migrations.RunPython(calcular_existentes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='producto',
+            index=catalogo.models.IndiceDisponible(condition=models.Q(('activo', True), ('stock__gt', 0)), fields=['precio_final', 'id'], name='prod_disp_precio', respaldo=('activo',)),
+        ),
+    ]
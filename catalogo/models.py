@@ -1,11 +1,177 @@
-from decimal import Decimal
-from django.db import models
+import logging
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+from django.db import connections, models, transaction
 from django.urls import reverse
 from ckeditor.fields import RichTextField
 from django.utils import timezone
 from django.conf import settings
 import secrets
 
+logger = logging.getLogger(__name__)
+
+
+# ========= QUERYSET BASE DEL CATÁLOGO =========
+class CatalogoQuerySet(models.QuerySet):
+    """
+    Las operaciones masivas (update/bulk_*) no disparan señales; aquí se
+    avisa igual al versionado del catálogo para invalidar los caches.
+    """
+    def _invalidar(self):
+        from .cache import bump_version
+        bump_version(self.model._meta.model_name)
+
+    def update(self, **kwargs):
+        rows = super().update(**kwargs)
+        if rows:
+            self._invalidar()
+        return rows
+    update.alters_data = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        if objs:
+            self._invalidar()
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        rows = super().bulk_update(objs, fields, *args, **kwargs)
+        if rows:
+            self._invalidar()
+        return rows
+    bulk_update.alters_data = True
+
+
+class ProductoQuerySet(CatalogoQuerySet):
+    def con_portada(self):
+        """
+        Anota la ruta de la 1ª imagen de galería (orden, id) en la misma
+        consulta, para que portada()/portada_url() no hagan una consulta por
+        producto en los listados.
+        """
+        galeria = (ProductoImagen.objects
+                   .filter(producto=models.OuterRef("pk"))
+                   .order_by("orden", "id")
+                   .values("imagen")[:1])
+        return self.annotate(portada_galeria=models.Subquery(galeria))
+
+    # update()/bulk_update() no pasan por save(): aquí se mantiene
+    # `modificado`, `precio_final` y la bitácora de cambios que usa la
+    # sincronización móvil.
+    def update(self, **kwargs):
+        ahora = timezone.now()
+        kwargs.setdefault("modificado", ahora)
+        with transaction.atomic(using=self.db):
+            # La bitácora va en la misma transacción que el UPDATE y antes que
+            # él (después, el filtro puede ya no coincidir: activo=False, ...)
+            ProductoCambio.registrar_consulta(self, ProductoCambio.ACTUALIZADO, ahora)
+            rows = super().update(**kwargs)
+            if rows and CAMPOS_PRECIO & kwargs.keys():
+                # Los productos tocados, por las filas de bitácora recién escritas
+                tocados = ProductoCambio.objects.filter(
+                    momento=ahora, accion=ProductoCambio.ACTUALIZADO,
+                ).values("producto_id")
+                self.model.objects.using(self.db).filter(pk__in=tocados).recalcular_precio_final()
+        return rows
+    update.alters_data = True
+
+    def recalcular_precio_final(self):
+        """
+        Pone al día `precio_final` con lo que hay en la BD. Sirve tras un
+        update() con expresiones (F("precio") * ...) o un upsert que solo
+        trae una de las dos columnas: el redondeo es el de Python, no el del
+        motor. No toca `modificado` ni la bitácora (ya lo hizo quien llama).
+        """
+        cambiados = []
+        for pk, precio, descuento, guardado in self.values_list("pk", "precio", "descuento", "precio_final"):
+            final = calcular_precio_final(precio, descuento)
+            if final != guardado:
+                cambiados.append(self.model(pk=pk, precio_final=final))
+        # QuerySet base: sin volver a pasar por el update() de arriba
+        models.QuerySet(self.model, using=self.db).bulk_update(cambiados, ["precio_final"], batch_size=1000)
+        return len(cambiados)
+    recalcular_precio_final.alters_data = True
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        ahora = timezone.now()
+        for obj in objs:
+            obj.modificado = ahora
+        fields = [*fields, "modificado"] if "modificado" not in fields else fields
+        # Django resuelve bulk_update con update() por lote, y ese update()
+        # (el de arriba) ya registra los cambios en la bitácora.
+        return super().bulk_update(objs, fields, *args, **kwargs)
+    bulk_update.alters_data = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.precio_final = obj.calcular_precio_final()
+        pisa_precio = kwargs.get("update_conflicts") and CAMPOS_PRECIO & set(kwargs.get("update_fields") or ())
+        if pisa_precio and "precio_final" not in kwargs["update_fields"]:
+            # Sin esto, en las filas que ya existían el upsert deja el precio
+            # final viejo (en MySQL no vuelve ni el pk para corregirlo después)
+            kwargs["update_fields"] = [*kwargs["update_fields"], "precio_final"]
+        objs = super().bulk_create(objs, *args, **kwargs)
+        # Si el upsert pisa solo precio o solo descuento, el valor de arriba
+        # se calculó con el otro campo del objeto y no con el de la BD
+        if pisa_precio and not CAMPOS_PRECIO <= set(kwargs["update_fields"]):
+            unicos = kwargs.get("unique_fields") or [
+                f.name for f in self.model._meta.fields if f.unique and not f.primary_key
+            ]
+            if all(o.pk for o in objs):
+                self.model.objects.using(self.db).filter(pk__in=[o.pk for o in objs]).recalcular_precio_final()
+            elif len(unicos) == 1:
+                valores = [getattr(o, unicos[0]) for o in objs]
+                self.model.objects.using(self.db).filter(**{f"{unicos[0]}__in": valores}).recalcular_precio_final()
+        # Con update_conflicts no se sabe qué fue alta y qué cambio (y en MySQL
+        # no hay pk): la bitácora la escribe quien llama (ver catalogo.importar).
+        if not kwargs.get("update_conflicts"):
+            ProductoCambio.registrar([o.pk for o in objs if o.pk], ProductoCambio.CREADO)
+        return objs
+
+
+# ========= PRECIO FINAL =========
+CAMPOS_PRECIO = {"precio", "descuento"}
+
+
+def calcular_precio_final(precio, descuento):
+    """Precio con descuento (porcentaje), redondeado a 2 decimales."""
+    precio, descuento = Decimal(str(precio)), Decimal(str(descuento or 0))
+    if descuento > 0:
+        factor = (Decimal("1.00") - (descuento / Decimal("100")))
+        return (precio * factor).quantize(Decimal("0.01"))
+    return precio.quantize(Decimal("0.01"))
+
+
+# ========= ÍNDICES DE "PRODUCTO DISPONIBLE" =========
+DISPONIBLE = models.Q(activo=True, stock__gt=0)
+
+
+class IndiceDisponible(models.Index):
+    """
+    Índice parcial sobre los productos disponibles (activo y con stock), el
+    filtro de casi todas las consultas del catálogo. Solo guarda esas filas
+    y sirve al WHERE y al ORDER BY a la vez.
+
+    Donde no hay índices parciales (MySQL) la condición se ignora y se crea
+    un índice compuesto con `respaldo` delante (por defecto `activo`).
+    """
+
+    def __init__(self, *, fields, name, condition=DISPONIBLE, respaldo=("activo",), **kwargs):
+        self.respaldo = tuple(respaldo)
+        super().__init__(fields=fields, name=name, condition=condition, **kwargs)
+
+    def create_sql(self, model, schema_editor, using="", **kwargs):
+        if schema_editor.connection.features.supports_partial_indexes:
+            return super().create_sql(model, schema_editor, using=using, **kwargs)
+        compuesto = models.Index(fields=[*self.respaldo, *self.fields], name=self.name)
+        return compuesto.create_sql(model, schema_editor, using=using, **kwargs)
+
+    def deconstruct(self):
+        path, args, kwargs = super().deconstruct()
+        kwargs["respaldo"] = self.respaldo
+        return path, args, kwargs
+
 
 # ========= MARCA =========
 class Marca(models.Model):
@@ -15,6 +181,8 @@ class Marca(models.Model):
     descripcion = RichTextField(blank=True, null=True)
     sitio_url = models.URLField(blank=True, null=True)
 
+    objects = CatalogoQuerySet.as_manager()
+
     class Meta:
         ordering = ["nombre"]
         verbose_name = "Marca"
@@ -36,6 +204,8 @@ class Estudio(models.Model):
     logo = models.ImageField(upload_to="estudios/", blank=True, null=True)
     banner = models.ImageField(upload_to="estudios/banners/", blank=True, null=True)
 
+    objects = CatalogoQuerySet.as_manager()
+
     class Meta:
         ordering = ["nombre"]
         verbose_name = "Estudio"
@@ -57,6 +227,8 @@ class Tematica(models.Model):
     slug = models.SlugField(unique=True)
     icono = models.ImageField(upload_to="tematicas/iconos/", blank=True, null=True)
 
+    objects = CatalogoQuerySet.as_manager()
+
     class Meta:
         ordering = ["nombre"]
         verbose_name = "Temática"
@@ -85,6 +257,8 @@ class Categoria(models.Model):
     descripcion = RichTextField(blank=True, null=True)
     imagen = models.ImageField(upload_to="categorias/", blank=True, null=True)
 
+    objects = CatalogoQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Categoría"
         verbose_name_plural = "Categorías"
@@ -100,6 +274,8 @@ class Segmento(models.Model):
     slug = models.SlugField(unique=True)
     icono = models.ImageField(upload_to="segmentos/iconos/", blank=True, null=True)
 
+    objects = CatalogoQuerySet.as_manager()
+
     class Meta:
         ordering = ["nombre"]
         verbose_name = "Segmento"
@@ -118,6 +294,12 @@ class Producto(models.Model):
         max_digits=5, decimal_places=2, default=Decimal("0.00"),
         help_text="Porcentaje de descuento (ej. 10.00 = 10%)"
     )
+    # Guardado para ordenar y filtrar por precio en la BD; lo mantienen
+    # save() y ProductoQuerySet (update/bulk_update/bulk_create)
+    precio_final = models.DecimalField(
+        max_digits=10, decimal_places=2, default=Decimal("0.00"), editable=False,
+        help_text="Precio con descuento (se calcula solo)"
+    )
     descripcion = RichTextField(blank=True, null=True)
     imagen = models.ImageField(upload_to='productos/', blank=True, null=True)  # principal
     stock = models.PositiveIntegerField(default=0)
@@ -157,22 +339,62 @@ class Producto(models.Model):
 
     activo = models.BooleanField(default=True)
     creado = models.DateTimeField(auto_now_add=True)
+    modificado = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = ProductoQuerySet.as_manager()
 
     class Meta:
         ordering = ['-creado']
+        # Un índice por orden de listado (ver catalogo/tests.py, que revisa los planes)
+        indexes = [
+            # Nuevos / listado por defecto
+            IndiceDisponible(fields=["-creado"], name="prod_disp_creado"),
+            # Destacados del home y ?destacados=1
+            IndiceDisponible(
+                fields=["destacado_orden", "-creado"], name="prod_disp_destacados",
+                condition=DISPONIBLE & models.Q(destacado=True), respaldo=("activo", "destacado"),
+            ),
+            # "Populares" de la lista de marcas: destacados primero y luego el resto
+            IndiceDisponible(fields=["-destacado", "destacado_orden", "-creado"], name="prod_disp_populares"),
+            # Ofertas (?ofertas=1 y contador del menú)
+            IndiceDisponible(
+                fields=["-descuento", "-creado"], name="prod_disp_ofertas",
+                condition=DISPONIBLE & models.Q(descuento__gt=0),
+            ),
+            # Detalle de marca y ?cat= (filtro por FK + orden)
+            IndiceDisponible(fields=["marca", "-creado"], name="prod_disp_marca"),
+            IndiceDisponible(fields=["categoria", "-creado"], name="prod_disp_categoria"),
+            # ?orden=precio_asc / precio_desc y ?precio_min= / ?precio_max=
+            # (precio_desc lee el mismo índice al revés)
+            IndiceDisponible(fields=["precio_final", "id"], name="prod_disp_precio"),
+        ]
 
     def __str__(self):
         return self.nombre
 
+    @classmethod
+    def _check_indexes(cls, databases):
+        # W037 ("condición ignorada") no aplica a IndiceDisponible, que sin
+        # índices parciales crea su compuesto de respaldo; para cualquier otro
+        # índice con condición el aviso sigue saliendo.
+        errores = super()._check_indexes(databases)
+        if all(isinstance(i, IndiceDisponible) for i in cls._meta.indexes if i.condition is not None):
+            errores = [e for e in errores if e.id != "models.W037"]
+        return errores
+
     def get_absolute_url(self):
         return reverse("producto_detalle", args=[self.slug])
 
-    def precio_final(self):
-        """Devuelve el precio con descuento, redondeado a 2 decimales."""
-        if self.descuento and self.descuento > 0:
-            factor = (Decimal("1.00") - (self.descuento / Decimal("100")))
-            return (self.precio * factor).quantize(Decimal("0.01"))
-        return self.precio.quantize(Decimal("0.01"))
+    def save(self, *args, **kwargs):
+        self.precio_final = self.calcular_precio_final()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and CAMPOS_PRECIO & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "precio_final"}
+        super().save(*args, **kwargs)
+
+    def calcular_precio_final(self):
+        """Precio con descuento de la instancia tal como está (guardada o no)."""
+        return calcular_precio_final(self.precio, self.descuento)
 
     def disponible(self):
         return self.stock > 0 and self.activo
@@ -181,7 +403,14 @@ class Producto(models.Model):
     def portada(self):
         if self.imagen:
             return self.imagen
-        first = self.imagenes.first()
+        # Anotada con Producto.objects.con_portada(): sin consulta extra
+        if hasattr(self, "portada_galeria"):
+            return ProductoImagen(imagen=self.portada_galeria).imagen if self.portada_galeria else None
+        # Galería ya precargada con prefetch_related("imagenes")
+        if "imagenes" in getattr(self, "_prefetched_objects_cache", {}):
+            first = next(iter(self.imagenes.all()), None)
+        else:
+            first = self.imagenes.first()
         return first.imagen if first else None
 
     def portada_url(self):
@@ -199,12 +428,133 @@ class ProductoImagen(models.Model):
 
     class Meta:
         ordering = ["orden", "id"]
+        # Portada (1ª imagen) de cada producto en los listados, ya ordenada
+        indexes = [models.Index(fields=["producto", "orden", "id"], name="galeria_producto_orden")]
         verbose_name = "Imagen de producto"
         verbose_name_plural = "Imágenes de producto"
 
     def __str__(self):
         return f"Imagen de {self.producto.nombre} ({self.id})"
 
+# ========= BITÁCORA DE CAMBIOS (sincronización móvil) =========
+class ProductoCambio(models.Model):
+    """
+    Una fila por alta/cambio/baja de Producto. El id es creciente, así que
+    sirve de token de sincronización: "dame lo que cambió después del N".
+
+    Ojo: el id se asigna en el INSERT y no en el commit. Una transacción
+    lenta puede confirmar el N cuando otra ya confirmó el N+1; si alguien
+    leyera hasta N+1 perdería el N para siempre. Por eso el token nunca
+    pasa un hueco de ids reciente (más nuevo que CATALOGO_CAMBIOS_ESPERA
+    segundos): puede ser una transacción abierta. Pasado ese tiempo el
+    hueco se da por un rollback y se salta.
+    """
+    CREADO = "C"
+    ACTUALIZADO = "U"
+    ELIMINADO = "D"
+    ACCIONES = [
+        (CREADO, "Creado"),
+        (ACTUALIZADO, "Actualizado"),
+        (ELIMINADO, "Eliminado"),
+    ]
+
+    # Sin FK: la fila debe sobrevivir al borrado del producto (tombstone)
+    producto_id = models.BigIntegerField(db_index=True)
+    accion = models.CharField(max_length=1, choices=ACCIONES)
+    momento = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["id"]
+        verbose_name = "Cambio de producto"
+        verbose_name_plural = "Cambios de producto"
+
+    def __str__(self):
+        return f"#{self.pk} {self.get_accion_display()} producto {self.producto_id}"
+
+    @classmethod
+    def registrar(cls, ids, accion):
+        cls.objects.bulk_create([cls(producto_id=pk, accion=accion) for pk in ids], batch_size=1000)
+
+    @classmethod
+    def registrar_consulta(cls, productos, accion, momento):
+        """
+        Como registrar(), con los productos de un queryset en un solo
+        INSERT ... SELECT: los ids no pasan por Python.
+        """
+        filas = (productos.order_by("pk")
+                 .annotate(_accion=models.Value(accion, output_field=models.CharField()),
+                           _momento=models.Value(momento, output_field=models.DateTimeField()))
+                 .values_list("pk", "_accion", "_momento"))
+        sql, params = filas.query.get_compiler(productos.db).as_sql()
+        conn = connections[productos.db]
+        tabla = conn.ops.quote_name(cls._meta.db_table)
+        columnas = ", ".join(conn.ops.quote_name(c) for c in ("producto_id", "accion", "momento"))
+        with conn.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {tabla} ({columnas}) {sql}", params)
+
+    @classmethod
+    def _hasta_hueco(cls, filas, desde):
+        """
+        Cuántas de `filas` (ascendentes por id, con `momento` en [1]) se
+        pueden entregar sin saltar un hueco reciente después de `desde`.
+        """
+        limite = timezone.now() - timedelta(seconds=getattr(settings, "CATALOGO_CAMBIOS_ESPERA", 60))
+        esperado = desde + 1
+        for n, (pk, momento, *_resto) in enumerate(filas):
+            if pk != esperado and momento > limite:
+                return n
+            esperado = pk + 1
+        return len(filas)
+
+    @classmethod
+    def ultimo_token(cls, ventana=1000):
+        """Token hasta donde todo está confirmado (o es un hueco viejo)."""
+        recientes = list(cls.objects.order_by("-id").values_list("id", "momento")[:ventana])[::-1]
+        if not recientes:
+            return 0
+        # Lo anterior a la ventana se da por confirmado
+        desde = recientes[0][0] - 1
+        n = cls._hasta_hueco(recientes, desde)
+        return recientes[n - 1][0] if n else desde
+
+    @classmethod
+    def leer(cls, desde, limite):
+        """
+        Cambios después del token `desde`: ([(id, producto_id)], token, mas).
+        Se detiene antes de un hueco reciente; `mas` indica que quedaron
+        filas por leer ya entregables.
+        """
+        filas = list(
+            cls.objects.filter(id__gt=desde).order_by("id")
+            .values_list("id", "momento", "producto_id")[:limite + 1]
+        )
+        n = cls._hasta_hueco(filas[:limite], desde)
+        mas = n == limite and len(filas) > limite
+        cambios = [(pk, producto_id) for pk, _momento, producto_id in filas[:n]]
+        return cambios, (cambios[-1][0] if cambios else desde), mas
+
+
+# ========= BÚSQUEDA (documento desnormalizado) =========
+class ProductoBusqueda(models.Model):
+    """
+    Documento de búsqueda de un producto: nombre + descripción sin HTML +
+    nombres de taxonomías, normalizado. Lo mantiene catalogo.search.
+    """
+    producto = models.OneToOneField(
+        Producto, on_delete=models.CASCADE, primary_key=True, related_name="busqueda"
+    )
+    texto = models.TextField(blank=True)   # minúsculas, sin acentos (PostgreSQL)
+    raices = models.TextField(blank=True)  # raíces en español (MySQL/SQLite)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Documento de búsqueda"
+        verbose_name_plural = "Documentos de búsqueda"
+
+    def __str__(self):
+        return f"Búsqueda de {self.producto_id}"
+
+
 class NewsletterSubscriber(models.Model):
     email = models.EmailField(max_length=191, unique=True)
     is_confirmed = models.BooleanField(default=False)
@@ -225,6 +575,45 @@ class NewsletterSubscriber(models.Model):
             self.token = secrets.token_urlsafe(32)
 
 
+class NewsletterCampaign(models.Model):
+    """
+    Envío masivo a los suscriptores confirmados (ver catalogo/campanias.py).
+    El avance se guarda tras cada lote (`last_subscriber_id`), así que un
+    envío interrumpido o pausado continúa donde quedó.
+    """
+    STATUS_CHOICES = [
+        ("DRAFT", "Borrador"),
+        ("SENDING", "Enviando"),
+        ("PAUSED", "Pausada"),
+        ("SENT", "Enviada"),
+    ]
+
+    subject = models.CharField("Asunto", max_length=200)
+    body_text = models.TextField("Texto")
+    body_html = models.TextField("HTML", blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="DRAFT")
+
+    # Checkpoint: los destinatarios se recorren por id ascendente
+    last_subscriber_id = models.BigIntegerField(default=0, editable=False)
+    total = models.PositiveIntegerField(default=0, editable=False)
+    sent_count = models.PositiveIntegerField("Enviados", default=0, editable=False)
+    batches = models.PositiveIntegerField("Lotes", default=0, editable=False)
+    metrics = models.JSONField(default=list, blank=True, editable=False)  # una entrada por lote
+    last_error = models.TextField(blank=True, editable=False)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True, editable=False)
+    finished_at = models.DateTimeField(blank=True, null=True, editable=False)
+
+    class Meta:
+        ordering = ["-created_at"]
+        verbose_name = "Campaña"
+        verbose_name_plural = "Campañas"
+
+    def __str__(self):
+        return self.subject
+
+
 # ========= PEDIDO (simulado) =========
 class Order(models.Model):
     STATUS_CHOICES = [
@@ -255,3 +644,150 @@ class Order(models.Model):
     def __str__(self):
         who = self.user.email if (self.user and self.user.email) else "anónimo"
         return f"Pedido #{self.pk} - {who} - ${self.total}"
+
+
+class OrderItem(models.Model):
+    """
+    Línea de un pedido en forma relacional (el JSON de Order.items se queda
+    como snapshot). Permite agregar por producto / fecha sin parsear JSON.
+    """
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="order_items")
+    # SET_NULL: la venta sigue contando aunque el producto se borre
+    producto = models.ForeignKey(
+        Producto, on_delete=models.SET_NULL, null=True, blank=True, related_name="order_items"
+    )
+    name = models.CharField(max_length=200)  # nombre al momento de la compra
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)  # ya con descuento
+    discount = models.DecimalField(max_digits=5, decimal_places=2, default=0)  # % aplicado
+    qty = models.PositiveIntegerField(default=1)
+    # Copia de order.created_at para agregar por fecha sin JOIN
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["order_id", "id"]
+        verbose_name = "Línea de pedido"
+        verbose_name_plural = "Líneas de pedido"
+        indexes = [
+            models.Index(fields=["producto", "created_at"], name="orderitem_producto_fecha"),
+            models.Index(fields=["created_at"], name="orderitem_fecha"),
+        ]
+
+    def __str__(self):
+        return f"{self.qty} x {self.name} (pedido #{self.order_id})"
+
+    @property
+    def subtotal(self):
+        return (self.unit_price * self.qty).quantize(Decimal("0.01"))
+
+    @classmethod
+    def desde_snapshot(cls, order, productos_existentes=None, omitidas=None):
+        """
+        Arma (sin guardar) las líneas a partir de order.items. Si se pasa el
+        conjunto de ids de producto existentes, los que ya no están quedan
+        con producto=None. Las líneas que no se pueden leer (sin precio, o
+        con precio/cantidad/descuento inválidos) se saltan y se anotan en
+        `omitidas` como (pedido_id, item, motivo) y en el log.
+        """
+        lineas = []
+        for item in order.items or []:
+            try:
+                linea = cls._linea_snapshot(order, item)
+            except ValueError as exc:
+                logger.warning("Pedido #%s: línea omitida (%s): %r", order.pk, exc, item)
+                if omitidas is not None:
+                    omitidas.append((order.pk, item, str(exc)))
+                continue
+            if productos_existentes is not None and linea.producto_id not in productos_existentes:
+                linea.producto_id = None
+            lineas.append(linea)
+        return lineas
+
+    @classmethod
+    def _linea_snapshot(cls, order, item):
+        """Una línea de order.items validada; ValueError si no sirve."""
+        if not isinstance(item, dict):
+            raise ValueError("no es un objeto")
+        try:
+            pid = int(item.get("id"))
+        except (TypeError, ValueError):
+            pid = None
+        if item.get("price") in (None, ""):
+            raise ValueError("sin precio")
+        precio = _decimal_snapshot(item["price"], "precio", tope=Decimal("99999999.99"))
+        descuento = _decimal_snapshot(item.get("discount") or 0, "descuento", tope=Decimal("100"))
+        try:
+            qty = int(item.get("qty") or 1)
+        except (TypeError, ValueError):
+            raise ValueError("cantidad inválida")
+        if qty < 1:
+            raise ValueError("cantidad inválida")
+        return cls(
+            order=order,
+            producto_id=pid,
+            name=str(item.get("name") or "")[:200],
+            unit_price=precio,
+            discount=descuento,
+            qty=qty,
+            created_at=order.created_at,
+        )
+
+
+def _decimal_snapshot(valor, campo, tope):
+    """Decimal de 2 decimales entre 0 y `tope`, o ValueError."""
+    try:
+        numero = Decimal(str(valor))
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"{campo} inválido")
+    if not numero.is_finite() or not 0 <= numero <= tope:
+        raise ValueError(f"{campo} fuera de rango")
+    return numero.quantize(Decimal("0.01"))
+
+
+# ========= CARRITO (en BD, ver catalogo/carrito.py) =========
+class Cart(models.Model):
+    """
+    Carrito de un usuario o de un visitante (ligado a su sesión por
+    session["carrito_id"]). item_count y subtotal son contadores que se
+    actualizan con cada cambio de línea, para el badge del menú.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="carrito",
+    )
+    item_count = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Carrito"
+        verbose_name_plural = "Carritos"
+        indexes = [
+            # Limpieza de carritos de invitados abandonados
+            models.Index(fields=["user", "updated_at"], name="cart_user_fecha"),
+        ]
+
+    def __str__(self):
+        return f"Carrito #{self.pk} ({self.user or 'invitado'})"
+
+
+class CartLine(models.Model):
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name="lineas")
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name="+")
+    qty = models.PositiveIntegerField(default=1)
+    # precio_final al último cambio: solo alimenta Cart.subtotal
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        ordering = ["id"]
+        verbose_name = "Línea de carrito"
+        verbose_name_plural = "Líneas de carrito"
+        constraints = [
+            models.UniqueConstraint(fields=["cart", "producto"], name="cartline_unica"),
+        ]
+
+    def __str__(self):
+        return f"{self.qty} x {self.producto_id} (carrito #{self.cart_id})"
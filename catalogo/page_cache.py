@@ -0,0 +1,149 @@
+# catalogo/page_cache.py
+"""
+Cache de página completa para visitantes anónimos.
+
+La llave es URL + querystring normalizado + versión de las etiquetas del
+catálogo de las que depende la página (ver catalogo.cache), así que un
+cambio en Producto/Marca/... "purga" las páginas afectadas sin borrar nada.
+
+Lo que cambia por visitante se marca en los templates con
+{% hueco "nombre" %} (templatetags/huecos.py): al guardar se vacía y al
+servir se rellena con huecos/<nombre>.html renderizado para esa petición,
+al estilo ESI. El token CSRF de los formularios también se rellena aquí.
+"""
+import hashlib
+import re
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+
+from .cache import get_versiones, bump_version
+
+PAGE_CACHE_KEY = "catalogo:pagina:{}:{}"
+
+# El menú (base.html) aparece en todas las páginas
+MENU_TAGS = ("producto", "marca", "tematica", "categoria", "segmento")
+
+# Parámetros que no cambian el contenido
+IGNORAR_PARAMS = {"fbclid", "gclid", "_"}
+
+HUECO_RE = re.compile(r"<!--hueco:(\w+)-->.*?<!--/hueco-->", re.S)
+MARCAS_RE = re.compile(r"<!--(?:hueco:\w+|/hueco)-->")
+CSRF_RE = re.compile(r'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+CSRF_HUECO = "<!--hueco-csrf-->"
+
+
+def _activo():
+    return getattr(settings, "CATALOGO_PAGE_CACHE", True)
+
+
+def _timeout():
+    return getattr(settings, "CATALOGO_PAGE_CACHE_TIMEOUT", 600)
+
+
+def _querystring(request):
+    """Querystring ordenado, sin vacíos ni parámetros de tracking."""
+    pares = sorted(
+        (k, v) for k, valores in request.GET.lists() for v in valores
+        if v.strip() and k not in IGNORAR_PARAMS and not k.startswith("utm_")
+    )
+    return urlencode(pares)
+
+
+def _llave(request, tags):
+    versiones = ".".join(str(v) for v in get_versiones(tags))
+    url = f"{request.path}?{_querystring(request)}"
+    return PAGE_CACHE_KEY.format(
+        hashlib.md5(versiones.encode()).hexdigest(),
+        hashlib.md5(url.encode()).hexdigest(),
+    )
+
+
+def _cacheable(request):
+    # Una sesión anónima (p. ej. solo con el carrito) no impide usar el cache:
+    # el carrito y los mensajes van en huecos.
+    return (
+        _activo()
+        and request.method in ("GET", "HEAD")
+        and not request.user.is_authenticated
+    )
+
+
+def _guardable(response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and "private" not in response.get("Cache-Control", "")
+        and "no-store" not in response.get("Cache-Control", "")
+    )
+
+
+def _vaciar(html):
+    """Versión para guardar: huecos vacíos y sin token CSRF."""
+    html = HUECO_RE.sub(lambda m: f"<!--hueco:{m.group(1)}--><!--/hueco-->", html)
+    return CSRF_RE.sub(rf"\g<1>{CSRF_HUECO}\g<2>", html)
+
+
+def _rellenar(html, request):
+    """Rellena los huecos de una página guardada para la petición actual."""
+    html = HUECO_RE.sub(
+        lambda m: render_to_string(f"huecos/{m.group(1)}.html", request=request),
+        html,
+    )
+    if CSRF_HUECO in html:
+        html = html.replace(CSRF_HUECO, get_token(request))
+    return html
+
+
+def cache_pagina(*tags):
+    """
+    Decorador de vista: guarda la página renderizada para anónimos.
+    `tags` son las etiquetas del catálogo de las que depende además del menú.
+    """
+    tags = tuple(sorted(set(tags) | set(MENU_TAGS)))
+
+    def decorator(view):
+        @wraps(view)
+        def _wrapped(request, *args, **kwargs):
+            if not _cacheable(request):
+                return view(request, *args, **kwargs)
+
+            key = _llave(request, tags)
+            guardada = cache.get(key)
+            if guardada is not None:
+                response = HttpResponse(
+                    _rellenar(guardada["content"], request),
+                    content_type=guardada["content_type"],
+                )
+                response["X-Page-Cache"] = "HIT"
+                return response
+
+            response = view(request, *args, **kwargs)
+            if callable(getattr(response, "render", None)):
+                response = response.render()
+            if not _guardable(response):
+                return response
+
+            html = response.content.decode(response.charset)
+            cache.set(key, {
+                "content": _vaciar(html),
+                "content_type": response["Content-Type"],
+            }, _timeout())
+            response.content = MARCAS_RE.sub("", html)
+            response["X-Page-Cache"] = "MISS"
+            return response
+
+        return _wrapped
+
+    return decorator
+
+
+def purgar(*tags):
+    """Invalida todas las páginas que dependen de alguna de las etiquetas."""
+    bump_version(*tags)
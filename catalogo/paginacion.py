@@ -0,0 +1,226 @@
+# catalogo/paginacion.py
+"""
+Paginación por cursor (keyset) para los listados del catálogo.
+
+En vez de COUNT(*) + OFFSET n, cada página pide "las N filas que siguen a
+la última que viste" según el orden activo (p. ej. -creado, id): la
+consulta es un rango sobre el índice y cuesta lo mismo en la página 1 que
+en la 500. El cursor viaja en ?cursor= como token firmado y opaco (orden,
+dirección y valores de la fila frontera).
+
+El total es opcional y aproximado: se cuenta hasta CATALOGO_PAGINACION_TOPE
+filas ("más de 1000") en lugar de recorrer todo.
+
+Las vistas lo usan con PaginacionKeysetMixin; el template
+catalogo/_paginacion.html dibuja "Anterior / Siguiente" o los números de
+página según qué paginador haya tocado.
+"""
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q, QuerySet
+
+SALT = "catalogo.cursor"
+
+
+def _tope():
+    return getattr(settings, "CATALOGO_PAGINACION_TOPE", 1000)
+
+
+def _campo(nombre):
+    return nombre.lstrip("-")
+
+
+def _invertir(orden):
+    return tuple(_campo(c) if c.startswith("-") else f"-{c}" for c in orden)
+
+
+def _despues_de(orden, valores):
+    """Q de las filas estrictamente posteriores a `valores` en `orden`."""
+    condicion = Q()
+    for i, campo in enumerate(orden):
+        operador = "lt" if campo.startswith("-") else "gt"
+        parte = Q(**{f"{_campo(campo)}__{operador}": valores[i]})
+        for anterior, valor in zip(orden[:i], valores[:i]):
+            parte &= Q(**{_campo(anterior): valor})
+        condicion |= parte
+    return condicion
+
+
+class PaginaKeyset:
+    """Página con la misma cara que django.core.paginator.Page donde se puede."""
+
+    keyset = True
+
+    def __init__(self, object_list, paginator, cursor_siguiente=None, cursor_anterior=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.cursor_siguiente = cursor_siguiente
+        self.cursor_anterior = cursor_anterior
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.cursor_siguiente is not None
+
+    def has_previous(self):
+        return self.cursor_anterior is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    `object_list` es un QuerySet (rango por índice) o un
+    catalogo.snapshot.ListaPorIds (ya ordenado en memoria: el cursor guarda
+    el id frontera y su posición).
+    """
+
+    keyset = True
+
+    def __init__(self, object_list, orden, per_page, total=True):
+        self.object_list = object_list
+        self.orden = tuple(orden)
+        self.per_page = per_page
+        self.con_total = total
+        self.tope = _tope()
+        self._total = None
+
+    # =======================
+    # TOKENS
+    # =======================
+    def _firmar(self, direccion, valores, posicion=None):
+        return signing.dumps(
+            {"o": ",".join(self.orden), "d": direccion, "v": valores, "p": posicion},
+            salt=SALT, compress=True,
+        )
+
+    def _leer(self, cursor):
+        """(dirección, valores, posición) del token, o None si no sirve."""
+        if not cursor:
+            return None
+        try:
+            datos = signing.loads(cursor, salt=SALT)
+        except signing.BadSignature:
+            return None
+        if datos.get("o") != ",".join(self.orden) or datos.get("d") not in ("s", "a"):
+            return None  # el orden cambió: se empieza de nuevo
+        return datos["d"], datos["v"], datos.get("p")
+
+    def _valores(self, obj):
+        """Valores de la fila en el orden, serializables en JSON."""
+        salida = []
+        for campo in self.orden:
+            valor = getattr(obj, _campo(campo))
+            salida.append(valor if isinstance(valor, (int, type(None))) else str(valor))
+        return salida
+
+    def _convertir(self, valores):
+        modelo = self.object_list.model
+        return [modelo._meta.get_field(_campo(c)).to_python(v) for c, v in zip(self.orden, valores)]
+
+    # =======================
+    # PÁGINAS
+    # =======================
+    def pagina(self, cursor=None):
+        leido = self._leer(cursor)
+        if isinstance(self.object_list, QuerySet):
+            return self._pagina_queryset(leido)
+        return self._pagina_lista(leido)
+
+    def _pagina_queryset(self, leido):
+        n = self.per_page
+        qs = self.object_list
+        if leido is None:
+            filas = list(qs.order_by(*self.orden)[:n + 1])
+            hay_mas, hay_antes = len(filas) > n, False
+            filas = filas[:n]
+        else:
+            direccion, valores, _posicion = leido
+            valores = self._convertir(valores)
+            if direccion == "s":
+                filas = list(qs.filter(_despues_de(self.orden, valores)).order_by(*self.orden)[:n + 1])
+                hay_mas, hay_antes = len(filas) > n, True
+                filas = filas[:n]
+            else:
+                invertido = _invertir(self.orden)
+                filas = list(qs.filter(_despues_de(invertido, valores)).order_by(*invertido)[:n + 1])
+                hay_mas, hay_antes = True, len(filas) > n
+                filas = filas[:n][::-1]
+
+        return PaginaKeyset(
+            filas, self,
+            cursor_siguiente=self._firmar("s", self._valores(filas[-1])) if filas and hay_mas else None,
+            cursor_anterior=self._firmar("a", self._valores(filas[0])) if filas and hay_antes else None,
+        )
+
+    def _pagina_lista(self, leido):
+        n = self.per_page
+        ids = self.object_list.ids
+        if leido is None:
+            inicio = 0
+        else:
+            direccion, valores, posicion = leido
+            frontera = valores[-1]
+            try:
+                posicion = ids.index(frontera)
+            except ValueError:
+                pass  # el producto ya no está: vale la posición que traía el token
+            posicion = max(0, min(posicion or 0, len(ids)))
+            inicio = posicion + 1 if direccion == "s" else max(0, posicion - n)
+        fin = min(inicio + n, len(ids))
+        filas = self.object_list[inicio:fin]
+        return PaginaKeyset(
+            filas, self,
+            cursor_siguiente=self._firmar("s", [ids[fin - 1]], fin - 1) if fin < len(ids) else None,
+            cursor_anterior=self._firmar("a", [ids[inicio]], inicio) if inicio > 0 else None,
+        )
+
+    # =======================
+    # TOTAL
+    # =======================
+    @property
+    def count(self):
+        """Total (exacto hasta el tope); None si la vista no lo pide."""
+        if not self.con_total:
+            return None
+        if self._total is None:
+            if isinstance(self.object_list, QuerySet):
+                # COUNT sobre un LIMIT: cuesta lo mismo con 1.000 o 1.000.000 de filas
+                self._total = self.object_list.order_by().values("pk")[:self.tope + 1].count()
+            else:
+                self._total = len(self.object_list)
+        return self._total
+
+    @property
+    def count_exacto(self):
+        return self.count is not None and self.count <= self.tope
+
+
+class PaginacionKeysetMixin:
+    """
+    Para ListView: pagina por cursor cuando la vista tiene un orden keyset
+    (get_orden_keyset) y la paginación configurada es "keyset"; si no, el
+    Paginator de siempre con ?page=.
+    """
+
+    paginacion = None        # "keyset" | "numeros"; None = CATALOGO_PAGINACION
+    total_aproximado = True
+
+    def get_paginacion(self):
+        return self.paginacion or getattr(settings, "CATALOGO_PAGINACION", "keyset")
+
+    def get_orden_keyset(self):
+        return None
+
+    def paginate_queryset(self, queryset, page_size):
+        orden = self.get_orden_keyset()
+        if self.get_paginacion() != "keyset" or not orden:
+            return super().paginate_queryset(queryset, page_size)
+        paginator = KeysetPaginator(queryset, orden, page_size, total=self.total_aproximado)
+        pagina = paginator.pagina(self.request.GET.get("cursor"))
+        return paginator, pagina, pagina.object_list, pagina.has_other_pages()
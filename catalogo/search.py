@@ -0,0 +1,366 @@
+# catalogo/search.py
+"""
+Búsqueda de texto completo del catálogo.
+
+Cada Producto tiene un documento desnormalizado (ProductoBusqueda) con su
+nombre, la descripción sin HTML y los nombres de sus taxonomías, ya en
+minúsculas y sin acentos. Sobre ese documento cada motor usa su índice:
+
+  - PostgreSQL: GIN sobre to_tsvector('spanish', texto) (stemming nativo)
+  - MySQL:      FULLTEXT sobre `raices` (raíces calculadas en Python)
+  - SQLite:     tabla virtual FTS5 con las raíces
+  - otro:       LIKE sobre `raices` (sin índice, pero sin JOINs ni DISTINCT)
+"""
+import html
+import re
+import unicodedata
+
+from django.db import connection, transaction
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+from django.utils.html import strip_tags
+
+BUSQUEDA_TABLE = "catalogo_productobusqueda"
+FTS_TABLE = "catalogo_productobusqueda_fts"
+
+_NO_ALFANUM = re.compile(r"[^a-z0-9ñ]+")
+
+STOPWORDS = {
+    "a", "al", "con", "de", "del", "el", "en", "la", "las", "lo", "los",
+    "o", "para", "por", "se", "sin", "su", "un", "una", "y",
+}
+
+# Sufijos del más largo al más corto (stemming ligero para español)
+SUFIJOS = (
+    "amientos", "imientos", "aciones", "uciones", "amiento", "imiento",
+    "adoras", "adores", "ancias", "encias", "idades", "mente", "acion",
+    "ucion", "adora", "ador", "ancia", "encia", "idad", "ismos", "ismo",
+    "istas", "ista", "ables", "ibles", "able", "ible", "osos", "osas",
+    "oso", "osa", "ces", "es", "s",
+)
+
+
+# =======================
+# NORMALIZACIÓN
+# =======================
+def normalizar(texto):
+    """Quita HTML y acentos, pasa a minúsculas y deja solo letras/números."""
+    if not texto:
+        return ""
+    texto = html.unescape(strip_tags(str(texto))).lower()
+    # Conserva la ñ, quita el resto de diacríticos (á -> a, ü -> u)
+    texto = texto.replace("ñ", "\0")
+    texto = "".join(
+        c for c in unicodedata.normalize("NFKD", texto)
+        if not unicodedata.combining(c)
+    ).replace("\0", "ñ")
+    return _NO_ALFANUM.sub(" ", texto).strip()
+
+
+def raiz(palabra):
+    """Raíz aproximada de una palabra ya normalizada."""
+    if len(palabra) <= 3 or palabra.isdigit():
+        return palabra
+    for sufijo in SUFIJOS:
+        if palabra.endswith(sufijo) and len(palabra) - len(sufijo) >= 3:
+            palabra = palabra[: -len(sufijo)]
+            if sufijo == "ces":
+                palabra += "z"  # luces -> luz
+            break
+    if len(palabra) > 3 and palabra[-1] in "aeo":
+        palabra = palabra[:-1]
+    return palabra
+
+
+def raices(texto):
+    """Lista de raíces (sin stopwords) de un texto ya normalizado."""
+    return [raiz(p) for p in texto.split() if p not in STOPWORDS]
+
+
+def texto_documento(nombre, descripcion, nombres_taxonomias):
+    """Devuelve (texto, raices) del documento de búsqueda de un producto."""
+    partes = [nombre, descripcion, *nombres_taxonomias]
+    texto = " ".join(normalizar(p) for p in partes if p)
+    return texto, " ".join(raices(texto))
+
+
+def filas_documento(productos):
+    """
+    Genera (producto_id, texto, raices) para un queryset de productos.
+    Solo usa campos del modelo, así que sirve también con modelos históricos
+    dentro de migraciones.
+    """
+    productos = (productos
+                 .select_related("categoria", "marca", "estudio", "segmento")
+                 .prefetch_related("tematicas"))
+    for p in productos.iterator(chunk_size=500):
+        nombres = [
+            getattr(rel, "nombre", None)
+            for rel in (p.categoria, p.marca, p.estudio, p.segmento)
+        ]
+        nombres += [t.nombre for t in p.tematicas.all()]
+        texto, stems = texto_documento(p.nombre, p.descripcion, nombres)
+        yield p.pk, texto, stems
+
+
+# =======================
+# MOTORES
+# =======================
+def _con_limite(sql, params, limite):
+    """(sql, params) con LIMIT solo si se pidió uno."""
+    if limite is None:
+        return sql, params
+    return f"{sql} LIMIT %s", [*params, limite]
+
+
+class _Motor:
+    """Motor genérico: sin índice de texto, filtra con LIKE sobre las raíces."""
+
+    def crear_indice(self, cursor):
+        pass
+
+    def borrar_indice(self, cursor):
+        pass
+
+    def indexar(self, cursor, filas):
+        pass
+
+    def borrar(self, cursor, ids):
+        pass
+
+    def coincidencias(self, texto, stems):
+        """(sql, params) que selecciona los ids que coinciden, o None si no hay términos."""
+        if not stems:
+            return None
+        where = " AND ".join(["raices LIKE %s"] * len(stems))
+        return f"SELECT producto_id FROM {BUSQUEDA_TABLE} WHERE {where}", [f"%{s}%" for s in stems]
+
+    def orden(self, texto, stems):
+        """(ORDER BY, params) del ranking de buscar(), más relevante primero."""
+        return "", []
+
+    def relevancia(self, texto, stems, columna_id):
+        """
+        (sql, params) de una subconsulta correlacionada con el puntaje del
+        producto `columna_id` (mayor = más relevante), o None si el motor
+        no puntúa.
+        """
+        return None
+
+    def buscar(self, cursor, texto, stems, limite):
+        consulta = self.coincidencias(texto, stems)
+        if consulta is None:
+            return []
+        sql, params = consulta
+        orden, params_orden = self.orden(texto, stems)
+        cursor.execute(*_con_limite(f"{sql} {orden}".strip(), [*params, *params_orden], limite))
+        return [row[0] for row in cursor.fetchall()]
+
+
+class _MotorPostgres(_Motor):
+    TSVECTOR = "to_tsvector('spanish', texto)"
+    TSQUERY = "websearch_to_tsquery('spanish', %s)"
+
+    def crear_indice(self, cursor):
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS catalogo_busqueda_tsv ON {BUSQUEDA_TABLE} "
+            f"USING GIN ({self.TSVECTOR})"
+        )
+
+    def borrar_indice(self, cursor):
+        cursor.execute("DROP INDEX IF EXISTS catalogo_busqueda_tsv")
+
+    def coincidencias(self, texto, stems):
+        if not texto:
+            return None
+        return f"SELECT producto_id FROM {BUSQUEDA_TABLE} WHERE {self.TSVECTOR} @@ {self.TSQUERY}", [texto]
+
+    def orden(self, texto, stems):
+        return f"ORDER BY ts_rank({self.TSVECTOR}, {self.TSQUERY}) DESC, producto_id DESC", [texto]
+
+    def relevancia(self, texto, stems, columna_id):
+        return (f"SELECT ts_rank({self.TSVECTOR}, {self.TSQUERY}) FROM {BUSQUEDA_TABLE} "
+                f"WHERE producto_id = {columna_id}", [texto])
+
+
+class _MotorMySQL(_Motor):
+    MATCH = "MATCH(raices) AGAINST (%s IN BOOLEAN MODE)"
+
+    def crear_indice(self, cursor):
+        cursor.execute(
+            f"ALTER TABLE {BUSQUEDA_TABLE} ADD FULLTEXT INDEX catalogo_busqueda_ft (raices)"
+        )
+
+    def borrar_indice(self, cursor):
+        cursor.execute(f"ALTER TABLE {BUSQUEDA_TABLE} DROP INDEX catalogo_busqueda_ft")
+
+    def _consulta(self, stems):
+        return " ".join(f"+{s}*" for s in stems)
+
+    def coincidencias(self, texto, stems):
+        if not stems:
+            return None
+        return f"SELECT producto_id FROM {BUSQUEDA_TABLE} WHERE {self.MATCH}", [self._consulta(stems)]
+
+    def orden(self, texto, stems):
+        return f"ORDER BY {self.MATCH} DESC, producto_id DESC", [self._consulta(stems)]
+
+    def relevancia(self, texto, stems, columna_id):
+        return (f"SELECT {self.MATCH} FROM {BUSQUEDA_TABLE} WHERE producto_id = {columna_id}",
+                [self._consulta(stems)])
+
+
+class _MotorSQLite(_Motor):
+    def crear_indice(self, cursor):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            "USING fts5(raices, tokenize='unicode61 remove_diacritics 2')"
+        )
+
+    def borrar_indice(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+    def indexar(self, cursor, filas):
+        filas = list(filas)
+        self.borrar(cursor, [f[0] for f in filas])
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, raices) VALUES (%s, %s)",
+            [(pk, stems) for pk, _texto, stems in filas],
+        )
+
+    def borrar(self, cursor, ids):
+        ids = list(ids)
+        for i in range(0, len(ids), 500):
+            lote = ids[i:i + 500]
+            marcas = ", ".join(["%s"] * len(lote))
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({marcas})", lote)
+
+    def _consulta(self, stems):
+        return " ".join(f'"{s}"*' for s in stems)
+
+    def coincidencias(self, texto, stems):
+        if not stems:
+            return None
+        return f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [self._consulta(stems)]
+
+    def orden(self, texto, stems):
+        return f"ORDER BY bm25({FTS_TABLE}), rowid DESC", []
+
+    def relevancia(self, texto, stems, columna_id):
+        # bm25() es menor cuanto más relevante
+        return (f"SELECT -bm25({FTS_TABLE}) FROM {FTS_TABLE} "
+                f"WHERE {FTS_TABLE} MATCH %s AND rowid = {columna_id}", [self._consulta(stems)])
+
+
+def motor_para(conn=None):
+    vendor = (conn or connection).vendor
+    return {
+        "postgresql": _MotorPostgres,
+        "mysql": _MotorMySQL,
+        "sqlite": _MotorSQLite,
+    }.get(vendor, _Motor)()
+
+
+# =======================
+# SINCRONIZACIÓN
+# =======================
+def _guardar_lote(modelo_busqueda, filas, conn):
+    # MySQL no acepta unique_fields (usa ON DUPLICATE KEY sobre la PK)
+    unique = ["producto"] if conn.features.supports_update_conflicts_with_target else None
+    modelo_busqueda.objects.bulk_create(
+        [modelo_busqueda(producto_id=pk, texto=texto, raices=stems)
+         for pk, texto, stems in filas],
+        update_conflicts=True,
+        unique_fields=unique,
+        update_fields=["texto", "raices"],
+    )
+    with conn.cursor() as cursor:
+        motor_para(conn).indexar(cursor, filas)
+
+
+def guardar_documentos(modelo_busqueda, filas, conn=None, batch_size=500):
+    """Upsert de documentos + índice del motor, por lotes. Devuelve cuántos."""
+    conn = conn or connection
+    total = 0
+    lote = []
+    for fila in filas:
+        lote.append(fila)
+        if len(lote) >= batch_size:
+            _guardar_lote(modelo_busqueda, lote, conn)
+            total += len(lote)
+            lote = []
+    if lote:
+        _guardar_lote(modelo_busqueda, lote, conn)
+        total += len(lote)
+    return total
+
+
+def sincronizar(ids=None):
+    """
+    Regenera el documento de búsqueda de los productos indicados
+    (o de todo el catálogo si ids es None). Devuelve cuántos se indexaron.
+    """
+    from .models import Producto, ProductoBusqueda
+
+    qs = Producto.objects.all()
+    if ids is not None:
+        ids = list(ids)
+        if not ids:
+            return 0
+        qs = qs.filter(pk__in=ids)
+    return guardar_documentos(ProductoBusqueda, filas_documento(qs))
+
+
+def sincronizar_al_confirmar(ids):
+    """Igual que sincronizar(), pero tras el commit de la transacción actual."""
+    ids = list(ids)
+    if ids:
+        transaction.on_commit(lambda: sincronizar(ids))
+
+
+def borrar_documentos(ids):
+    with connection.cursor() as cursor:
+        motor_para().borrar(cursor, ids)
+
+
+# =======================
+# CONSULTA
+# =======================
+def _terminos(q):
+    texto = normalizar(q)
+    return texto, [s for s in raices(texto) if s]
+
+
+def buscar_ids(q, limite=None):
+    """
+    Ids de productos que coinciden con `q`, del más al menos relevante.
+    Sin tope por defecto: el listado filtra después (disponibles,
+    taxonomías, precio) y un corte previo perdería productos sin avisar.
+    Para filtrar un queryset conviene filtro_ids(): la lista no viaja a la BD.
+    """
+    texto, stems = _terminos(q)
+    with connection.cursor() as cursor:
+        return motor_para().buscar(cursor, texto, stems, limite)
+
+
+def filtro_ids(q):
+    """
+    Subconsulta con los ids que coinciden con `q`, para `pk__in=`. None si
+    `q` no deja ningún término (no coincide nada).
+    """
+    consulta = motor_para().coincidencias(*_terminos(q))
+    return RawSQL(*consulta) if consulta else None
+
+
+def relevancia(q, modelo):
+    """
+    Puntaje de cada fila de `modelo` (Producto) para `q`, mayor = más
+    relevante, para ordenar en la BD. None si el motor no puntúa.
+    """
+    motor, (texto, stems) = motor_para(), _terminos(q)
+    if motor.coincidencias(texto, stems) is None:
+        return None
+    tabla = connection.ops.quote_name(modelo._meta.db_table)
+    columna = connection.ops.quote_name(modelo._meta.pk.column)
+    consulta = motor.relevancia(texto, stems, f"{tabla}.{columna}")
+    return RawSQL(*consulta, output_field=FloatField()) if consulta else None
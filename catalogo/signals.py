@@ -0,0 +1,155 @@
+# catalogo/signals.py
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import carrito, imagenes, search
+from .cache import bump_version
+from .models import (
+    Producto, ProductoImagen, Marca, Estudio, Tematica, Categoria, Segmento, ProductoCambio,
+)
+
+# Modelos cuyo cambio invalida menú y caches del catálogo
+MODELOS_CATALOGO = (Producto, Marca, Estudio, Tematica, Categoria, Segmento)
+
+
+def _invalidar_catalogo(sender, **kwargs):
+    bump_version(sender._meta.model_name)
+
+
+for _modelo in MODELOS_CATALOGO:
+    post_save.connect(_invalidar_catalogo, sender=_modelo, dispatch_uid=f"catalogo_version_save_{_modelo.__name__}")
+    post_delete.connect(_invalidar_catalogo, sender=_modelo, dispatch_uid=f"catalogo_version_delete_{_modelo.__name__}")
+
+
+@receiver(m2m_changed, sender=Producto.tematicas.through, dispatch_uid="catalogo_version_tematicas")
+def _invalidar_tematicas(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        bump_version("producto", "tematica")
+
+
+# ========= Búsqueda: documentos al día de forma incremental =========
+TAXONOMIAS = (Marca, Estudio, Categoria, Segmento, Tematica)
+
+
+@receiver(post_save, sender=Producto, dispatch_uid="catalogo_busqueda_producto")
+def _busqueda_producto(sender, instance, **kwargs):
+    search.sincronizar_al_confirmar([instance.pk])
+
+
+@receiver(post_delete, sender=Producto, dispatch_uid="catalogo_busqueda_producto_borrado")
+def _busqueda_producto_borrado(sender, instance, **kwargs):
+    # El documento se borra en cascada; aquí solo se limpia el índice del motor
+    search.borrar_documentos([instance.pk])
+
+
+def _busqueda_taxonomia(sender, instance, created, **kwargs):
+    # Un alta no afecta a ningún producto; un cambio de nombre sí
+    if not created:
+        search.sincronizar_al_confirmar(instance.productos.values_list("pk", flat=True))
+
+
+for _modelo in TAXONOMIAS:
+    post_save.connect(_busqueda_taxonomia, sender=_modelo, dispatch_uid=f"catalogo_busqueda_{_modelo.__name__}")
+
+
+@receiver(m2m_changed, sender=Producto.tematicas.through, dispatch_uid="catalogo_busqueda_tematicas")
+def _busqueda_tematicas(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            search.sincronizar_al_confirmar([instance.pk])
+        return
+    # Lado Temática: los afectados son los productos
+    if action == "pre_clear":
+        instance._busqueda_ids = list(instance.productos.values_list("pk", flat=True))
+    elif action == "post_clear":
+        search.sincronizar_al_confirmar(getattr(instance, "_busqueda_ids", []))
+    elif action in ("post_add", "post_remove"):
+        search.sincronizar_al_confirmar(pk_set or [])
+
+
+# ========= Carga cruda (loaddata / fixtures) =========
+@receiver(pre_save, sender=Producto, dispatch_uid="catalogo_producto_crudo")
+def _producto_crudo(sender, instance, raw=False, **kwargs):
+    # Con raw=True Django no pasa por Producto.save() ni por pre_save() de los
+    # campos: auto_now no corre, los fixtures anteriores a `modificado` no lo
+    # traen y `precio_final` se quedaría en 0.00 (o con lo que diga el fixture)
+    if not raw:
+        return
+    if instance.modificado is None:
+        instance.modificado = instance.creado or timezone.now()
+    instance.precio_final = instance.calcular_precio_final()
+
+
+# ========= Bitácora de cambios (sincronización de la app) =========
+@receiver(post_save, sender=Producto, dispatch_uid="catalogo_cambio_producto")
+def _cambio_producto(sender, instance, created, **kwargs):
+    accion = ProductoCambio.CREADO if created else ProductoCambio.ACTUALIZADO
+    ProductoCambio.registrar([instance.pk], accion)
+
+
+@receiver(post_delete, sender=Producto, dispatch_uid="catalogo_cambio_producto_borrado")
+def _cambio_producto_borrado(sender, instance, **kwargs):
+    ProductoCambio.registrar([instance.pk], ProductoCambio.ELIMINADO)
+
+
+@receiver(m2m_changed, sender=Producto.tematicas.through, dispatch_uid="catalogo_cambio_tematicas")
+def _cambio_tematicas(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == "pre_clear":
+        instance._cambio_ids = list(instance.productos.values_list("pk", flat=True))
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        ids = [instance.pk]
+    elif action == "post_clear":
+        ids = getattr(instance, "_cambio_ids", [])
+    else:
+        ids = pk_set or []
+    ProductoCambio.registrar(ids, ProductoCambio.ACTUALIZADO)
+
+
+def _cambio_taxonomia(sender, instance, created, **kwargs):
+    # La app recibe el slug de marca/estudio/categoría/segmento de cada producto
+    if not created:
+        ids = list(instance.productos.values_list("pk", flat=True))
+        ProductoCambio.registrar(ids, ProductoCambio.ACTUALIZADO)
+
+
+for _modelo in (Marca, Estudio, Categoria, Segmento):
+    post_save.connect(_cambio_taxonomia, sender=_modelo, dispatch_uid=f"catalogo_cambio_{_modelo.__name__}")
+
+
+# ========= Imágenes: derivadas (thumb/card/zoom) al subir =========
+CAMPOS_IMAGEN = {
+    Producto: ("imagen",),
+    ProductoImagen: ("imagen",),
+    Marca: ("logo",),
+    Estudio: ("logo", "banner"),
+    Categoria: ("imagen",),
+    Tematica: ("icono",),
+    Segmento: ("icono",),
+}
+
+
+def encolar_derivadas(sender, instance, raw=False, **kwargs):
+    # loaddata (raw) suele traer rutas sin archivo; esas se generan a demanda
+    if raw:
+        return
+    nombres = [getattr(instance, c).name for c in CAMPOS_IMAGEN.get(sender, ()) if getattr(instance, c)]
+    if nombres:
+        transaction.on_commit(lambda: [imagenes.encolar(n) for n in nombres])
+
+
+for _modelo in CAMPOS_IMAGEN:
+    post_save.connect(encolar_derivadas, sender=_modelo, dispatch_uid=f"catalogo_derivadas_{_modelo.__name__}")
+
+
+@receiver(user_logged_in, dispatch_uid="catalogo_fusionar_carrito")
+def fusionar_carrito(sender, request, user, **kwargs):
+    # login() conserva los datos de la sesión al rotar la llave: el id del
+    # carrito de invitado sigue ahí.
+    if request is not None and hasattr(request, "session"):
+        carrito.fusionar_al_login(request, user)
@@ -0,0 +1,327 @@
+# catalogo/snapshot.py
+"""
+Foto columnar de los productos disponibles, compartida entre workers.
+
+Los productos disponibles (activo y con stock) son pocos y cambian poco,
+así que para filtrar y ordenar el listado no hace falta ir a la BD: basta
+con unas columnas de enteros. Se guardan en un archivo
+(CATALOGO_SNAPSHOT_PATH) que cada worker de gunicorn abre con mmap; el
+sistema operativo comparte esas páginas entre procesos y las columnas se
+leen con memoryview.cast() sin copiarlas.
+
+Formato: b"CATSNAP1" + largo (8 bytes) + cabecera JSON + columnas
+alineadas a 8 bytes. La cabecera trae la versión del catálogo con la que
+se armó, las posiciones de cada columna y los slugs/nombres de cada
+taxonomía. Las filas van ordenadas por -creado, id (el orden por
+defecto del listado), así que "más nuevos" es el orden de las filas.
+
+Cuando cambia la versión del catálogo (ver catalogo.cache) el primer
+worker que lo nota rearma el archivo: lo escribe aparte y lo renombra
+encima del anterior (os.replace es atómico). Quien ya tenía el viejo
+mapeado lo sigue leyendo hasta soltarlo.
+
+NumPy no es dependencia del proyecto: las columnas son `array` de la
+biblioteca estándar y las temáticas un bitset (int) por temática.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from array import array
+from datetime import timezone as dt_timezone
+from decimal import ROUND_CEILING, ROUND_FLOOR, Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache import get_versiones
+from .filtros import ACTIVADO, rango_precio
+from .models import Categoria, Estudio, Marca, Producto, Segmento, Tematica
+
+logger = logging.getLogger(__name__)
+
+MAGIA = b"CATSNAP1"
+TAGS = ("producto", "marca", "estudio", "categoria", "segmento", "tematica")
+LOCK_KEY = "catalogo:snapshot:lock"
+
+# columna -> tipo de array (todas int64)
+COLUMNAS = {
+    "id": "q",
+    "precio": "q",          # centavos
+    "precio_final": "q",    # centavos, con descuento (Producto.precio_final)
+    "descuento": "q",       # centésimas de punto porcentual
+    "stock": "q",
+    "creado": "q",          # microsegundos de época
+    "destacado": "q",
+    "destacado_orden": "q",
+    "categoria_id": "q",    # 0 = sin valor
+    "marca_id": "q",
+    "estudio_id": "q",
+    "segmento_id": "q",
+}
+# ?param= de catalogo.filtros -> (columna, modelo)
+TAXONOMIAS = {
+    "cat": ("categoria_id", Categoria),
+    "marca": ("marca_id", Marca),
+    "estudio": ("estudio_id", Estudio),
+    "segmento": ("segmento_id", Segmento),
+    "tematica": (None, Tematica),
+}
+
+
+def _ruta():
+    return Path(getattr(settings, "CATALOGO_SNAPSHOT_PATH",
+                        Path(settings.BASE_DIR) / "var" / "catalogo.snap"))
+
+
+def _alinear(n):
+    return (n + 7) // 8 * 8
+
+
+def _centavos(valor):
+    return int((valor * 100).quantize(Decimal("1")))
+
+
+# =======================
+# ESCRITURA
+# =======================
+def construir(version, ruta=None):
+    """Arma la foto con la BD actual y la deja en `ruta` (write-then-rename)."""
+    ruta = Path(ruta or _ruta())
+    campos = ["pk", "precio", "precio_final", "descuento", "stock", "creado", "destacado",
+              "destacado_orden", "categoria_id", "marca_id", "estudio_id", "segmento_id"]
+    filas = list(
+        Producto.objects.filter(activo=True, stock__gt=0)
+        .order_by("-creado", "pk")
+        .values_list(*campos)
+    )
+    columnas = {nombre: array(tipo) for nombre, tipo in COLUMNAS.items()}
+    posicion = {}
+    for i, (pk, precio, final, descuento, stock, creado, destacado, orden, *fks) in enumerate(filas):
+        posicion[pk] = i
+        descuento = descuento or Decimal("0")
+        creado_us = int(creado.astimezone(dt_timezone.utc).timestamp() * 1_000_000) if creado else 0
+        for nombre, valor in (
+            ("id", pk), ("precio", _centavos(precio)), ("precio_final", _centavos(final)),
+            ("descuento", _centavos(descuento)), ("stock", stock), ("creado", creado_us),
+            ("destacado", int(destacado)), ("destacado_orden", orden),
+        ):
+            columnas[nombre].append(valor)
+        for nombre, valor in zip(("categoria_id", "marca_id", "estudio_id", "segmento_id"), fks):
+            columnas[nombre].append(valor or 0)
+
+    # Temáticas: un bitset por temática sobre las posiciones de fila
+    bitsets = {}
+    for pk, tematica_id in Producto.tematicas.through.objects.values_list("producto_id", "tematica_id"):
+        if pk in posicion:
+            bitsets[tematica_id] = bitsets.get(tematica_id, 0) | (1 << posicion[pk])
+    ancho = (len(filas) + 7) // 8
+    for tematica_id in sorted(bitsets):
+        columnas[f"tematica:{tematica_id}"] = bitsets[tematica_id].to_bytes(ancho, "little")
+
+    claves = {}
+    for param, (_columna, modelo) in TAXONOMIAS.items():
+        mapa = {}
+        for pk, slug, nombre in modelo.objects.values_list("pk", "slug", "nombre"):
+            mapa.setdefault(nombre.lower(), pk)
+            mapa[slug.lower()] = pk
+        claves[param] = mapa
+
+    # Posiciones relativas al inicio de los datos (tras la cabecera, alineado a 8)
+    cabecera = {"version": list(version), "n": len(filas), "claves": claves, "columnas": {}}
+    datos = [(nombre, col.tobytes() if isinstance(col, array) else col) for nombre, col in columnas.items()]
+    desplazamiento = 0
+    for nombre, crudo in datos:
+        cabecera["columnas"][nombre] = [COLUMNAS.get(nombre, "B"), desplazamiento, len(crudo)]
+        desplazamiento = _alinear(desplazamiento + len(crudo))
+    cabecera_bytes = json.dumps(cabecera).encode()
+    base = _alinear(len(MAGIA) + 8 + len(cabecera_bytes))
+
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    fd, temporal = tempfile.mkstemp(dir=ruta.parent, prefix=ruta.name, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as salida:
+            salida.write(MAGIA + struct.pack("<Q", len(cabecera_bytes)) + cabecera_bytes)
+            for nombre, crudo in datos:
+                _tipo, desplazamiento, _largo = cabecera["columnas"][nombre]
+                salida.write(b"\0" * (base + desplazamiento - salida.tell()))
+                salida.write(crudo)
+            salida.flush()
+            os.fsync(salida.fileno())
+        os.replace(temporal, ruta)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.unlink(temporal)
+        raise
+    return ruta
+
+
+# =======================
+# LECTURA
+# =======================
+class Snapshot:
+    """Foto mapeada en memoria (solo lectura)."""
+
+    def __init__(self, ruta):
+        with open(ruta, "rb") as archivo:
+            self._mapa = mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mapa[:len(MAGIA)] != MAGIA:
+            raise ValueError(f"{ruta} no es una foto del catálogo")
+        (largo,) = struct.unpack_from("<Q", self._mapa, len(MAGIA))
+        inicio = len(MAGIA) + 8
+        cabecera = json.loads(self._mapa[inicio:inicio + largo])
+        base = _alinear(inicio + largo)
+        self.version = tuple(cabecera["version"])
+        self.n = cabecera["n"]
+        self.claves = cabecera["claves"]
+        self._columnas = {
+            nombre: (tipo, base + d, largo) for nombre, (tipo, d, largo) in cabecera["columnas"].items()
+        }
+        vista = memoryview(self._mapa)
+        # memoryview.cast: columnas de enteros sin copiar el archivo
+        self.col = {
+            nombre: vista[d:d + largo].cast(tipo)
+            for nombre, (tipo, d, largo) in self._columnas.items()
+            if nombre in COLUMNAS
+        }
+
+    def tematica(self, tematica_id):
+        """Bitset (int) de filas con esa temática."""
+        datos = self._columnas.get(f"tematica:{tematica_id}")
+        if datos is None:
+            return 0
+        _tipo, d, largo = datos
+        return int.from_bytes(self._mapa[d:d + largo], "little")
+
+    def _resolver(self, param, valor):
+        return self.claves[param].get(valor.strip().lower(), -1)
+
+    def filtrar(self, f, ids_busqueda=None):
+        """Filas (posiciones) que cumplen los filtros de catalogo.filtros.leer_filtros."""
+        filas = range(self.n)
+        ids_col = self.col["id"]
+        if ids_busqueda is not None:
+            buscados = set(ids_busqueda)
+            filas = [i for i in filas if ids_col[i] in buscados]
+        for param in ("cat", "marca", "estudio", "segmento"):
+            if f.get(param):
+                columna, objetivo = self.col[TAXONOMIAS[param][0]], self._resolver(param, f[param])
+                filas = [i for i in filas if columna[i] == objetivo]
+        if f.get("tematica"):
+            bits = self.tematica(self._resolver("tematica", f["tematica"]))
+            filas = [i for i in filas if bits >> i & 1]
+        if f.get("destacados") in ACTIVADO:
+            destacado = self.col["destacado"]
+            filas = [i for i in filas if destacado[i]]
+        elif f.get("ofertas") in ACTIVADO:
+            descuento = self.col["descuento"]
+            filas = [i for i in filas if descuento[i] > 0]
+        minimo, maximo = rango_precio(f)
+        if minimo is not None or maximo is not None:
+            final = self.col["precio_final"]
+            # Límites a centavos enteros sin ampliar el rango (10.005 -> desde 1001)
+            desde = int((minimo * 100).to_integral_value(ROUND_CEILING)) if minimo is not None else None
+            hasta = int((maximo * 100).to_integral_value(ROUND_FLOOR)) if maximo is not None else None
+            filas = [i for i in filas
+                     if (desde is None or final[i] >= desde) and (hasta is None or final[i] <= hasta)]
+        return list(filas)
+
+    def ordenar(self, filas, f, ids_busqueda=None):
+        """Ids de producto en el orden del listado (ver catalogo.filtros.ordenar_productos)."""
+        ids_col = self.col["id"]
+        if f.get("orden") in ("precio_asc", "precio_desc"):
+            final = self.col["precio_final"]
+            filas = sorted(filas, key=lambda i: (final[i], ids_col[i]), reverse=f["orden"] == "precio_desc")
+        elif f.get("destacados") in ACTIVADO:
+            orden = self.col["destacado_orden"]
+            filas = sorted(filas, key=lambda i: (orden[i], i))
+        elif f.get("ofertas") in ACTIVADO:
+            descuento = self.col["descuento"]
+            filas = sorted(filas, key=lambda i: (-descuento[i], i))
+        elif ids_busqueda:
+            rango = {pk: pos for pos, pk in enumerate(ids_busqueda)}
+            filas = sorted(filas, key=lambda i: rango[ids_col[i]])
+        # por defecto: el orden de las filas ya es -creado, id
+        return [ids_col[i] for i in filas]
+
+
+_local = threading.Lock()
+_actual = None
+
+
+def _abrir(ruta):
+    try:
+        return Snapshot(ruta)
+    except (OSError, ValueError) as exc:
+        logger.warning("Foto del catálogo ilegible (%s): %s", ruta, exc)
+        return None
+
+
+def actual():
+    """
+    Foto al día con la versión del catálogo. La mapea (o rearma) si cambió;
+    si otro proceso la está rearmando, sigue con la anterior.
+    """
+    global _actual
+    version = get_versiones(TAGS)
+    if _actual is not None and _actual.version == version:
+        return _actual
+
+    with _local:
+        if _actual is not None and _actual.version == version:
+            return _actual
+        ruta = _ruta()
+        # ¿Otro worker ya la rearmó?
+        foto = _abrir(ruta) if ruta.exists() else None
+        if foto is None or foto.version != version:
+            propio = cache.add(LOCK_KEY, 1, 60)
+            if not propio and foto is not None:
+                _actual = foto  # otro proceso la está armando: la anterior sirve mientras
+                return _actual
+            try:
+                construir(version, ruta)
+            finally:
+                if propio:
+                    cache.delete(LOCK_KEY)
+            foto = _abrir(ruta)
+        _actual = foto
+        return _actual
+
+
+def activo():
+    return getattr(settings, "CATALOGO_SNAPSHOT", False)
+
+
+def ids_listado(f, ids_busqueda=None):
+    """Ids de productos del listado, filtrados y ordenados sin ir a la BD."""
+    foto = actual()
+    return foto.ordenar(foto.filtrar(f, ids_busqueda), f, ids_busqueda)
+
+
+class ListaPorIds:
+    """
+    Secuencia perezosa para el Paginator: sabe su largo por la foto y solo
+    trae de la BD los productos de la página pedida, en el mismo orden.
+    """
+
+    def __init__(self, ids, queryset):
+        self.ids = ids
+        self.queryset = queryset
+
+    def __len__(self):
+        return len(self.ids)
+
+    def count(self):
+        return len(self.ids)
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        pagina = self.ids[item]
+        # Sin ORDER BY: el orden ya lo da la foto
+        por_id = self.queryset.order_by().in_bulk(pagina)
+        return [por_id[pk] for pk in pagina if pk in por_id]
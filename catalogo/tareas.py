@@ -0,0 +1,24 @@
+# catalogo/tareas.py
+"""Tareas del catálogo para la cola (`manage.py run_worker`)."""
+from django.conf import settings
+
+from tareas.cola import encolar, tarea
+
+from .campanias import enviar_campania
+from .models import NewsletterCampaign
+
+
+@tarea("catalogo.enviar_campania")
+def enviar_campania_tarea(campania_id):
+    """
+    Envía un tramo de la campaña y, si queda trabajo, se vuelve a encolar:
+    así ninguna ejecución pasa de TAREAS_TIMEOUT y el worker no la da por
+    perdida a mitad de un envío largo.
+    """
+    campania = NewsletterCampaign.objects.filter(pk=campania_id, status="SENDING").first()
+    if campania is None:  # pausada, enviada o borrada
+        return
+    campania = enviar_campania(campania, max_segundos=getattr(settings, "TAREAS_TIMEOUT", 600) / 2)
+    if campania.status == "SENDING":
+        encolar(enviar_campania_tarea, args=[campania.pk],
+                clave=f"campania:{campania.pk}:{campania.last_subscriber_id}")
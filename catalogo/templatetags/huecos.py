@@ -0,0 +1,17 @@
+# catalogo/templatetags/huecos.py
+from django import template
+from django.utils.safestring import mark_safe
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def hueco(context, nombre):
+    """
+    Renderiza huecos/<nombre>.html marcado como fragmento por visitante.
+    Ver catalogo.page_cache: la página se guarda sin este contenido y se
+    rellena en cada petición.
+    """
+    fragmento = context.template.engine.get_template(f"huecos/{nombre}.html")
+    html = fragmento.render(context)
+    return mark_safe(f"<!--hueco:{nombre}-->{html}<!--/hueco-->")
@@ -0,0 +1,55 @@
+# catalogo/templatetags/imagenes.py
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from catalogo.imagenes import RENDICIONES, srcset, url_rendicion
+
+register = template.Library()
+
+
+def _url_original(archivo):
+    nombre = getattr(archivo, "name", archivo)
+    if not nombre:
+        return ""
+    try:
+        return default_storage.url(nombre)
+    except ValueError:
+        return ""
+
+
+@register.simple_tag
+def imagen_url(archivo, rendicion="card"):
+    """
+    URL de una rendición (WebP) o del original si aún no existe.
+        <img src="{% imagen_url marca.logo 'thumb' %}">
+    """
+    return url_rendicion(archivo, rendicion)
+
+
+@register.simple_tag
+def imagen(archivo, rendicion="card", alt="", sizes=None, **attrs):
+    """
+    <picture> con srcset AVIF/WebP de las rendiciones hasta `rendicion`;
+    el <img> de respaldo apunta al original. Atributos extra (class, style,
+    loading...) van al <img>.
+        {% imagen p.portada "card" alt=p.nombre class="card-img-top" %}
+    """
+    original = _url_original(archivo)
+    if not original:
+        return ""
+    attrs.setdefault("loading", "lazy")
+    extra = format_html_join("", ' {}="{}"', attrs.items())
+    img = format_html('<img src="{}" alt="{}"{}>', original, alt, extra)
+
+    sets = srcset(archivo, rendicion)
+    if not sets:
+        return img
+    ancho = RENDICIONES[rendicion]
+    sizes = sizes or f"(max-width: {ancho}px) 100vw, {ancho}px"
+    fuentes = format_html_join(
+        "", '<source type="image/{}" srcset="{}" sizes="{}">',
+        ((formato, valor, sizes) for formato, valor in sets.items()),
+    )
+    # display:contents: el <picture> no altera el layout pensado para <img>
+    return format_html('<picture style="display:contents">{}{}</picture>', fuentes, img)
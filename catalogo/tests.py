@@ -1,3 +1,1233 @@
-from django.test import TestCase
+# catalogo/tests.py
+"""
+Planes de ejecución de las vistas del catálogo.
 
-# Create your tests here.
+Se recorren las vistas con datos de prueba, se capturan sus consultas y se
+pide el plan de cada una (EXPLAIN QUERY PLAN en SQLite, EXPLAIN (FORMAT
+JSON) en PostgreSQL). La prueba falla si una consulta sobre las tablas
+grandes (productos, galería, producto-temática) recorre la tabla completa u
+ordena sus filas en un paso aparte (filesort / TEMP B-TREE) en lugar de
+leer el índice ya ordenado, o si necesita un DISTINCT aparte. Las tablas
+de taxonomía son chicas y se listan enteras: ahí un recorrido completo, o
+ordenar los conteos por nombre, es lo correcto.
+
+En MySQL no hay índices parciales (ver IndiceDisponible) y no se revisa.
+
+Para ver todos los planes: DJ_EXPLAIN_VERBOSE=true python manage.py test catalogo
+"""
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, models, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import ajustes, campanias, carrito, imagenes
+from . import cache as cache_catalogo
+from .checkout import StockInsuficiente, crear_pedido, reservar_stock
+from . import search, snapshot, views
+from .cache import bump_version, cached_query, get_version, get_versiones
+from .facetas import DIMENSIONES, PARAMETROS, IndiceFacetas, facetas, facetas_de_filtros
+from .filtros import FILTROS, filtrar_productos, leer_filtros, ordenar_productos
+from .forms import ReglaAjusteForm
+from .importar import Importador, leer_csv
+from .models import (
+    Cart, Categoria, Estudio, Marca, NewsletterCampaign, NewsletterSubscriber, Order, Producto,
+    ProductoCambio, ProductoImagen, Segmento, Tematica,
+)
+
+TABLAS_GRANDES = ("catalogo_producto", "catalogo_productoimagen", "catalogo_producto_tematicas")
+
+# Consultas que ordenan a propósito en memoria: (vista, fragmento del SQL)
+PERMITIDAS = [
+    # ROW_NUMBER() por categoría en el home: una fila por categoría de portada,
+    # el orden de la ventana se arma sobre pocas filas ya filtradas por índice
+    ("inicio", "ROW_NUMBER() OVER"),
+    # Productos de una temática: el filtro está en la tabla intermedia, ningún
+    # índice de producto lo cubre; se ordenan solo los de esa temática (top-N)
+    ("tematica_detalle", '"catalogo_producto_tematicas"."tematica_id" = '),
+]
+
+VERBOSE = os.getenv("DJ_EXPLAIN_VERBOSE", "false").lower() == "true"
+
+
+# =======================
+# PLANES POR MOTOR
+# =======================
+def _plan_sqlite(cursor, sql, params):
+    cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+    return [fila[-1] for fila in cursor.fetchall()]
+
+
+def _ordena_tabla_grande(sql):
+    """¿El ORDER BY final es por columnas de una tabla grande?"""
+    _, _, orden = sql.rpartition("ORDER BY")
+    return any(f'"{t}".' in orden or f"`{t}`." in orden for t in TABLAS_GRANDES)
+
+
+def _problemas_sqlite(detalles, sql):
+    problemas = []
+    for detalle in detalles:
+        # "SCAN catalogo_producto" sin "USING INDEX" = recorrido completo
+        m = re.match(r"SCAN (\w+)(?: AS \w+)?$", detalle)
+        if m and m.group(1) in TABLAS_GRANDES:
+            problemas.append(f"recorrido completo: {detalle}")
+        if "USE TEMP B-TREE FOR DISTINCT" in detalle:
+            problemas.append(f"DISTINCT aparte: {detalle}")
+        if "USE TEMP B-TREE FOR ORDER BY" in detalle and _ordena_tabla_grande(sql):
+            problemas.append(f"ordenamiento aparte: {detalle}")
+    return problemas
+
+
+def _nodos_pg(nodo):
+    yield nodo
+    for hijo in nodo.get("Plans", []):
+        yield from _nodos_pg(hijo)
+
+
+def _plan_pg(cursor, sql, params):
+    # Sin seq scans "baratos": con pocas filas de prueba el planner los preferiría
+    cursor.execute("SET LOCAL enable_seqscan = off")
+    cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return list(_nodos_pg(plan[0]["Plan"]))
+
+
+def _problemas_pg(nodos, sql):
+    problemas = []
+    for nodo in nodos:
+        tipo = nodo["Node Type"]
+        if tipo == "Seq Scan" and nodo.get("Relation Name") in TABLAS_GRANDES:
+            problemas.append(f"recorrido completo: Seq Scan on {nodo['Relation Name']}")
+        if tipo == "Unique":
+            problemas.append("DISTINCT aparte: Unique")
+        if tipo in ("Sort", "Incremental Sort"):
+            claves = nodo.get("Sort Key", [])
+            if any(clave.startswith(t + ".") for clave in claves for t in TABLAS_GRANDES):
+                problemas.append(f"ordenamiento aparte: {tipo} ({', '.join(claves)})")
+    return problemas
+
+
+MOTORES = {
+    "sqlite": (_plan_sqlite, _problemas_sqlite),
+    "postgresql": (_plan_pg, _problemas_pg),
+}
+
+
+# =======================
+# PRUEBA
+# =======================
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                        "LOCATION": "planes-catalogo"}},
+    ALLOWED_HOSTS=["testserver"],
+)
+class PlanesCatalogoTests(TestCase):
+    """Cada vista del catálogo se sirve con índices, sin recorridos ni filesort."""
+
+    @classmethod
+    def setUpTestData(cls):
+        slugs = [slug for slug, *_ in getattr(settings, "CATALOGO_HOME_CATEGORIAS", [])] or ["playeras"]
+        cls.categorias = [Categoria.objects.create(nombre=s.title(), slug=s) for s in slugs]
+        cls.marca = Marca.objects.create(nombre="Marca Uno", slug="marca-uno")
+        otra = Marca.objects.create(nombre="Marca Dos", slug="marca-dos")
+        cls.estudio = Estudio.objects.create(nombre="Estudio", slug="estudio")
+        cls.segmento = Segmento.objects.create(nombre="Unisex", slug="unisex")
+        cls.tematica = Tematica.objects.create(nombre="Anime", slug="anime")
+
+        ahora = timezone.now()
+        productos = []
+        for i in range(60):
+            productos.append(Producto(
+                nombre=f"Producto {i}",
+                slug=f"producto-{i}",
+                precio=Decimal("100.00") + i,
+                descuento=Decimal(i % 4 * 10),
+                stock=0 if i % 7 == 0 else 5,
+                activo=i % 11 != 0,
+                destacado=i % 5 == 0,
+                destacado_orden=i,
+                categoria=cls.categorias[i % len(cls.categorias)],
+                marca=cls.marca if i % 2 else otra,
+                estudio=cls.estudio,
+                segmento=cls.segmento,
+            ))
+        Producto.objects.bulk_create(productos)
+        for i, producto in enumerate(Producto.objects.order_by("pk")):
+            Producto.objects.filter(pk=producto.pk).update(creado=ahora - timedelta(hours=i))
+            if i % 3 == 0:
+                producto.tematicas.add(cls.tematica)
+                ProductoImagen.objects.create(producto=producto, imagen=f"productos/galeria/{i}.jpg")
+
+    def setUp(self):
+        # Cada URL se visita una vez: con el cache vacío todas sus consultas corren
+        cache.clear()
+        # El índice de facetas y la foto del catálogo leen todo al armarse (a
+        # propósito); en las vistas solo se consultan
+        carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        ajustes = override_settings(CATALOGO_SNAPSHOT_PATH=os.path.join(carpeta.name, "catalogo.snap"))
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        facetas()
+        snapshot.actual()
+
+    def _urls(self):
+        return [
+            ("inicio", reverse("inicio")),
+            ("producto_lista", reverse("producto_lista")),
+            ("producto_lista", reverse("producto_lista") + "?destacados=1"),
+            ("producto_lista", reverse("producto_lista") + "?ofertas=1"),
+            ("producto_lista", reverse("producto_lista") + "?cat=" + self.categorias[0].slug),
+            ("producto_lista", reverse("producto_lista") + "?page=2"),
+            ("producto_lista", reverse("producto_lista") + "?orden=precio_asc"),
+            ("producto_lista", reverse("producto_lista") + "?orden=precio_desc&precio_min=110&precio_max=150"),
+            ("marcas_lista", reverse("marcas_lista")),
+            ("marca_detalle", reverse("marca_detalle", args=[self.marca.slug])),
+            ("tematica_detalle", reverse("tematica_detalle", args=[self.tematica.slug])),
+            ("producto_detalle", reverse("producto_detalle", args=["producto-1"])),
+        ]
+
+    def _permitida(self, vista, sql):
+        return any(v == vista and fragmento in sql for v, fragmento in PERMITIDAS)
+
+    def test_sin_recorridos_completos_ni_filesort(self):
+        self._revisar_planes()
+
+    @override_settings(CATALOGO_SNAPSHOT=False)
+    def test_listado_sin_foto(self):
+        # Sin la foto en memoria el listado filtra y ordena en la BD
+        self._revisar_planes()
+
+    def _revisar_planes(self):
+        if connection.vendor not in MOTORES:
+            self.skipTest(f"Sin revisión de planes para {connection.vendor}")
+        explicar, revisar = MOTORES[connection.vendor]
+
+        fallas = []
+        pendientes = self._urls()
+        while pendientes:
+            vista, url = pendientes.pop(0)
+            with CaptureQueriesContext(connection) as capturadas:
+                respuesta = self.client.get(url)
+            self.assertEqual(respuesta.status_code, 200, url)
+            # La página siguiente por cursor también tiene que ir por índice
+            pagina = (respuesta.context or {}).get("page_obj")
+            if getattr(pagina, "keyset", False) and pagina.has_next() and "cursor=" not in url:
+                separador = "&" if "?" in url else "?"
+                pendientes.append((vista, f"{url}{separador}cursor={pagina.cursor_siguiente}"))
+
+            for consulta in capturadas.captured_queries:
+                sql = consulta["sql"]
+                if not sql.lstrip().upper().startswith("SELECT"):
+                    continue
+                if not any(f'"{t}"' in sql or f"`{t}`" in sql for t in TABLAS_GRANDES):
+                    continue
+                # captured_queries trae el SQL con los parámetros ya interpolados
+                with connection.cursor() as cursor:
+                    plan = explicar(cursor, sql, None)
+                problemas = [] if self._permitida(vista, sql) else revisar(plan, sql)
+                if VERBOSE or problemas:
+                    print(f"\n[{url}] {sql[:200]}")
+                    for linea in plan:
+                        print("   ", linea if isinstance(linea, str) else linea["Node Type"])
+                fallas += [f"{url}: {p}\n    {sql[:300]}" for p in problemas]
+
+        self.assertFalse(fallas, "Consultas sin índice:\n" + "\n".join(fallas))
+
+
+# =======================
+# PORTADAS EN LISTADOS
+# =======================
+@override_settings(CATALOGO_SNAPSHOT=False, CATALOGO_PAGE_CACHE=False,
+                   CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                                       "LOCATION": "portadas"}})
+class PortadasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.categoria = Categoria.objects.create(nombre="Playeras", slug="playeras")
+
+    def setUp(self):
+        cache.clear()
+        # Las derivadas no importan aquí (y no se lanza el pool de hilos)
+        encolar = mock.patch("catalogo.imagenes.encolar")
+        encolar.start()
+        self.addCleanup(encolar.stop)
+
+    def _productos(self, n, desde=0):
+        for i in range(desde, desde + n):
+            p = Producto.objects.create(nombre=f"Playera {i}", slug=f"playera-{i}", precio=Decimal("10"),
+                                        stock=1, categoria=self.categoria)
+            for orden in (2, 1):
+                ProductoImagen.objects.create(producto=p, imagen=f"productos/galeria/{i}-{orden}.jpg", orden=orden)
+
+    def _consultas(self, url):
+        self.client.get(url)  # menú, facetas y demás caches ya armados
+        with CaptureQueriesContext(connection) as capturadas:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(capturadas)
+
+    def test_portada_anotada_sin_consultas(self):
+        self._productos(1)
+        p = Producto.objects.con_portada().get()
+        with self.assertNumQueries(0):
+            self.assertEqual(p.portada().name, "productos/galeria/0-1.jpg")
+
+    def test_listado_no_crece_con_las_tarjetas(self):
+        url = reverse("producto_lista")
+        self._productos(2)
+        pocas = self._consultas(url)
+        self._productos(10, desde=2)
+        self.assertEqual(self._consultas(url), pocas)
+
+
+class HeroHomeTests(TestCase):
+    def setUp(self):
+        rendicion = mock.patch("catalogo.views.url_rendicion", side_effect=lambda img, r: img.name)
+        rendicion.start()
+        self.addCleanup(rendicion.stop)
+
+    def _categoria(self, slug, destacados=(False, True, False)):
+        categoria = Categoria.objects.create(nombre=slug.title(), slug=slug)
+        ahora = timezone.now()
+        for i, destacado in enumerate(destacados):
+            p = Producto.objects.create(nombre=f"{slug} {i}", slug=f"{slug}-{i}", precio=Decimal("10"),
+                                        stock=1, categoria=categoria, destacado=destacado)
+            Producto.objects.filter(pk=p.pk).update(creado=ahora - timedelta(days=i))
+            ProductoImagen.objects.create(producto=p, imagen=f"productos/galeria/{slug}-{i}.jpg")
+        return slug
+
+    def test_un_producto_por_categoria_en_una_consulta(self):
+        slugs = [self._categoria("playeras"), self._categoria("hoodies", (False, False, False)),
+                 self._categoria("calzado")]
+        with self.assertNumQueries(1):
+            heroes = views._hero_por_categoria([*slugs, "vacia"])
+        # El destacado gana aunque haya uno más nuevo; sin destacados, el más nuevo
+        self.assertEqual(heroes, {
+            "playeras": "productos/galeria/playeras-1.jpg",
+            "hoodies": "productos/galeria/hoodies-0.jpg",
+            "calzado": "productos/galeria/calzado-1.jpg",
+            "vacia": None,
+        })
+
+
+# =======================
+# CACHE DE PÁGINA
+# =======================
+@override_settings(CATALOGO_SNAPSHOT=False, CATALOGO_PAGE_CACHE=True,
+                   CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                                       "LOCATION": "paginas"}})
+class CachePaginaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        categoria = Categoria.objects.create(nombre="Tazas", slug="tazas")
+        cls.taza = Producto.objects.create(nombre="Taza", slug="taza", precio=Decimal("10"),
+                                           stock=5, categoria=categoria)
+        cls.url = reverse("producto_lista")
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonimo_miss_y_luego_hit_sin_marcas(self):
+        primera = self.client.get(self.url)
+        segunda = self.client.get(self.url)
+        self.assertEqual((primera["X-Page-Cache"], segunda["X-Page-Cache"]), ("MISS", "HIT"))
+        self.assertNotIn(b"<!--hueco", segunda.content)
+        self.assertIn(b"Taza", segunda.content)
+
+    def test_huecos_se_rellenan_por_visitante(self):
+        self.client.get(self.url)  # guardada por un visitante sin carrito
+        otro = self.client_class()
+        otro.get(reverse("carrito_agregar", args=[self.taza.pk]), {"qty": 2})
+        con_carrito = otro.get(self.url)
+        sin_carrito = self.client.get(self.url)
+        self.assertEqual((con_carrito["X-Page-Cache"], sin_carrito["X-Page-Cache"]), ("HIT", "HIT"))
+        self.assertIn(b'rounded-pill">2</span>', con_carrito.content)
+        self.assertNotIn(b'rounded-pill">2</span>', sin_carrito.content)
+
+    def test_cambio_de_producto_invalida(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Producto.objects.filter(pk=self.taza.pk).update(nombre="Taza grande")
+        respuesta = self.client.get(self.url)
+        self.assertEqual(respuesta["X-Page-Cache"], "MISS")
+        self.assertIn(b"Taza grande", respuesta.content)
+
+    def test_con_sesion_no_se_cachea(self):
+        usuario = get_user_model().objects.create_user("ana", "ana@example.com", "x")
+        self.client.force_login(usuario)
+        self.assertFalse(self.client.get(self.url).has_header("X-Page-Cache"))
+
+
+# =======================
+# AVISOS DE ÍNDICES
+# =======================
+class AvisoIndicesParcialesTests(TestCase):
+    """Sin índices parciales, W037 sale solo para índices sin respaldo."""
+
+    def _avisos(self):
+        with mock.patch.object(connection.features, "supports_partial_indexes", False):
+            return [e.id for e in Producto.check(databases=["default"])]
+
+    def test_indice_disponible_no_avisa(self):
+        self.assertNotIn("models.W037", self._avisos())
+
+    def test_otro_indice_con_condicion_si_avisa(self):
+        suelto = models.Index(fields=["nombre"], name="prod_nombre_activo", condition=models.Q(activo=True))
+        with mock.patch.object(Producto._meta, "indexes", [*Producto._meta.indexes, suelto]):
+            self.assertIn("models.W037", self._avisos())
+
+
+# =======================
+# VERSIONES DEL CACHE
+# =======================
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                                       "LOCATION": "versiones-catalogo"}})
+class VersionesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_bump_espera_al_commit_y_sube_una_vez(self):
+        antes = get_version("producto")
+        with mock.patch("catalogo.cache._bump", wraps=cache_catalogo._bump) as bump:
+            with self.captureOnCommitCallbacks(execute=True):
+                for _ in range(3):
+                    bump_version("producto")
+                self.assertEqual(get_version("producto"), antes)
+        self.assertEqual(bump.call_count, 1)
+        self.assertLessEqual({"producto", "catalogo"}, bump.call_args.args[0])
+        self.assertGreater(get_version("producto"), antes)
+
+    def test_rollback_de_savepoint_no_pierde_etiquetas(self):
+        antes = get_version("marca")
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    bump_version("marca")
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            bump_version("producto")
+        # Lo del savepoint revertido sale igual (de más, nunca de menos)
+        self.assertGreater(get_version("marca"), antes)
+
+
+# =======================
+# CONSULTAS CACHEADAS
+# =======================
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                                       "LOCATION": "consultas-cacheadas"}})
+class CachedQueryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_estampida_calcula_una_sola_vez(self):
+        calculos = []
+
+        def lenta():
+            calculos.append(1)
+            time.sleep(0.2)
+            return ["marca-uno"]
+
+        barrera = threading.Barrier(8)
+        resultados = []
+
+        def pedir():
+            barrera.wait()
+            resultados.append(cached_query("marcas", lenta, tags=("marca",)))
+
+        hilos = [threading.Thread(target=pedir) for _ in range(8)]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+        self.assertEqual(len(calculos), 1)
+        self.assertEqual(resultados, [["marca-uno"]] * 8)
+
+    def test_con_lock_tomado_sirve_lo_vencido(self):
+        cached_query("marcas", lambda: "viejo", tags=("marca",))
+        vencida = mock.patch("catalogo.cache._vencida", return_value=True)
+        # Otro proceso tiene el lock: cache.add no lo consigue
+        with vencida, mock.patch.object(cache_catalogo.cache, "add", return_value=False):
+            self.assertEqual(cached_query("marcas", lambda: "nuevo", tags=("marca",)), "viejo")
+        with vencida:
+            self.assertEqual(cached_query("marcas", lambda: "nuevo", tags=("marca",)), "nuevo")
+
+    def test_bump_invalida_y_argumentos_en_la_llave(self):
+        calculos = []
+
+        @cached_query("populares", tags=("producto",))
+        def populares(n):
+            calculos.append(n)
+            return list(range(n))
+
+        self.assertEqual((populares(2), populares(2), populares(3)), ([0, 1], [0, 1], [0, 1, 2]))
+        self.assertEqual(calculos, [2, 3])
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_version("producto")
+        populares(2)
+        self.assertEqual(calculos, [2, 3, 2])
+
+
+# =======================
+# BÚSQUEDA
+# =======================
+class BusquedaTests(TestCase):
+    def test_filtro_no_pierde_resultados_de_busquedas_amplias(self):
+        comun = Categoria.objects.create(nombre="Tazas", slug="tazas")
+        rara = Categoria.objects.create(nombre="Termos", slug="termos")
+        # Los de `rara` quedan al final del ranking (mismo puntaje, id menor)
+        Producto.objects.bulk_create([
+            Producto(nombre=f"Taza retro {i}", slug=f"taza-{i}", precio=Decimal("10.00"),
+                     stock=1, categoria=rara if i < 3 else comun)
+            for i in range(600)
+        ])
+        search.sincronizar()
+
+        f = leer_filtros({"q": "taza", "cat": "termos"})
+        qs = filtrar_productos(Producto.objects.all(), f)
+        self.assertEqual(qs.count(), 3)
+
+    def test_busqueda_amplia_no_manda_los_ids_a_la_bd(self):
+        categoria = Categoria.objects.create(nombre="Tazas", slug="tazas")
+        Producto.objects.bulk_create([
+            Producto(nombre=f"Taza {'taza ' * (i % 4)}{i}", slug=f"taza-{i}", precio=Decimal("10.00"),
+                     stock=1, categoria=categoria)
+            for i in range(1200)
+        ])
+        search.sincronizar()
+
+        f = leer_filtros({"q": "taza"})
+        with CaptureQueriesContext(connection) as capturadas:
+            ids = list(ordenar_productos(filtrar_productos(Producto.objects.all(), f), f)
+                       .values_list("pk", flat=True))
+        self.assertEqual(len(capturadas), 1)
+        self.assertLess(capturadas[0]["sql"].count("%s") + capturadas[0]["sql"].count("?"), 10)
+        # Mismo ranking que el motor (relevancia y luego id descendente)
+        self.assertEqual(ids, search.buscar_ids("taza"))
+
+    @override_settings(CATALOGO_SNAPSHOT=False, CATALOGO_PAGE_CACHE=False)
+    def test_listado_con_busqueda_en_la_bd(self):
+        categoria = Categoria.objects.create(nombre="Tazas", slug="tazas")
+        Producto.objects.create(nombre="Taza retro", slug="taza-retro", precio=Decimal("10"),
+                                stock=1, categoria=categoria)
+        Producto.objects.create(nombre="Termo", slug="termo", precio=Decimal("10"), stock=1, categoria=categoria)
+        search.sincronizar()
+        respuesta = self.client.get(reverse("producto_lista"), {"q": "tazas retro"})
+        self.assertEqual([p.slug for p in respuesta.context["productos"]], ["taza-retro"])
+        self.assertEqual(respuesta.context["total_filtrado"], 1)
+
+
+# =======================
+# FIXTURES Y BITÁCORA DE CAMBIOS
+# =======================
+class CargaFixtureTests(TestCase):
+    def test_loaddata_seed(self):
+        call_command("loaddata", os.path.join(settings.BASE_DIR, "seed.json"), verbosity=0)
+        self.assertTrue(Producto.objects.exists())
+        self.assertFalse(Producto.objects.filter(modificado__isnull=True).exists())
+
+    def test_loaddata_calcula_precio_final(self):
+        call_command("loaddata", os.path.join(settings.BASE_DIR, "seed.json"), verbosity=0)
+        productos = list(Producto.objects.filter(precio__gt=0))
+        self.assertTrue(productos)
+        for p in productos:
+            self.assertEqual(p.precio_final, p.calcular_precio_final(), p.slug)
+            self.assertGreater(p.precio_final, 0, p.slug)
+
+        p = Producto.objects.filter(stock__gt=1, descuento__gt=0).first()
+        order = crear_pedido(None, {str(p.pk): 2})
+        self.assertEqual(order.total, p.calcular_precio_final() * 2)
+        self.assertGreater(order.total, 0)
+
+
+class TokenCambiosTests(TestCase):
+    def _cambios(self, *ids):
+        for pk in ids:
+            ProductoCambio.objects.create(id=pk, producto_id=pk, accion=ProductoCambio.ACTUALIZADO)
+
+    def test_no_pasa_un_hueco_reciente(self):
+        self._cambios(1, 2, 4)  # el 3 puede ser una transacción sin confirmar
+        self.assertEqual(ProductoCambio.ultimo_token(), 2)
+        cambios, token, mas = ProductoCambio.leer(0, 10)
+        self.assertEqual([pk for pk, _producto in cambios], [1, 2])
+        self.assertEqual((token, mas), (2, False))
+
+    def test_hueco_viejo_se_salta(self):
+        self._cambios(1, 2, 4)
+        viejo = timezone.now() - timedelta(seconds=settings.CATALOGO_CAMBIOS_ESPERA + 1)
+        ProductoCambio.objects.filter(id=4).update(momento=viejo)
+        self.assertEqual(ProductoCambio.ultimo_token(), 4)
+        cambios, token, _mas = ProductoCambio.leer(2, 10)
+        self.assertEqual((cambios, token), ([(4, 4)], 4))
+
+    def test_mas_cuando_se_corta_por_limite(self):
+        self._cambios(1, 2, 3)
+        cambios, token, mas = ProductoCambio.leer(0, 2)
+        self.assertEqual((len(cambios), token, mas), (2, 2, True))
+
+
+class BitacoraUpdateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        categoria = Categoria.objects.create(nombre="Tazas", slug="tazas")
+        cls.productos = [
+            Producto.objects.create(nombre=f"Taza {i}", slug=f"taza-{i}", precio=Decimal("100"),
+                                    stock=1, categoria=categoria)
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        ProductoCambio.objects.all().delete()
+
+    def test_update_registra_aunque_el_filtro_deje_de_coincidir(self):
+        rows = Producto.objects.filter(activo=True).update(activo=False)
+        self.assertEqual(rows, 3)
+        self.assertEqual(
+            sorted(ProductoCambio.objects.values_list("producto_id", flat=True)),
+            [p.pk for p in self.productos],
+        )
+
+    def test_update_revertido_no_deja_bitacora(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                Producto.objects.filter(activo=True).update(stock=9)
+                raise RuntimeError("falla después del UPDATE")
+        self.assertFalse(ProductoCambio.objects.exists())
+        self.assertFalse(Producto.objects.filter(stock=9).exists())
+
+    def test_si_falla_la_bitacora_no_queda_el_update(self):
+        with mock.patch.object(ProductoCambio, "registrar_consulta", side_effect=RuntimeError("bitácora")):
+            with self.assertRaises(RuntimeError):
+                Producto.objects.filter(activo=True).update(stock=9)
+        self.assertFalse(Producto.objects.filter(stock=9).exists())
+
+    def test_update_de_precio_recalcula_y_registra(self):
+        Producto.objects.filter(activo=True).update(descuento=Decimal("10"))
+        self.assertEqual(set(Producto.objects.values_list("precio_final", flat=True)), {Decimal("90.00")})
+        self.assertEqual(ProductoCambio.objects.count(), 3)
+
+
+# =======================
+# CARRITO
+# =======================
+class CarritoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        categoria = Categoria.objects.create(nombre="Tazas", slug="tazas")
+        cls.taza = Producto.objects.create(nombre="Taza", slug="taza", precio=Decimal("100.00"),
+                                           descuento=Decimal("10"), stock=5, categoria=categoria)
+        cls.termo = Producto.objects.create(nombre="Termo", slug="termo", precio=Decimal("50.00"),
+                                            stock=3, categoria=categoria)
+        cls.usuario = get_user_model().objects.create_user("ana", "ana@example.com", "clave-segura-1")
+
+    def _agregar(self, producto, qty):
+        self.client.get(reverse("carrito_agregar", args=[producto.pk]), {"qty": qty})
+
+    def _lineas(self, cart):
+        return dict(cart.lineas.values_list("producto_id", "qty"))
+
+    def _contadores_cuadran(self, cart):
+        cart.refresh_from_db()
+        esperado = sum((l.qty * l.unit_price for l in cart.lineas.all()), Decimal("0"))
+        self.assertEqual((cart.item_count, cart.subtotal), (sum(self._lineas(cart).values()), esperado))
+
+    def test_contadores_siguen_a_las_lineas(self):
+        self._agregar(self.taza, 2)
+        self._agregar(self.termo, 9)  # tope: el stock
+        cart = Cart.objects.get()
+        self.assertEqual(self._lineas(cart), {self.taza.pk: 2, self.termo.pk: 3})
+        self.assertEqual((cart.item_count, cart.subtotal), (5, Decimal("330.00")))
+        self.client.get(reverse("carrito_quitar", args=[self.termo.pk]))
+        self._contadores_cuadran(cart)
+        self.assertEqual(cart.item_count, 4)
+
+    def test_login_pasa_el_carrito_del_invitado(self):
+        self._agregar(self.taza, 2)
+        invitado = Cart.objects.get()
+        self.client.login(username="ana", password="clave-segura-1")
+        cart = Cart.objects.get()
+        self.assertEqual((cart.pk, cart.user_id), (invitado.pk, self.usuario.pk))
+        self.assertNotIn("carrito_id", self.client.session)
+        self.assertEqual(cart.item_count, 2)
+
+    def test_login_funde_con_el_carrito_del_usuario(self):
+        propio = Cart.objects.create(user=self.usuario)
+        carrito.agregar(propio, self.taza, 4)
+        self._agregar(self.taza, 3)
+        self._agregar(self.termo, 1)
+        self.client.login(username="ana", password="clave-segura-1")
+        cart = Cart.objects.get()  # el del invitado se borró
+        self.assertEqual(cart.pk, propio.pk)
+        # La línea repetida se suma con tope en el stock
+        self.assertEqual(self._lineas(cart), {self.taza.pk: 5, self.termo.pk: 1})
+        self._contadores_cuadran(cart)
+
+
+# =======================
+# CHECKOUT
+# =======================
+class ReservarStockTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        categoria = Categoria.objects.create(nombre="Tazas", slug="tazas")
+        cls.taza = Producto.objects.create(nombre="Taza", slug="taza", precio=Decimal("100.00"),
+                                           descuento=Decimal("10"), stock=5, categoria=categoria)
+        cls.termo = Producto.objects.create(nombre="Termo", slug="termo", precio=Decimal("50.00"),
+                                            stock=1, categoria=categoria)
+
+    def _stock(self):
+        return dict(Producto.objects.filter(pk__in=[self.taza.pk, self.termo.pk]).values_list("pk", "stock"))
+
+    def test_descuenta_todas_las_lineas(self):
+        with transaction.atomic():
+            reservados = reservar_stock({self.taza.pk: 2, self.termo.pk: 1})
+        self.assertEqual([p.pk for p in reservados], sorted([self.taza.pk, self.termo.pk]))
+        self.assertEqual(self._stock(), {self.taza.pk: 3, self.termo.pk: 0})
+
+    def test_stock_insuficiente_no_toca_nada(self):
+        with self.assertRaises(StockInsuficiente) as ctx:
+            with transaction.atomic():
+                reservar_stock({self.taza.pk: 2, self.termo.pk: 3})
+        self.assertEqual([(pid, pedida, disponible) for _p, pid, pedida, disponible in ctx.exception.faltantes],
+                         [(self.termo.pk, 3, 1)])
+        self.assertEqual(self._stock(), {self.taza.pk: 5, self.termo.pk: 1})
+
+    def test_producto_inactivo_cuenta_como_agotado(self):
+        Producto.objects.filter(pk=self.termo.pk).update(activo=False)
+        with self.assertRaises(StockInsuficiente):
+            with transaction.atomic():
+                reservar_stock({self.termo.pk: 1})
+
+    def test_pedido_con_precio_final_guardado(self):
+        order = crear_pedido(None, {str(self.taza.pk): 2, str(self.termo.pk): 1})
+        self.assertEqual(order.total, Decimal("230.00"))
+        self.assertEqual(self._stock(), {self.taza.pk: 3, self.termo.pk: 0})
+
+    def test_falla_despues_de_reservar_revierte_el_stock(self):
+        with mock.patch("catalogo.checkout.Order.objects.create", side_effect=RuntimeError("pago")):
+            with self.assertRaises(RuntimeError):
+                crear_pedido(None, {str(self.taza.pk): 2, str(self.termo.pk): 1})
+        self.assertEqual(self._stock(), {self.taza.pk: 5, self.termo.pk: 1})
+        self.assertFalse(Order.objects.exists())
+
+    def test_prueba_concurrente_falla_si_hay_errores(self):
+        with mock.patch("catalogo.management.commands.prueba_checkout_concurrente.crear_pedido",
+                        side_effect=RuntimeError("database is locked")):
+            with self.assertRaisesMessage(CommandError, "fallaron con una excepción"):
+                call_command("prueba_checkout_concurrente", compradores=3, stock=2, stdout=io.StringIO())
+
+
+class BackfillOrderItemsTests(TestCase):
+    def test_lineas_invalidas_se_omiten_sin_frenar_el_backfill(self):
+        categoria = Categoria.objects.create(nombre="Tazas", slug="tazas")
+        taza = Producto.objects.create(nombre="Taza", slug="taza", precio=Decimal("10"), stock=1, categoria=categoria)
+        order = Order.objects.create(items=[
+            {"id": taza.pk, "name": "Taza", "price": 10.5, "qty": 2},
+            {"id": taza.pk, "name": "Sin precio", "qty": 1},
+            {"id": taza.pk, "name": "Precio roto", "price": "diez", "qty": 1},
+            {"id": taza.pk, "name": "NaN", "price": "NaN", "qty": 1},
+            {"id": taza.pk, "name": "Cantidad rota", "price": 5, "qty": "dos"},
+            "no es un objeto",
+        ])
+        otro = Order.objects.create(items=[{"id": 999, "name": "Borrado", "price": "7", "qty": 1}])
+
+        err = io.StringIO()
+        call_command("backfill_order_items", stdout=io.StringIO(), stderr=err)
+
+        self.assertEqual(
+            list(order.order_items.values_list("producto_id", "unit_price", "qty")),
+            [(taza.pk, Decimal("10.50"), 2)],
+        )
+        self.assertEqual(list(otro.order_items.values_list("producto_id", "unit_price")), [(None, Decimal("7.00"))])
+        self.assertIn("5 líneas omitidas", err.getvalue())
+
+
+# =======================
+# FACETAS
+# =======================
+class FacetasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.categoria = Categoria.objects.create(nombre="Tazas", slug="tazas")
+        cls.marca = Marca.objects.create(nombre="Marca Uno", slug="marca-uno")
+
+    def _producto(self, slug, **extra):
+        datos = {"nombre": slug, "slug": slug, "precio": Decimal("10"), "stock": 1,
+                 "categoria": self.categoria, "marca": self.marca, **extra}
+        return Producto.objects.create(**datos)
+
+    def test_bits_por_posicion_densa_y_no_por_pk(self):
+        for i, pk in enumerate((5, 1_000_000, 2_000_000)):
+            self._producto(f"p{i}", id=pk)
+        indice = IndiceFacetas()
+        self.assertEqual(indice.contar({"marca": ["marca-uno"]})["total"], 3)
+        self.assertLessEqual(indice.disponibles.bit_length(), 3)
+        self.assertLessEqual(indice.bits["marca"][self.marca.pk].bit_length(), 3)
+
+    def test_baja_libera_la_posicion(self):
+        uno, dos = self._producto("uno"), self._producto("dos")
+        indice = IndiceFacetas()
+        indice.contar()
+        posicion_uno = indice.posicion[uno.pk]
+        uno.activo = False
+        uno.save()
+        tres = self._producto("tres")
+        with mock.patch.object(indice, "_reconstruir", wraps=indice._reconstruir) as reconstruir:
+            self.assertEqual(indice.contar()["total"], 2)
+        reconstruir.assert_not_called()  # por la bitácora, sin releer todo
+        self.assertEqual(set(indice.posicion), {dos.pk, tres.pk})
+        self.assertEqual(indice.posicion[tres.pk], posicion_uno)
+        self.assertLessEqual(indice.disponibles.bit_length(), 2)
+
+    def _variados(self):
+        otra_marca = Marca.objects.create(nombre="Marca Dos", slug="marca-dos")
+        otra_categoria = Categoria.objects.create(nombre="Termos", slug="termos")
+        anime, retro = (Tematica.objects.create(nombre=n, slug=n.lower()) for n in ("Anime", "Retro"))
+        for i in range(24):
+            p = self._producto(
+                f"v{i}", marca=(self.marca, otra_marca, None)[i % 3],
+                categoria=(self.categoria, otra_categoria)[i % 2],
+                precio=Decimal(10 + i * 5), descuento=Decimal(10 if i % 4 == 0 else 0),
+                destacado=i % 5 == 0, stock=0 if i % 7 == 6 else 2, activo=i % 11 != 10,
+            )
+            p.tematicas.set([anime, retro][: i % 3])
+
+    def _igual_al_orm(self, indice, **params):
+        f = {k: "" for k in FILTROS} | params
+        disponibles = Producto.objects.filter(activo=True, stock__gt=0)
+        with mock.patch("catalogo.facetas._indice", indice):
+            conteos = facetas_de_filtros(f)
+        self.assertEqual(conteos["total"], filtrar_productos(disponibles, f).count(), params)
+        for dim, param in PARAMETROS.items():
+            modelo = DIMENSIONES[dim][1]
+            esperado = {}
+            for obj in modelo.objects.all():
+                n = filtrar_productos(disponibles, {**f, param: obj.slug}).count()
+                if n:
+                    esperado[obj.slug] = n
+            self.assertEqual({o.slug: o.num_prod for o in conteos[dim]}, esperado, (dim, params))
+
+    def test_conteos_iguales_al_orm(self):
+        self._variados()
+        indice = IndiceFacetas()
+        for params in ({}, {"marca": "marca-uno"}, {"cat": "Termos", "tematica": "anime"},
+                       {"ofertas": "1"}, {"destacados": "1", "marca": "marca-dos"},
+                       {"precio_min": "40", "precio_max": "100", "tematica": "retro"}):
+            self._igual_al_orm(indice, **params)
+
+        # Tras cambios que el índice aplica desde la bitácora, sigue cuadrando
+        Producto.objects.filter(slug__in=["v0", "v1"]).update(stock=0)
+        Producto.objects.filter(slug="v6").update(stock=4, marca=self.marca)
+        self._igual_al_orm(indice, marca="marca-uno")
+        self._igual_al_orm(indice, cat="tazas", ofertas="1")
+
+
+# =======================
+# FOTO DEL CATÁLOGO
+# =======================
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                                       "LOCATION": "foto-catalogo"}})
+class SnapshotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.categoria = Categoria.objects.create(nombre="Tazas", slug="tazas")
+        cls.marca = Marca.objects.create(nombre="Marca Uno", slug="marca-uno")
+        anime = Tematica.objects.create(nombre="Anime", slug="anime")
+        ahora = timezone.now()
+        for i in range(12):
+            p = Producto.objects.create(
+                nombre=f"Taza {i}", slug=f"taza-{i}", precio=Decimal(100 - i * 3), categoria=cls.categoria,
+                descuento=Decimal(i % 3 * 10), destacado=i % 4 == 0, destacado_orden=12 - i,
+                stock=0 if i == 5 else 3, activo=i != 7, marca=cls.marca if i % 2 else None,
+            )
+            # Empates de `creado` a propósito: el desempate es el id
+            Producto.objects.filter(pk=p.pk).update(creado=ahora - timedelta(hours=i // 2))
+            if i % 3 == 0:
+                p.tematicas.add(anime)
+
+    def setUp(self):
+        cache.clear()
+        carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        self.ruta = os.path.join(carpeta.name, "catalogo.snap")
+        ajustes = override_settings(CATALOGO_SNAPSHOT_PATH=self.ruta)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        # Cada prueba arranca como un worker recién levantado
+        foto = mock.patch.object(snapshot, "_actual", None)
+        foto.start()
+        self.addCleanup(foto.stop)
+
+    def _orm(self, f):
+        disponibles = Producto.objects.filter(activo=True, stock__gt=0)
+        return list(ordenar_productos(filtrar_productos(disponibles, f), f).values_list("id", flat=True))
+
+    def test_listado_igual_al_orm(self):
+        for params in ({}, {"marca": "Marca Uno"}, {"tematica": "anime", "orden": "precio_desc"},
+                       {"destacados": "1"}, {"ofertas": "1"}, {"precio_min": "80", "orden": "precio_asc"}):
+            f = {k: "" for k in FILTROS} | params
+            self.assertEqual(snapshot.ids_listado(f), self._orm(f), params)
+
+    def test_cambio_de_version_rearma_la_foto(self):
+        f = {k: "" for k in FILTROS}
+        vieja = snapshot.actual()
+        self.assertIs(snapshot.actual(), vieja)  # misma versión: ni se relee el archivo
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Producto.objects.filter(slug="taza-0").update(stock=0)
+        nueva = snapshot.actual()
+        self.assertIsNot(nueva, vieja)
+        self.assertEqual(nueva.version, get_versiones(snapshot.TAGS))
+        self.assertEqual(snapshot.ids_listado(f), self._orm(f))
+        self.assertEqual(vieja.n - 1, nueva.n)
+
+    def test_otro_worker_rearmando_sirve_la_anterior(self):
+        vieja = snapshot.actual()
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_version("producto")
+        snapshot._actual = None  # otro worker, con el archivo viejo en disco
+        cache.add(snapshot.LOCK_KEY, 1)
+        with mock.patch("catalogo.snapshot.construir") as construir:
+            foto = snapshot.actual()
+        construir.assert_not_called()
+        self.assertEqual(foto.version, vieja.version)
+
+        cache.delete(snapshot.LOCK_KEY)
+        self.assertEqual(snapshot.actual().version, get_versiones(snapshot.TAGS))
+
+    def test_archivo_ilegible_se_rearma(self):
+        with open(self.ruta, "wb") as archivo:
+            archivo.write(b"basura")
+        with self.assertLogs("catalogo.snapshot", "WARNING"):
+            foto = snapshot.actual()
+        self.assertEqual(foto.n, Producto.objects.filter(activo=True, stock__gt=0).count())
+
+
+# =======================
+# PAGINACIÓN POR CURSOR
+# =======================
+@override_settings(CATALOGO_SNAPSHOT=False, CATALOGO_PAGE_CACHE=False, CATALOGO_PAGINACION="keyset",
+                   CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                                       "LOCATION": "paginacion"}})
+class PaginacionKeysetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        categoria = Categoria.objects.create(nombre="Tazas", slug="tazas")
+        ahora = timezone.now()
+        for i in range(29):
+            p = Producto.objects.create(nombre=f"Taza {i}", slug=f"taza-{i}", precio=Decimal(10 + i % 5),
+                                        descuento=Decimal(i % 3 * 10), stock=2, categoria=categoria)
+            # Empates en `creado` y en precio: el id desempata
+            Producto.objects.filter(pk=p.pk).update(creado=ahora - timedelta(hours=i // 4))
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse("producto_lista")
+
+    def _recorrer(self, params, direccion="siguiente"):
+        """Ids de cada página siguiendo el cursor de la vista hasta el final."""
+        paginas, cursor = [], None
+        while True:
+            r = self.client.get(self.url, {**params, **({"cursor": cursor} if cursor else {})})
+            pagina = r.context["page_obj"]
+            self.assertTrue(pagina.keyset)
+            paginas.append([p.pk for p in pagina])
+            cursor = getattr(pagina, f"cursor_{direccion}")
+            if cursor is None:
+                return paginas, pagina
+
+    def _orm(self, params):
+        f = {k: "" for k in FILTROS} | params
+        return list(ordenar_productos(filtrar_productos(Producto.objects.filter(activo=True, stock__gt=0), f), f)
+                    .values_list("id", flat=True))
+
+    def test_paginas_sin_huecos_ni_repetidos(self):
+        for params in ({}, {"orden": "precio_asc"}, {"orden": "precio_desc"}, {"ofertas": "1"}):
+            paginas, _ultima = self._recorrer(params)
+            self.assertEqual([len(p) for p in paginas][:-1], [12] * (len(paginas) - 1), params)
+            self.assertEqual(sum(paginas, []), self._orm(params), params)
+
+    def test_hacia_atras_devuelve_las_mismas_paginas(self):
+        adelante, ultima = self._recorrer({"orden": "precio_asc"})
+        atras, cursor = [[p.pk for p in ultima]], ultima.cursor_anterior
+        while cursor:
+            pagina = self.client.get(self.url, {"orden": "precio_asc", "cursor": cursor}).context["page_obj"]
+            atras.append([p.pk for p in pagina])
+            cursor = pagina.cursor_anterior
+        self.assertEqual(atras[::-1], adelante)
+
+    def test_alta_entre_paginas_no_desplaza_el_cursor(self):
+        primera = self.client.get(self.url).context["page_obj"]
+        Producto.objects.create(nombre="Nueva", slug="nueva", precio=Decimal("9"), stock=1,
+                                categoria=Categoria.objects.get())
+        segunda = self.client.get(self.url, {"cursor": primera.cursor_siguiente}).context["page_obj"]
+        # Con OFFSET la última de la primera página se repetiría
+        self.assertEqual([p.pk for p in segunda], self._orm({})[13:25])
+
+    def test_sin_offset_y_cursor_ajeno_vuelve_al_inicio(self):
+        primera = self.client.get(self.url).context["page_obj"]
+        with CaptureQueriesContext(connection) as capturadas:
+            self.client.get(self.url, {"cursor": primera.cursor_siguiente})
+        self.assertFalse([q["sql"] for q in capturadas if "OFFSET" in q["sql"]])
+        # El cursor guarda el orden: con otro ?orden= (o adulterado) se empieza de nuevo
+        for params in ({"orden": "precio_asc", "cursor": primera.cursor_siguiente}, {"cursor": "x:y"}):
+            pagina = self.client.get(self.url, params).context["page_obj"]
+            self.assertFalse(pagina.has_previous(), params)
+
+    @override_settings(CATALOGO_SNAPSHOT=True)
+    def test_con_la_foto_del_catalogo(self):
+        carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        with override_settings(CATALOGO_SNAPSHOT_PATH=os.path.join(carpeta.name, "catalogo.snap")), \
+                mock.patch.object(snapshot, "_actual", None):
+            for params in ({}, {"orden": "precio_desc"}):
+                paginas, _ultima = self._recorrer(params)
+                self.assertEqual(sum(paginas, []), self._orm(params), params)
+
+
+# =======================
+# IMPORTACIÓN
+# =======================
+class ImportarTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.categoria = Categoria.objects.create(nombre="Tazas", slug="tazas")
+        Producto.objects.create(nombre="Mario", slug="mario-pixel-art", precio=Decimal("300.00"),
+                                descuento=Decimal("10"), stock=2, categoria=cls.categoria)
+
+    def _importar(self, csv_texto):
+        importador = Importador()
+        importador.importar(leer_csv(io.StringIO(csv_texto)), "csv")
+        return importador
+
+    def test_celda_vacia_no_cambia_el_valor(self):
+        self._importar("slug,stock,precio,descuento\nmario-pixel-art,7,,\n")
+        p = Producto.objects.get(slug="mario-pixel-art")
+        self.assertEqual((p.stock, p.precio, p.descuento), (7, Decimal("300.00"), Decimal("10.00")))
+        self.assertEqual(p.precio_final, Decimal("270.00"))
+
+    def test_stock_vacio_no_cambia(self):
+        self._importar("slug,stock,precio\nmario-pixel-art,,320\n")
+        p = Producto.objects.get(slug="mario-pixel-art")
+        self.assertEqual((p.stock, p.precio), (2, Decimal("320.00")))
+
+    def test_reimportar_precio_recalcula_precio_final(self):
+        self._importar("slug,nombre,categoria,precio,descuento\nmario-pixel-art,Mario,tazas,400,20\n")
+        self.assertEqual(Producto.objects.get(slug="mario-pixel-art").precio_final, Decimal("320.00"))
+        # Sin descuento en el archivo: se conserva el 20 % de la BD
+        self._importar("slug,nombre,categoria,precio\nmario-pixel-art,Mario,tazas,500\n")
+        self.assertEqual(Producto.objects.get(slug="mario-pixel-art").precio_final, Decimal("400.00"))
+
+    def test_upsert_sin_pk_escribe_precio_final(self):
+        # MySQL: sin unique_fields ni pks de vuelta, el precio final va en el propio upsert
+        with mock.patch("django.db.models.QuerySet.bulk_create", return_value=[]) as crear:
+            Producto.objects.bulk_create(
+                [Producto(slug="mario-pixel-art", precio=Decimal("400"), descuento=Decimal("20"))],
+                update_conflicts=True, update_fields=["precio", "descuento"],
+            )
+        self.assertIn("precio_final", crear.call_args.kwargs["update_fields"])
+        self.assertEqual(crear.call_args.args[0][0].precio_final, Decimal("320.00"))
+
+    def test_slug_largo_se_rechaza_sin_recortar(self):
+        base = "s" * 50
+        importador = self._importar(
+            "slug,nombre,categoria,precio\n"
+            f"{base}-rojo,Rojo,tazas,10\n{base}-azul,Azul,tazas,12\n"
+        )
+        self.assertEqual(importador.stats["rechazados"], 2)
+        self.assertIn("slug de más de 50", importador.errores[0])
+        self.assertFalse(Producto.objects.filter(slug__startswith=base).exists())
+
+    def test_alta_sin_precio_se_rechaza(self):
+        importador = self._importar("slug,nombre,categoria,precio,stock\nnuevo,Nuevo,tazas,,3\n")
+        self.assertEqual(importador.stats["rechazados"], 1)
+        self.assertFalse(Producto.objects.filter(slug="nuevo").exists())
+
+
+# =======================
+# AJUSTES MASIVOS
+# =======================
+class AjustesTests(TestCase):
+    def test_csv_rechaza_nan_e_infinity(self):
+        filas, errores = ajustes.leer_csv("slug,precio,descuento\na,NaN,\nb,,Infinity\nc,-inf,\nd,12.5,\n")
+        self.assertEqual(filas, {"d": {"precio": Decimal("12.50")}})
+        self.assertEqual(len(errores), 3)
+
+    def test_regla_rechaza_no_finitos(self):
+        for valor in (Decimal("NaN"), Decimal("Infinity"), Decimal("-Infinity")):
+            with self.assertRaises(ajustes.AjusteInvalido):
+                ajustes.validar_regla("precio", "fijar", valor)
+
+    def test_stock_restar_de_mas_queda_en_cero(self):
+        categoria = Categoria.objects.create(nombre="Tazas", slug="tazas")
+        poco = Producto.objects.create(nombre="Poco", slug="poco", precio=Decimal("10"), stock=2, categoria=categoria)
+        mucho = Producto.objects.create(nombre="Mucho", slug="mucho", precio=Decimal("10"), stock=9, categoria=categoria)
+        qs = Producto.objects.filter(pk__in=[poco.pk, mucho.pk])
+        ajustes.aplicar_regla(qs, "stock", "sumar", -5)
+        self.assertEqual(dict(qs.values_list("slug", "stock")), {"poco": 0, "mucho": 4})
+        ajustes.aplicar_regla(qs, "stock", "sumar", 3)
+        self.assertEqual(dict(qs.values_list("slug", "stock")), {"poco": 3, "mucho": 7})
+
+    def test_formulario_de_regla(self):
+        form = ReglaAjusteForm({"campo": "precio", "operacion": "fijar", "valor": "NaN", "solo_activos": "on"})
+        self.assertFalse(form.is_valid())
+
+
+# =======================
+# DERIVADAS DE IMÁGENES
+# =======================
+@override_settings(CATALOGO_IMAGENES_LISTA_TTL=120)
+class DerivadasListaTests(TestCase):
+    def _lista(self, existe):
+        storage = mock.Mock()
+        storage.exists.return_value = existe
+        with mock.patch("catalogo.imagenes.cache") as memoria:
+            memoria.get.return_value = None
+            imagenes.lista("productos/taza.jpg", storage=storage)
+        return memoria.set.call_args.args
+
+    def test_lista_positiva_caduca(self):
+        if not imagenes.FORMATOS:
+            self.skipTest("Pillow sin WebP/AVIF")
+        # Si la derivada se borra del storage, se vuelve a mirar (y a generar)
+        self.assertEqual(self._lista(True)[1:], (True, 120))
+        self.assertEqual(self._lista(False)[1:], (False, 60))
+
+
+# =======================
+# ADMIN DE TAXONOMÍAS
+# =======================
+class ConteoProductosAdminTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_superuser("admin", "admin@example.com", "x")
+        cls.categoria = Categoria.objects.create(nombre="Tazas", slug="tazas")
+        cls.tematica = Tematica.objects.create(nombre="Anime", slug="anime")
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def _marca(self, i, productos):
+        """productos: tuplas (activo, stock)."""
+        marca = Marca.objects.create(nombre=f"Marca {i}", slug=f"marca-{i}")
+        for j, (activo, stock) in enumerate(productos):
+            p = Producto.objects.create(nombre=f"M{i} {j}", slug=f"m{i}-{j}", precio=Decimal("10"),
+                                        stock=stock, activo=activo, categoria=self.categoria, marca=marca)
+            p.tematicas.add(self.tematica)
+        return marca
+
+    def _listado(self, modelo, **params):
+        url = reverse(f"admin:catalogo_{modelo._meta.model_name}_changelist")
+        with CaptureQueriesContext(connection) as capturadas:
+            respuesta = self.client.get(url, params)
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.context["cl"].result_list, len(capturadas)
+
+    def test_conteos_iguales_al_orm_y_consultas_fijas(self):
+        self._marca(0, [(True, 3), (True, 0), (False, 5)])
+        _, pocas = self._listado(Marca)
+        self._marca(1, [(True, 1)])
+        self._marca(2, [])
+        filas, muchas = self._listado(Marca)
+        self.assertEqual(muchas, pocas)
+        for m in filas:
+            productos = Producto.objects.filter(marca=m)
+            self.assertEqual(m.num_productos, productos.count())
+            self.assertEqual(m.num_activos, productos.filter(activo=True).count())
+            self.assertEqual(m.num_disponibles, productos.filter(activo=True, stock__gt=0).count())
+
+    def test_conteos_por_muchos_a_muchos(self):
+        self._marca(0, [(True, 3), (False, 2)])
+        (tematica,), _ = self._listado(Tematica)
+        self.assertEqual((tematica.num_productos, tematica.num_activos, tematica.num_disponibles), (2, 1, 1))
+
+    def test_filtro_por_conteos(self):
+        self._marca(0, [(True, 3)])
+        self._marca(1, [(True, 0), (False, 4)])
+        self._marca(2, [])
+        for valor, esperadas in (("disponibles", ["marca-0"]), ("activos", ["marca-0", "marca-1"]),
+                                 ("sin_disponibles", ["marca-1", "marca-2"]), ("vacias", ["marca-2"])):
+            filas, _ = self._listado(Marca, con_productos=valor)
+            self.assertEqual(sorted(m.slug for m in filas), esperadas, valor)
+
+
+# =======================
+# CAMPAÑAS DE NEWSLETTER
+# =======================
+class CampaniasTests(TestCase):
+    LOCMEM = "django.core.mail.backends.locmem.EmailBackend"
+
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(5):
+            NewsletterSubscriber.objects.create(email=f"s{i}@example.com", is_confirmed=True, token=f"t{i}")
+        NewsletterSubscriber.objects.create(email="pendiente@example.com", token="tp")
+
+    def setUp(self):
+        self.campania = NewsletterCampaign.objects.create(subject="Novedades", body_text="Hola")
+
+    def _enviar(self, **extra):
+        return campanias.enviar_campania(self.campania, lote=2, tasa=0, backend=self.LOCMEM, **extra)
+
+    def _correos(self):
+        return [m.to[0] for m in mail.outbox]
+
+    def test_envia_por_lotes_solo_a_confirmados(self):
+        c = self._enviar()
+        self.assertEqual(c.status, "SENT")
+        self.assertEqual((c.total, c.sent_count, c.batches), (5, 5, 3))
+        self.assertEqual([m["destinatarios"] for m in c.metrics], [2, 2, 1])
+        self.assertEqual(sorted(self._correos()), [f"s{i}@example.com" for i in range(5)])
+        ultimo = NewsletterSubscriber.objects.filter(is_confirmed=True).order_by("pk").last()
+        self.assertEqual(c.last_subscriber_id, ultimo.pk)
+
+    def test_pausa_y_reanuda_desde_el_checkpoint(self):
+        def pausar(campania, metrica):
+            NewsletterCampaign.objects.filter(pk=campania.pk).update(status="PAUSED")
+
+        c = self._enviar(al_terminar_lote=pausar)
+        self.assertEqual((c.status, c.sent_count, c.batches), ("PAUSED", 2, 1))
+        self.assertEqual(len(mail.outbox), 2)
+
+        c = campanias.enviar_campania(NewsletterCampaign.objects.get(pk=c.pk), lote=2, tasa=0,
+                                      backend=self.LOCMEM)
+        self.assertEqual((c.status, c.sent_count, c.total), ("SENT", 5, 5))
+        # Nadie recibe dos veces ni queda fuera
+        self.assertEqual(sorted(self._correos()), [f"s{i}@example.com" for i in range(5)])
+
+    def test_lote_fallido_pausa_y_se_repite_al_reanudar(self):
+        real = campanias.get_connection
+        llamadas = []
+
+        def conexion(backend):
+            llamadas.append(backend)
+            if len(llamadas) == 2:
+                raise OSError("SMTP caído")
+            return real(backend)
+
+        with mock.patch("catalogo.campanias.get_connection", side_effect=conexion):
+            c = self._enviar()
+        self.assertEqual((c.status, c.sent_count), ("PAUSED", 2))
+        self.assertIn("SMTP caído", c.last_error)
+
+        c = self._enviar()
+        self.assertEqual((c.status, c.sent_count, c.last_error), ("SENT", 5, ""))
+        self.assertEqual(sorted(self._correos()), [f"s{i}@example.com" for i in range(5)])
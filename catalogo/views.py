@@ -1,27 +1,78 @@
 # catalogo/views.py
+import logging
 from decimal import Decimal
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views.generic import ListView, DetailView
-from django.db.models import Q, Count
+from django.conf import settings
+from django.db.models import Q, Count, F, Window
+from django.db.models.functions import RowNumber
 from .models import Producto, Categoria, Marca, Estudio, Tematica, Segmento  #  añade Segmento
 from django.contrib import messages
 from django.urls import reverse
 from django.utils import timezone
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage
 from .models import NewsletterSubscriber
 from django.contrib.auth.decorators import login_required 
 from .models import Order
+from .imagenes import url_rendicion
+from .checkout import crear_pedido, StockInsuficiente
+from . import carrito
+from .carrito import obtener_carrito
+from .filtros import leer_filtros, filtrar_productos, ordenar_productos, orden_listado
+from .paginacion import PaginacionKeysetMixin
+from .facetas import facetas, facetas_de_filtros
+from . import snapshot
+from .search import buscar_ids
+from .page_cache import cache_pagina
+from .cache import cached_query
+from tareas.correo import encolar_correo
+from django.utils.decorators import method_decorator
+
+logger = logging.getLogger(__name__)
 
 
 # =======================
 # HOME
 # =======================
-def home(request):
+def _hero_por_categoria(slugs):
+    """
+    Portada del producto más relevante (destacado, más nuevo) de cada
+    categoría, en una sola consulta con ROW_NUMBER() por categoría.
+    Devuelve {slug: url o None}.
+    """
+    slugs = [s.lower() for s in slugs]
+    if not slugs:
+        return {}
+    prods = (
+        Producto.objects
+        .filter(activo=True, stock__gt=0, categoria__slug__in=slugs)
+        .con_portada()
+        .annotate(
+            cat_slug=F("categoria__slug"),
+            fila=Window(
+                RowNumber(),
+                partition_by=F("categoria_id"),
+                order_by=[F("destacado").desc(), F("creado").desc()],
+            ),
+        )
+        .filter(fila=1)
+    )
+    urls = {}
+    for prod in prods:
+        try:
+            urls[prod.cat_slug.lower()] = url_rendicion(prod.portada(), "zoom") or None
+        except ValueError:  # imagen sin archivo asociado
+            urls[prod.cat_slug.lower()] = None
+    return {slug: urls.get(slug) for slug in slugs}
+
+
+def _datos_home():
     # Destacados elegidos en admin (ordenados por destacado_orden)
     destacados = (
         Producto.objects
         .filter(activo=True, stock__gt=0, destacado=True)
         .select_related("categoria", "marca")
+        .con_portada()
         .order_by("destacado_orden", "-creado")[:8]
     )
 
@@ -30,6 +81,7 @@ def home(request):
         Producto.objects
         .filter(activo=True, stock__gt=0)
         .select_related("categoria", "marca")
+        .con_portada()
         .order_by("-creado")[:8]
     )
 
@@ -44,47 +96,67 @@ def home(request):
                .order_by("nombre")[:12]
     )
 
-    # 👇 SOLO UNA IMAGEN POR CATEGORÍA
-    cat_slugs = ["playeras", "hoodies", "pantalones", "calzado"]
-    cat_hero_imgs = {}
+    # 👇 SOLO UNA IMAGEN POR CATEGORÍA (una sola consulta para todas)
+    home_categorias = getattr(settings, "CATALOGO_HOME_CATEGORIAS", [])
+    cat_hero_imgs = _hero_por_categoria([slug for slug, *_ in home_categorias])
+    cat_hero_tiles = [
+        {"slug": slug, "nombre": nombre, "fallback": fallback, "img": cat_hero_imgs.get(slug)}
+        for slug, nombre, fallback in home_categorias
+    ]
+
+    # Listas (no querysets) para poder compartirlas por el cache
+    return {
+        "destacados": list(destacados),
+        "nuevos": list(nuevos),
+        "categorias": list(categorias),
+        "marcas_menu": list(marcas_menu),
+        "tematicas": list(tematicas),
+        "cat_hero_imgs": cat_hero_imgs,
+        "cat_hero_tiles": cat_hero_tiles,
+    }
 
-    for slug in cat_slugs:
-        prod = (
-            Producto.objects
-            .filter(
-                activo=True,
-                stock__gt=0,
-                categoria__slug__iexact=slug
-            )
-            .select_related("categoria")
-            .order_by("-destacado", "-creado")
-            .first()             # 👈 solo uno
-        )
 
-        url = None
-        if prod:
-            if getattr(prod, "portada_url", None):
-                url = prod.portada_url
-            elif getattr(prod, "imagen", None):
-                try:
-                    url = prod.imagen.url
-                except ValueError:
-                    url = None
-
-        cat_hero_imgs[slug] = url  # string o None
-
-    return render(request, "catalogo/home.html", {
-        "destacados": destacados,
-        "nuevos": nuevos,
-        "categorias": categorias,
-        "marcas_menu": marcas_menu,
-        "tematicas": tematicas,
-        "cat_hero_imgs": cat_hero_imgs,
-    })
+@cache_pagina("producto", "marca", "tematica", "categoria")
+def home(request):
+    # Compartido entre workers: sirve también a usuarios con sesión
+    datos = cached_query("home", _datos_home, tags=("producto", "marca", "tematica", "categoria"))
+    return render(request, "catalogo/home.html", datos)
 # =======================
 # LISTA DE PRODUCTOS + FILTROS
 # =======================
-class ProductoLista(ListView):
+FACETAS_LISTA = [
+    ("Categoría", "categoria", "cat"),
+    ("Marca", "marca", "marca"),
+    ("Estudio", "estudio", "estudio"),
+    ("Estilo", "tematica", "tematica"),
+    ("Segmento", "segmento", "segmento"),
+]
+
+
+# Selector de orden del listado (ver catalogo.filtros.ORDENES)
+ORDENES_LISTA = [
+    ("", "Relevancia / más nuevos"),
+    ("precio_asc", "Precio: menor a mayor"),
+    ("precio_desc", "Precio: mayor a menor"),
+]
+# Lo que cambia el formulario de precio/orden (el resto viaja oculto)
+PARAMS_FORM_PRECIO = ("orden", "precio_min", "precio_max", "page", "cursor")
+
+
+def _url_filtro(GET, param, valor):
+    """Querystring actual con `param` cambiado (o quitado) y sin ?page= ni ?cursor=."""
+    params = GET.copy()
+    params.pop("page", None)
+    params.pop("cursor", None)
+    if valor:
+        params[param] = valor
+    else:
+        params.pop(param, None)
+    return "?" + params.urlencode()
+
+
+@method_decorator(cache_pagina("producto", "categoria", "marca", "estudio", "tematica", "segmento"), name="dispatch")
+class ProductoLista(PaginacionKeysetMixin, ListView):
     model = Producto
     template_name = "catalogo/producto_lista.html"
     context_object_name = "productos"
@@ -94,68 +166,26 @@ class ProductoLista(ListView):
         qs = (Producto.objects
               .filter(activo=True, stock__gt=0)
               .select_related("categoria", "marca", "estudio", "segmento")  # 👈 optimiza
+              .con_portada()
               .prefetch_related("tematicas")
               .order_by("-creado"))
 
-        # filtros por querystring
-        q = (self.request.GET.get("q") or "").strip()
-        cat = (self.request.GET.get("cat") or "").strip()
-        marca = (self.request.GET.get("marca") or "").strip()
-        estudio = (self.request.GET.get("estudio") or "").strip()
-        tematica = (self.request.GET.get("tematica") or "").strip()
-        segmento = (self.request.GET.get("segmento") or "").strip()   # 👈 nuevo
-        destacados = (self.request.GET.get("destacados") or "").strip()  # "1"
-        ofertas = (self.request.GET.get("ofertas") or "").strip()        # "1"
-
-        if q:
-            qs = qs.filter(
-                Q(nombre__icontains=q) |
-                Q(categoria__nombre__icontains=q) |
-                Q(descripcion__icontains=q) |
-                Q(marca__nombre__icontains=q) |
-                Q(estudio__nombre__icontains=q) |
-                Q(tematicas__nombre__icontains=q) |
-                Q(segmento__nombre__icontains=q)   # 👈 busca por segmento
-            )
-
-        if cat:
-            qs = qs.filter(
-                Q(categoria__slug__iexact=cat) |
-                Q(categoria__nombre__iexact=cat)
-            )
-
-        if marca:
-            qs = qs.filter(
-                Q(marca__slug__iexact=marca) |
-                Q(marca__nombre__iexact=marca)
-            )
-
-        if estudio:
-            qs = qs.filter(
-                Q(estudio__slug__iexact=estudio) |
-                Q(estudio__nombre__iexact=estudio)
-            )
-
-        if tematica:
-            qs = qs.filter(
-                Q(tematicas__slug__iexact=tematica) |
-                Q(tematicas__nombre__iexact=tematica)
-            )
-
-        if segmento:
-            qs = qs.filter(
-                Q(segmento__slug__iexact=segmento) |
-                Q(segmento__nombre__iexact=segmento)
-            )
-
-        if destacados in ("1", "true", "True"):
-            qs = qs.filter(destacado=True).order_by("destacado_orden", "-creado")
-
-        elif ofertas in ("1", "true", "True"):
-            qs = qs.filter(descuento__gt=0).order_by("-descuento", "-creado")
-
-        # Evita duplicados con M2M (temáticas)
-        return qs.distinct()
+        # filtros por querystring (compartidos con la API, ver catalogo.filtros)
+        f = leer_filtros(self.request.GET)
+        if snapshot.activo():
+            # Filtrar y ordenar contra la foto en memoria; a la BD solo va la página
+            ids = buscar_ids(f["q"]) if f["q"] else None
+            try:
+                orden = snapshot.ids_listado(f, ids)
+            except OSError:
+                logger.exception("Foto del catálogo no disponible; se usa la BD")
+            else:
+                self.filtros, self.ids_busqueda = f, ids
+                return snapshot.ListaPorIds(orden, qs)
+
+        # ?q= va a la BD como subconsulta y se ordena por el puntaje del motor
+        self.filtros, self.ids_busqueda = f, None
+        return ordenar_productos(filtrar_productos(qs, f), f)
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
@@ -169,8 +199,42 @@ class ProductoLista(ListView):
         ctx["segmento_f"] = (self.request.GET.get("segmento") or "").strip()     # 👈 nuevo
         ctx["destacados_f"] = (self.request.GET.get("destacados") or "").strip() # 👈 nuevo
         ctx["ofertas_f"] = (self.request.GET.get("ofertas") or "").strip()       # 👈 nuevo
+        ctx["orden_f"] = self.filtros["orden"]
+        ctx["precio_min_f"] = self.filtros["precio_min"]
+        ctx["precio_max_f"] = self.filtros["precio_max"]
+        ctx["ordenes"] = ORDENES_LISTA
+        ctx["filtros_ocultos"] = [
+            (k, v) for k, v in self.request.GET.items() if k not in PARAMS_FORM_PRECIO and v
+        ]
+
+        # Conteos de todas las facetas con los filtros actuales (ver catalogo.facetas)
+        # (el índice de facetas es en memoria: ahí sí hacen falta los ids de ?q=)
+        ids = self.ids_busqueda
+        if ids is None and self.filtros["q"]:
+            ids = buscar_ids(self.filtros["q"])
+        conteos = facetas_de_filtros(self.filtros, ids)
+        ctx["total_filtrado"] = conteos["total"]
+        ctx["facetas"] = [
+            self._faceta(titulo, param, conteos[dim])
+            for titulo, dim, param in FACETAS_LISTA
+        ]
         return ctx
 
+    def _faceta(self, titulo, param, opciones):
+        actual = self.filtros[param].lower()
+        for o in opciones:
+            o.activa = actual in (o.slug.lower(), o.nombre.lower())
+            o.url = _url_filtro(self.request.GET, param, o.slug)
+        return {
+            "titulo": titulo,
+            "opciones": opciones,
+            "quitar": _url_filtro(self.request.GET, param, None) if actual else None,
+        }
+
+    def get_orden_keyset(self):
+        # Con ?q= se ordena por relevancia: ahí sigue la paginación por número
+        return orden_listado(self.filtros)
+
 
 # =======================
 # DETALLE DE PRODUCTO
@@ -198,6 +262,7 @@ class ProductoDetalle(DetailView):
 # =======================
 # MARCAS (LISTA Y DETALLE)
 # =======================
+@method_decorator(cache_pagina("marca", "producto"), name="dispatch")
 class MarcasLista(ListView):
     model = Marca
     template_name = "catalogo/marcas_lista.html"
@@ -205,7 +270,8 @@ class MarcasLista(ListView):
     paginate_by = 24  # opcional
 
     def get_queryset(self):
-        return (
+        # Lista compartida por el cache; el paginador trabaja igual sobre ella
+        return cached_query("marcas_lista", lambda: list(
             Marca.objects
             .annotate(
                 num_prod=Count(
@@ -214,29 +280,34 @@ class MarcasLista(ListView):
                 )
             )
             .order_by("nombre")
-        )
+        ), tags=("marca", "producto"))
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        ctx["categorias"] = Categoria.objects.order_by("nombre")
-        ctx["productos_populares"] = (
+        ctx["categorias"] = cached_query("categorias", lambda: list(
+            Categoria.objects.order_by("nombre")
+        ), tags=("categoria",))
+        ctx["productos_populares"] = cached_query("productos_populares", lambda: list(
             Producto.objects
             .filter(activo=True, stock__gt=0)
             .select_related("marca", "categoria", "estudio", "segmento")
+            .con_portada()
             .prefetch_related("tematicas")
             .order_by("-destacado", "destacado_orden", "-creado")[:8]
-        )
+        ), tags=("producto", "marca", "categoria", "estudio", "segmento", "tematica"))
         # Alternativas:
         # .order_by("-creado")[:8]             # “Nuevos”
         # .filter(descuento__gt=0).order_by("-descuento", "-creado")[:8]  # “Ofertas”
         return ctx
 
 
-class MarcaDetalle(ListView):
+@method_decorator(cache_pagina("marca", "estudio", "segmento", "producto"), name="dispatch")
+class MarcaDetalle(PaginacionKeysetMixin, ListView):
     model = Producto
     template_name = "catalogo/marca_detalle.html"
     context_object_name = "productos"
     paginate_by = 12
+    ORDEN = ("-creado", "id")
 
     def get_queryset(self):
         self.marca = get_object_or_404(Marca, slug=self.kwargs["slug"])
@@ -246,8 +317,9 @@ class MarcaDetalle(ListView):
         qs = (Producto.objects
               .filter(marca=self.marca, activo=True, stock__gt=0)
               .select_related("categoria", "marca", "estudio", "segmento")
+              .con_portada()
               .prefetch_related("tematicas")
-              .order_by("-creado"))
+              .order_by(*self.ORDEN))
 
         if self.estudio_slug:
             qs = qs.filter(
@@ -261,20 +333,18 @@ class MarcaDetalle(ListView):
                 Q(segmento__nombre__iexact=self.segmento_slug)
             )
 
-        return qs.distinct()
+        return qs
+
+    def get_orden_keyset(self):
+        return self.ORDEN
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        estudios = (Estudio.objects
-                    .filter(productos__marca=self.marca,
-                            productos__activo=True,
-                            productos__stock__gt=0)
-                    .distinct()
-                    .annotate(num_prod=Count("productos", filter=Q(
-                        productos__marca=self.marca,
-                        productos__activo=True,
-                        productos__stock__gt=0
-                    ))))
+        estudios = facetas({
+            "marca": [self.marca.pk],
+            "estudio": [self.estudio_slug] if self.estudio_slug else [],
+            "segmento": [self.segmento_slug] if self.segmento_slug else [],
+        }, dimensiones=["estudio"])["estudio"]
 
         ctx["marca"] = self.marca
         ctx["estudios_marca"] = estudios
@@ -287,11 +357,13 @@ class MarcaDetalle(ListView):
 # =======================
 # TEMÁTICAS (DETALLE POR ESTILO)
 # =======================
-class TematicaDetalle(ListView):
+@method_decorator(cache_pagina("tematica", "marca", "estudio", "segmento", "producto"), name="dispatch")
+class TematicaDetalle(PaginacionKeysetMixin, ListView):
     model = Producto
     template_name = "catalogo/tematica_detalle.html"
     context_object_name = "productos"
     paginate_by = 12
+    ORDEN = ("-creado", "id")
 
     def get_queryset(self):
         self.tematica = get_object_or_404(Tematica, slug=self.kwargs["slug"])
@@ -302,8 +374,9 @@ class TematicaDetalle(ListView):
         qs = (Producto.objects
               .filter(tematicas=self.tematica, activo=True, stock__gt=0)
               .select_related("categoria", "marca", "estudio", "segmento")
+              .con_portada()
               .prefetch_related("tematicas")
-              .order_by("-creado"))
+              .order_by(*self.ORDEN))
 
         if self.marca_slug:
             qs = qs.filter(Q(marca__slug__iexact=self.marca_slug) |
@@ -315,36 +388,25 @@ class TematicaDetalle(ListView):
             qs = qs.filter(Q(segmento__slug__iexact=self.segmento_slug) |
                            Q(segmento__nombre__iexact=self.segmento_slug))
 
-        return qs.distinct()
+        return qs
+
+    def get_orden_keyset(self):
+        return self.ORDEN
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
 
-        marcas = (Marca.objects
-                  .filter(productos__tematicas=self.tematica,
-                          productos__activo=True,
-                          productos__stock__gt=0)
-                  .distinct()
-                  .annotate(num_prod=Count("productos", filter=Q(
-                      productos__tematicas=self.tematica,
-                      productos__activo=True,
-                      productos__stock__gt=0
-                  ))))
-
-        estudios = (Estudio.objects
-                    .filter(productos__tematicas=self.tematica,
-                            productos__activo=True,
-                            productos__stock__gt=0)
-                    .distinct()
-                    .annotate(num_prod=Count("productos", filter=Q(
-                        productos__tematicas=self.tematica,
-                        productos__activo=True,
-                        productos__stock__gt=0
-                    ))))
+        # Marcas y estudios de la temática en una pasada (ver catalogo.facetas)
+        conteos = facetas({
+            "tematica": [self.tematica.pk],
+            "marca": [self.marca_slug] if self.marca_slug else [],
+            "estudio": [self.estudio_slug] if self.estudio_slug else [],
+            "segmento": [self.segmento_slug] if self.segmento_slug else [],
+        }, dimensiones=["marca", "estudio"])
 
         ctx["tematica"] = self.tematica
-        ctx["marcas_tematica"] = marcas
-        ctx["estudios_tematica"] = estudios
+        ctx["marcas_tematica"] = conteos["marca"]
+        ctx["estudios_tematica"] = conteos["estudio"]
         ctx["marca_f"] = self.marca_slug
         ctx["estudio_f"] = self.estudio_slug
         ctx["segmento_f"] = self.segmento_slug  # 👈
@@ -353,31 +415,23 @@ class TematicaDetalle(ListView):
 
 
 # =======================
-# CARRITO (SESIÓN)
+# CARRITO (en BD, ver catalogo.carrito)
 # =======================
-CART_SESSION_KEY = "cart"
-
-def _get_cart(session):
-    return session.get(CART_SESSION_KEY, {})
-
-def _save_cart(session, cart):
-    session[CART_SESSION_KEY] = cart
-    session.modified = True
-
 def carrito_detalle(request):
-    cart = _get_cart(request.session)
-    ids = [int(pid) for pid in cart.keys()]
-    productos = Producto.objects.filter(id__in=ids)
+    cart = obtener_carrito(request)
+    lineas = cart.lineas.select_related("producto") if cart else []
 
     items = []
     subtotal = Decimal("0.00")
     descuento_total = Decimal("0.00")
+    lineas_precio = Decimal("0.00")
 
-    for p in productos:
-        qty = int(cart.get(str(p.id), 0))
-        # Precio base y final (si tienes precio_final())
+    for linea in lineas:
+        p = linea.producto
+        qty = linea.qty
+        # Precio base y final (guardado en el producto)
         precio_base = Decimal(str(getattr(p, "precio", 0)))
-        precio_unit = Decimal(str(p.precio_final() if hasattr(p, "precio_final") else p.precio))
+        precio_unit = Decimal(str(p.precio_final))
 
         sub_base = (precio_base * qty).quantize(Decimal("0.01"))
         sub_unit = (precio_unit * qty).quantize(Decimal("0.01"))
@@ -385,6 +439,7 @@ def carrito_detalle(request):
 
         subtotal += sub_unit
         descuento_total += max(desc_linea, Decimal("0.00"))
+        lineas_precio += (linea.unit_price * qty).quantize(Decimal("0.01"))
 
         items.append({
             "producto": p,
@@ -395,6 +450,14 @@ def carrito_detalle(request):
             "desc_linea": desc_linea,  # > 0 si hay oferta
         })
 
+    # Si cambió algún precio desde que se agregó, se refrescan líneas y contadores
+    if cart and subtotal != lineas_precio:
+        for linea, it in zip(lineas, items):
+            if linea.unit_price != it["precio_unit"]:
+                linea.unit_price = it["precio_unit"]
+                linea.save(update_fields=["unit_price"])
+        carrito.recalcular(cart)
+
     envio_estimado = Decimal("50.00") if items else Decimal("0.00")
     total_con_envio = (subtotal + envio_estimado).quantize(Decimal("0.01"))
 
@@ -412,62 +475,17 @@ def carrito_detalle(request):
 
 def carrito_agregar(request, producto_id):
     producto = get_object_or_404(Producto, pk=producto_id, activo=True)
-    cart = _get_cart(request.session)
     qty = int((request.POST.get("qty") or request.GET.get("qty") or 1))
-    actual = int(cart.get(str(producto_id), 0))
-    nuevo = min(actual + qty, producto.stock)  # no exceder stock
-    if nuevo > 0:
-        cart[str(producto_id)] = nuevo
-    _save_cart(request.session, cart)
+    # Tope de stock orientativo: la reserva real (con bloqueo) se hace en el checkout
+    carrito.agregar(obtener_carrito(request, crear=True), producto, qty)
     return redirect("carrito_detalle")
 
 def carrito_quitar(request, producto_id):
-    cart = _get_cart(request.session)
-    remove_all = request.GET.get("all") == "1"
-    if str(producto_id) in cart:
-        if remove_all or cart[str(producto_id)] <= 1:
-            cart.pop(str(producto_id))
-        else:
-            cart[str(producto_id)] = int(cart[str(producto_id)]) - 1
-        _save_cart(request.session, cart)
+    cart = obtener_carrito(request)
+    if cart:
+        carrito.quitar(cart, producto_id, todo=request.GET.get("all") == "1")
     return redirect("carrito_detalle")
 
-def _cart_items_and_total(session):
-    """
-    Convierte el carrito en:
-      - items: lista de dicts [{id, name, price, qty}]
-      - total: Decimal redondeado a 2 decimales
-    Usa precio_final() si existe.
-    """
-    cart = _get_cart(session)  # dict: {product_id: qty}
-    if not cart:
-        return [], Decimal("0.00")
-
-    ids = [int(pid) for pid in cart.keys()]
-    productos = Producto.objects.filter(id__in=ids)
-
-    items = []
-    total = Decimal("0.00")
-
-    for p in productos:
-        qty = int(cart.get(str(p.id), 0))
-        if qty <= 0:
-            continue
-
-        precio_unit = Decimal(str(p.precio_final() if hasattr(p, "precio_final") else p.precio)).quantize(Decimal("0.01"))
-        subtotal = (precio_unit * qty).quantize(Decimal("0.01"))
-        total += subtotal
-
-        items.append({
-            "id": p.id,
-            "name": p.nombre,
-            "price": float(precio_unit),  # JSON serializable
-            "qty": qty,
-        })
-
-    return items, total.quantize(Decimal("0.01"))
-
-
 def newsletter_subscribe(request):
     if request.method != "POST":
         return redirect("inicio")
@@ -490,7 +508,7 @@ def newsletter_subscribe(request):
         reverse("newsletter_confirm", args=[sub.token])
     )
 
-    # Email (en desarrollo se imprime en consola por tu EMAIL_BACKEND)
+    # Email: se encola y lo envía el worker (en desarrollo sale por consola)
     subject = "Confirma tu suscripción"
     body = (
         "¡Gracias por suscribirte a DNM Wear!\n\n"
@@ -498,7 +516,10 @@ def newsletter_subscribe(request):
         f"{confirm_url}\n\n"
         "Si no fuiste tú, ignora este mensaje."
     )
-    send_mail(subject, body, None, [email], fail_silently=True)
+    # Clave por token y hora: reenviar el formulario no duplica el correo
+    hora = timezone.now().strftime("%Y%m%d%H")
+    encolar_correo(EmailMessage(subject, body, None, [email]),
+                   clave=f"newsletter-confirmacion:{sub.token}:{hora}")
 
     messages.success(
         request,
@@ -529,21 +550,27 @@ def cuenta_perfil(request):
 
 @login_required
 def checkout(request):
-    items, total = _cart_items_and_total(request.session)
-    if not items:
+    cart = obtener_carrito(request)
+    lineas = carrito.como_dict(cart)
+    if not lineas:
         messages.warning(request, "Tu carrito está vacío.")
         return redirect("carrito_detalle")
 
-    # Guarda pedido SIMULADO
-    order = Order.objects.create(
-        user=request.user,
-        total=total,
-        items=items,
-        status="PAID",  # simulamos pago aprobado
-    )
+    # Guarda pedido SIMULADO reservando stock en una sola transacción
+    try:
+        order = crear_pedido(request.user, lineas)
+    except StockInsuficiente as exc:
+        # Nada se cobró ni se descontó: dejamos el carrito con lo disponible
+        carrito.ajustar(cart, exc)
+        messages.error(request, f"{exc.mensaje()}. Ajustamos tu carrito, revísalo antes de pagar.")
+        return redirect("carrito_detalle")
+
+    if order is None:
+        messages.warning(request, "Tu carrito está vacío.")
+        return redirect("carrito_detalle")
 
     # Limpia carrito
-    _save_cart(request.session, {})
+    carrito.vaciar(cart)
 
     messages.success(request, f"Compra simulada creada: Pedido #{order.id}")
     return redirect("pedido_detalle", order_id=order.id)
@@ -0,0 +1,21 @@
+from django.contrib import admin, messages
+from django.utils import timezone
+
+from .models import Tarea
+
+
+@admin.register(Tarea)
+class TareaAdmin(admin.ModelAdmin):
+    list_display = ("id", "nombre", "estado", "intentos", "max_intentos", "ejecutar_en", "creada", "terminada_en")
+    list_filter = ("estado", "nombre")
+    search_fields = ("nombre", "clave")
+    readonly_fields = ("creada", "tomada_en", "terminada_en", "error")
+    date_hierarchy = "creada"
+    actions = ["reintentar"]
+
+    @admin.action(description="Reintentar ahora")
+    def reintentar(self, request, queryset):
+        n = queryset.exclude(estado=Tarea.EN_CURSO).update(
+            estado=Tarea.PENDIENTE, intentos=0, ejecutar_en=timezone.now(), error=""
+        )
+        self.message_user(request, f"{n} tareas devueltas a la cola.", messages.SUCCESS)
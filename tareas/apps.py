@@ -0,0 +1,14 @@
+from django.apps import AppConfig
+
+
+class TareasConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'tareas'
+    verbose_name = "Cola de tareas"
+
+    def ready(self):
+        from django.utils.module_loading import autodiscover_modules
+
+        from . import correo  # noqa: F401  (registra la tarea de envío de correo)
+        # Cada app puede declarar sus tareas en <app>/tareas.py
+        autodiscover_modules("tareas")
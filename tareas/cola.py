@@ -0,0 +1,186 @@
+# tareas/cola.py
+"""
+Cola de tareas en la base de datos.
+
+Las tareas se registran con @tarea("nombre") y se encolan con encolar():
+la fila se escribe en la misma transacción que el resto de la petición,
+así que si la petición hace rollback la tarea tampoco existe. El worker
+(`manage.py run_worker`) toma las pendientes, las ejecuta en un pool de
+hilos y, si fallan, las reprograma con backoff exponencial hasta agotar
+los intentos.
+
+Funciona igual en SQLite, MySQL y PostgreSQL: donde hay
+SELECT ... FOR UPDATE SKIP LOCKED se usa para repartir filas entre
+workers; en el resto, cada fila se reclama con un UPDATE condicionado al
+estado (solo un worker consigue cambiarla).
+
+La entrega es "al menos una vez": si un worker muere a mitad de una
+tarea, esta vuelve a la cola tras TAREAS_TIMEOUT. Las tareas deben poder
+repetirse sin daño.
+"""
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Tarea
+
+logger = logging.getLogger(__name__)
+
+_REGISTRO = {}
+
+
+class TareaNoRegistrada(LookupError):
+    pass
+
+
+def tarea(nombre):
+    """Decorador: registra la función como tarea con ese nombre."""
+    def registrar(func):
+        _REGISTRO[nombre] = func
+        func.nombre_tarea = nombre
+        return func
+    return registrar
+
+
+def _nombre(func_o_nombre):
+    nombre = getattr(func_o_nombre, "nombre_tarea", func_o_nombre)
+    if nombre not in _REGISTRO:
+        raise TareaNoRegistrada(nombre)
+    return nombre
+
+
+# =======================
+# ENCOLAR
+# =======================
+def encolar(func_o_nombre, args=(), kwargs=None, clave=None, retraso=0, max_intentos=None):
+    """
+    Crea la tarea (args/kwargs deben ser serializables a JSON). Con `clave`,
+    si ya existe una tarea con esa clave se devuelve la existente sin crear
+    otra. `retraso` en segundos.
+    """
+    nombre = _nombre(func_o_nombre)
+    datos = {
+        "nombre": nombre,
+        "args": list(args),
+        "kwargs": kwargs or {},
+        "ejecutar_en": timezone.now() + timedelta(seconds=retraso),
+        "max_intentos": max_intentos or getattr(settings, "TAREAS_MAX_INTENTOS", 5),
+    }
+    if clave:
+        obj, creada = Tarea.objects.get_or_create(clave=clave, defaults=datos)
+    else:
+        obj, creada = Tarea.objects.create(**datos), True
+
+    if creada and getattr(settings, "TAREAS_SINCRONO", False):
+        # Sin worker (dev/pruebas): se ejecuta al confirmar la transacción
+        transaction.on_commit(lambda: _ejecutar_sincrono(obj.pk))
+    return obj
+
+
+def _ejecutar_sincrono(pk):
+    if Tarea.objects.filter(pk=pk, estado=Tarea.PENDIENTE).update(
+        estado=Tarea.EN_CURSO, tomada_en=timezone.now(), intentos=F("intentos") + 1
+    ):
+        ejecutar(pk)
+
+
+# =======================
+# WORKER
+# =======================
+def _pendientes(ahora):
+    return (
+        Tarea.objects.filter(estado=Tarea.PENDIENTE, ejecutar_en__lte=ahora)
+        .order_by("ejecutar_en", "pk")
+    )
+
+
+def tomar(limite):
+    """Reclama hasta `limite` tareas vencidas. Devuelve sus ids."""
+    if limite <= 0:
+        return []
+    ahora = timezone.now()
+    cambios = {"estado": Tarea.EN_CURSO, "tomada_en": ahora, "intentos": F("intentos") + 1}
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(
+                _pendientes(ahora).select_for_update(skip_locked=True)
+                .values_list("pk", flat=True)[:limite]
+            )
+            if ids:
+                Tarea.objects.filter(pk__in=ids).update(**cambios)
+        return ids
+
+    # Sin SKIP LOCKED: UPDATE condicionado; si otro worker la tomó antes, 0 filas
+    ids = []
+    for pk in _pendientes(ahora).values_list("pk", flat=True)[:limite * 2]:
+        if Tarea.objects.filter(pk=pk, estado=Tarea.PENDIENTE).update(**cambios):
+            ids.append(pk)
+            if len(ids) >= limite:
+                break
+    return ids
+
+
+def backoff(intentos):
+    """Segundos hasta el siguiente intento: base * 2^(n-1) con tope y algo de jitter."""
+    base = getattr(settings, "TAREAS_BACKOFF_BASE", 30)
+    tope = getattr(settings, "TAREAS_BACKOFF_MAX", 3600)
+    espera = min(base * 2 ** max(intentos - 1, 0), tope)
+    return espera + random.uniform(0, espera / 10)
+
+
+def ejecutar(pk):
+    """Ejecuta una tarea ya reclamada (estado EN_CURSO) y registra el resultado."""
+    t = Tarea.objects.get(pk=pk)
+    try:
+        func = _REGISTRO.get(t.nombre)
+        if func is None:
+            raise TareaNoRegistrada(t.nombre)
+        func(*t.args, **t.kwargs)
+    except Exception as exc:
+        detalle = traceback.format_exc()[-4000:]
+        ahora = timezone.now()
+        if isinstance(exc, TareaNoRegistrada) or t.intentos >= t.max_intentos:
+            logger.error("Tarea %s #%s fallida tras %s intentos", t.nombre, pk, t.intentos)
+            Tarea.objects.filter(pk=pk).update(
+                estado=Tarea.FALLIDA, terminada_en=ahora, error=detalle
+            )
+        else:
+            espera = backoff(t.intentos)
+            logger.warning("Tarea %s #%s falló (intento %s), reintento en %.0fs",
+                           t.nombre, pk, t.intentos, espera)
+            Tarea.objects.filter(pk=pk).update(
+                estado=Tarea.PENDIENTE, error=detalle,
+                ejecutar_en=ahora + timedelta(seconds=espera),
+            )
+        return False
+
+    Tarea.objects.filter(pk=pk).update(
+        estado=Tarea.HECHA, terminada_en=timezone.now(), error=""
+    )
+    return True
+
+
+def rescatar():
+    """Devuelve a la cola las tareas de workers que murieron a mitad."""
+    limite = timezone.now() - timedelta(seconds=getattr(settings, "TAREAS_TIMEOUT", 600))
+    colgadas = Tarea.objects.filter(estado=Tarea.EN_CURSO, tomada_en__lt=limite)
+    fallidas = colgadas.filter(intentos__gte=F("max_intentos")).update(
+        estado=Tarea.FALLIDA, terminada_en=timezone.now(),
+        error="Sin respuesta del worker (timeout)",
+    )
+    return fallidas + colgadas.update(estado=Tarea.PENDIENTE, ejecutar_en=timezone.now())
+
+
+def purgar():
+    """Borra las tareas terminadas con éxito más viejas que la retención."""
+    dias = getattr(settings, "TAREAS_RETENCION_DIAS", 7)
+    limite = timezone.now() - timedelta(days=dias)
+    borradas, _ = Tarea.objects.filter(estado=Tarea.HECHA, terminada_en__lt=limite).delete()
+    return borradas
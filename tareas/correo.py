@@ -0,0 +1,116 @@
+# tareas/correo.py
+"""
+Envío de correo a través de la cola.
+
+EmailBackend es el EMAIL_BACKEND del proyecto: send_mail(), allauth, el
+reset de contraseña y la newsletter solo escriben una tarea en la BD; el
+worker arma el mensaje y lo envía con el backend real
+(TAREAS_EMAIL_BACKEND: consola en dev, SMTP en producción). Si el SMTP
+está lento o caído, la petición no se entera y el envío se reintenta.
+"""
+import base64
+from email import message_from_bytes
+from email.mime.base import MIMEBase
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+
+from .cola import encolar, tarea
+
+
+def _b64(datos):
+    return base64.b64encode(datos).decode("ascii")
+
+
+def serializar(mensaje):
+    """EmailMessage -> dict apto para JSON."""
+    adjuntos = []
+    for adjunto in mensaje.attachments:
+        if isinstance(adjunto, MIMEBase):
+            adjuntos.append({"mime": _b64(adjunto.as_bytes())})
+            continue
+        nombre, contenido, mimetype = adjunto
+        if isinstance(contenido, bytes):
+            adjuntos.append({"nombre": nombre, "b64": _b64(contenido), "mimetype": mimetype})
+        else:
+            adjuntos.append({"nombre": nombre, "texto": contenido, "mimetype": mimetype})
+
+    return {
+        "subject": mensaje.subject,
+        "body": mensaje.body,
+        "from_email": mensaje.from_email,
+        "to": list(mensaje.to),
+        "cc": list(mensaje.cc),
+        "bcc": list(mensaje.bcc),
+        "reply_to": list(mensaje.reply_to),
+        "headers": dict(mensaje.extra_headers),
+        "alternativas": [list(a) for a in getattr(mensaje, "alternatives", [])],
+        "adjuntos": adjuntos,
+        "content_subtype": mensaje.content_subtype,
+        "mixed_subtype": mensaje.mixed_subtype,
+    }
+
+
+def deserializar(datos):
+    mensaje = EmailMultiAlternatives(
+        subject=datos["subject"],
+        body=datos["body"],
+        from_email=datos["from_email"],
+        to=datos["to"],
+        cc=datos["cc"],
+        bcc=datos["bcc"],
+        reply_to=datos["reply_to"],
+        headers=datos["headers"],
+    )
+    for contenido, mimetype in datos["alternativas"]:
+        mensaje.attach_alternative(contenido, mimetype)
+    for adjunto in datos["adjuntos"]:
+        if "mime" in adjunto:
+            mensaje.attach(message_from_bytes(base64.b64decode(adjunto["mime"])))
+        elif "b64" in adjunto:
+            mensaje.attach(adjunto["nombre"], base64.b64decode(adjunto["b64"]), adjunto["mimetype"])
+        else:
+            mensaje.attach(adjunto["nombre"], adjunto["texto"], adjunto["mimetype"])
+    mensaje.content_subtype = datos["content_subtype"]
+    mensaje.mixed_subtype = datos["mixed_subtype"]
+    return mensaje
+
+
+@tarea("tareas.enviar_correo")
+def enviar_correo(datos):
+    """Envía con el backend real. Si falla, la excepción hace que se reintente."""
+    conexion = get_connection(
+        getattr(settings, "TAREAS_EMAIL_BACKEND", "django.core.mail.backends.smtp.EmailBackend")
+    )
+    mensaje = deserializar(datos)
+    mensaje.connection = conexion
+    mensaje.send()
+
+
+def encolar_correo(mensaje, clave=None):
+    """
+    Encola un EmailMessage; con `clave`, un reenvío no duplica el correo.
+    Si el proyecto no usa la cola (DJ_EMAIL_COLA=false) se envía directo.
+    """
+    if settings.EMAIL_BACKEND != f"{__name__}.EmailBackend":
+        return mensaje.send(fail_silently=True)
+    return encolar(enviar_correo, args=[serializar(mensaje)], clave=clave)
+
+
+class EmailBackend(BaseEmailBackend):
+    """Backend que no envía: encola una tarea por mensaje."""
+
+    def send_messages(self, email_messages):
+        enviados = 0
+        for mensaje in email_messages:
+            if not mensaje.recipients():
+                continue
+            try:
+                encolar_correo(mensaje)
+            except Exception:
+                if not self.fail_silently:
+                    raise
+                continue
+            enviados += 1
+        return enviados
@@ -0,0 +1,87 @@
+# tareas/management/commands/run_worker.py
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from tareas import cola
+
+MANTENIMIENTO_CADA = 60  # segundos entre rescatar colgadas y purgar viejas
+
+
+def _ejecutar(pk):
+    try:
+        return cola.ejecutar(pk)
+    finally:
+        # Cada hilo tiene su propia conexión: que no se queden abiertas de más
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = (
+        "Procesa la cola de tareas (correos y trabajos lentos) con un pool de "
+        "hilos. Ctrl+C / SIGTERM terminan las tareas en curso antes de salir."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hilos", type=int, default=getattr(settings, "TAREAS_HILOS", 4))
+        parser.add_argument("--intervalo", type=float, default=1.0,
+                            help="Segundos de espera cuando no hay tareas.")
+        parser.add_argument("--una-vez", action="store_true",
+                            help="Procesa lo que esté vencido y sale.")
+
+    def handle(self, *args, **opts):
+        hilos = max(opts["hilos"], 1)
+        intervalo = opts["intervalo"]
+        self._parar = False
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, self._senal)
+
+        self.stdout.write(f"Worker con {hilos} hilos. Esperando tareas...")
+        ok = fallos = 0
+        mantenimiento = 0.0
+        en_vuelo = set()
+        with ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="tarea") as pool:
+            while not self._parar:
+                if time.monotonic() - mantenimiento > MANTENIMIENTO_CADA:
+                    rescatadas = cola.rescatar()
+                    if rescatadas:
+                        self.stdout.write(f"{rescatadas} tareas colgadas devueltas a la cola.")
+                    cola.purgar()
+                    mantenimiento = time.monotonic()
+
+                ids = cola.tomar(hilos - len(en_vuelo))
+                en_vuelo.update(pool.submit(_ejecutar, pk) for pk in ids)
+                close_old_connections()
+
+                if opts["una_vez"] and not ids and not en_vuelo:
+                    break
+                if len(en_vuelo) >= hilos or (en_vuelo and not ids):
+                    # Pool lleno o cola vacía: esperar a que termine alguna
+                    hechas, en_vuelo = wait(
+                        en_vuelo, timeout=None if len(en_vuelo) >= hilos else intervalo,
+                        return_when=FIRST_COMPLETED,
+                    )
+                    ok, fallos = self._contar(hechas, ok, fallos)
+                elif not ids:
+                    time.sleep(intervalo)
+
+            # Salida ordenada: se esperan las que ya empezaron
+            ok, fallos = self._contar(wait(en_vuelo).done, ok, fallos)
+
+        self.stdout.write(self.style.SUCCESS(f"Worker detenido: {ok} tareas hechas, {fallos} con error."))
+
+    @staticmethod
+    def _contar(hechas, ok, fallos):
+        for futuro in hechas:
+            if futuro.exception() is None and futuro.result():
+                ok += 1
+            else:
+                fallos += 1
+        return ok, fallos
+
+    def _senal(self, signum, frame):
+        self._parar = True
@@ -0,0 +1,44 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Tarea(models.Model):
+    """Trabajo pendiente para el worker (`manage.py run_worker`)."""
+    PENDIENTE = "PENDIENTE"
+    EN_CURSO = "EN_CURSO"
+    HECHA = "HECHA"
+    FALLIDA = "FALLIDA"
+    ESTADO_CHOICES = [
+        (PENDIENTE, "Pendiente"),
+        (EN_CURSO, "En curso"),
+        (HECHA, "Hecha"),
+        (FALLIDA, "Fallida"),
+    ]
+
+    nombre = models.CharField("Tarea", max_length=100)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    # Encolar dos veces con la misma clave no crea una segunda tarea
+    clave = models.CharField(
+        "Clave de idempotencia", max_length=200, unique=True, null=True, blank=True
+    )
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default=PENDIENTE)
+    intentos = models.PositiveIntegerField(default=0)
+    max_intentos = models.PositiveIntegerField(default=5)
+    ejecutar_en = models.DateTimeField(default=timezone.now)
+    tomada_en = models.DateTimeField(null=True, blank=True)
+    terminada_en = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    creada = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Tarea"
+        verbose_name_plural = "Tareas"
+        ordering = ["-creada"]
+        indexes = [
+            # El worker busca: estado = PENDIENTE AND ejecutar_en <= ahora
+            models.Index(fields=["estado", "ejecutar_en"], name="tarea_estado_fecha"),
+        ]
+
+    def __str__(self):
+        return f"{self.nombre} #{self.pk} ({self.estado})"
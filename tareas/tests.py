@@ -0,0 +1,150 @@
+# tareas/tests.py
+"""Cola de tareas: encolar, reclamar, ejecutar con reintentos y rescatar."""
+from datetime import timedelta
+from unittest import mock
+
+from django.core import mail
+from django.core.mail import EmailMultiAlternatives, send_mail
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from . import cola
+from .cola import TareaNoRegistrada, backoff, ejecutar, encolar, rescatar, tarea, tomar
+from .correo import deserializar, serializar
+from .models import Tarea
+
+LLAMADAS = []
+
+
+@tarea("pruebas.anotar")
+def anotar(valor, extra=None):
+    LLAMADAS.append((valor, extra))
+
+
+@tarea("pruebas.fallar")
+def fallar():
+    raise RuntimeError("se cayó el SMTP")
+
+
+@override_settings(TAREAS_SINCRONO=False, TAREAS_MAX_INTENTOS=3,
+                   TAREAS_BACKOFF_BASE=30, TAREAS_BACKOFF_MAX=3600, TAREAS_TIMEOUT=600)
+class ColaTests(TestCase):
+    def setUp(self):
+        LLAMADAS.clear()
+
+    # ----- encolar -----
+    def test_encolar_crea_pendiente(self):
+        t = encolar(anotar, args=[1], kwargs={"extra": "x"})
+        self.assertEqual((t.nombre, t.estado, t.args, t.kwargs, t.max_intentos),
+                         ("pruebas.anotar", Tarea.PENDIENTE, [1], {"extra": "x"}, 3))
+
+    def test_encolar_tarea_no_registrada(self):
+        with self.assertRaises(TareaNoRegistrada):
+            encolar("pruebas.no_existe")
+
+    def test_clave_no_duplica(self):
+        primera = encolar(anotar, args=[1], clave="pedido-7")
+        segunda = encolar(anotar, args=[2], clave="pedido-7")
+        self.assertEqual(primera.pk, segunda.pk)
+        self.assertEqual(Tarea.objects.count(), 1)
+        self.assertEqual(Tarea.objects.get().args, [1])
+
+    # ----- tomar -----
+    def test_tomar_reclama_una_sola_vez(self):
+        t = encolar(anotar, args=[1])
+        self.assertEqual(tomar(10), [t.pk])
+        self.assertEqual(tomar(10), [])
+        t.refresh_from_db()
+        self.assertEqual((t.estado, t.intentos), (Tarea.EN_CURSO, 1))
+        self.assertIsNotNone(t.tomada_en)
+
+    def test_tomar_respeta_limite_orden_y_retraso(self):
+        primera = encolar(anotar, args=[1])
+        segunda = encolar(anotar, args=[2])
+        encolar(anotar, args=[3], retraso=3600)
+        self.assertEqual(tomar(1), [primera.pk])
+        self.assertEqual(tomar(10), [segunda.pk])  # la retrasada todavía no vence
+        self.assertEqual(tomar(0), [])
+
+    # ----- ejecutar -----
+    def test_ejecutar_ok(self):
+        t = encolar(anotar, args=[1], kwargs={"extra": "x"})
+        tomar(1)
+        self.assertTrue(ejecutar(t.pk))
+        t.refresh_from_db()
+        self.assertEqual(t.estado, Tarea.HECHA)
+        self.assertEqual(LLAMADAS, [(1, "x")])
+
+    def test_falla_reintenta_con_backoff_y_luego_falla(self):
+        t = encolar(fallar)
+        for intento in range(1, 4):
+            Tarea.objects.filter(pk=t.pk).update(ejecutar_en=timezone.now())
+            self.assertEqual(tomar(1), [t.pk])
+            antes = timezone.now()
+            self.assertFalse(ejecutar(t.pk))
+            t.refresh_from_db()
+            if intento < 3:
+                self.assertEqual(t.estado, Tarea.PENDIENTE)
+                self.assertGreaterEqual(t.ejecutar_en, antes + timedelta(seconds=30 * 2 ** (intento - 1)))
+                self.assertIn("se cayó el SMTP", t.error)
+        self.assertEqual((t.estado, t.intentos), (Tarea.FALLIDA, 3))
+        self.assertIsNotNone(t.terminada_en)
+
+    def test_tarea_desconocida_falla_sin_reintentar(self):
+        t = Tarea.objects.create(nombre="pruebas.borrada", estado=Tarea.EN_CURSO, intentos=1)
+        self.assertFalse(ejecutar(t.pk))
+        t.refresh_from_db()
+        self.assertEqual(t.estado, Tarea.FALLIDA)
+
+    def test_backoff_exponencial_con_tope(self):
+        with mock.patch.object(cola.random, "uniform", return_value=0):
+            self.assertEqual([backoff(n) for n in (1, 2, 3)], [30, 60, 120])
+            self.assertEqual(backoff(20), 3600)
+
+    # ----- rescatar -----
+    def test_rescatar_colgadas(self):
+        vieja = timezone.now() - timedelta(seconds=601)
+        colgada = Tarea.objects.create(nombre="pruebas.anotar", estado=Tarea.EN_CURSO,
+                                       intentos=1, max_intentos=3, tomada_en=vieja)
+        agotada = Tarea.objects.create(nombre="pruebas.anotar", estado=Tarea.EN_CURSO,
+                                       intentos=3, max_intentos=3, tomada_en=vieja)
+        reciente = Tarea.objects.create(nombre="pruebas.anotar", estado=Tarea.EN_CURSO,
+                                        intentos=1, tomada_en=timezone.now())
+        self.assertEqual(rescatar(), 2)
+        estados = dict(Tarea.objects.values_list("pk", "estado"))
+        self.assertEqual(estados, {colgada.pk: Tarea.PENDIENTE, agotada.pk: Tarea.FALLIDA,
+                                   reciente.pk: Tarea.EN_CURSO})
+
+
+class CorreoTests(TestCase):
+    def _mensaje(self):
+        mensaje = EmailMultiAlternatives(
+            "Tu pedido", "Texto plano", "tienda@example.com", ["cliente@example.com"],
+            cc=["copia@example.com"], bcc=["oculta@example.com"], reply_to=["ventas@example.com"],
+            headers={"X-Pedido": "7"},
+        )
+        mensaje.attach_alternative("<p>HTML</p>", "text/html")
+        mensaje.attach("factura.pdf", b"%PDF-1.4 \x00\xff", "application/pdf")
+        mensaje.attach("nota.txt", "ñandú", "text/plain")
+        return mensaje
+
+    def test_serializar_ida_y_vuelta(self):
+        original = self._mensaje()
+        copia = deserializar(serializar(original))
+        for campo in ("subject", "body", "from_email", "to", "cc", "bcc", "reply_to", "extra_headers"):
+            self.assertEqual(getattr(copia, campo), getattr(original, campo), campo)
+        self.assertEqual([tuple(a) for a in copia.alternatives], [tuple(a) for a in original.alternatives])
+        self.assertEqual([tuple(a) for a in copia.attachments], [tuple(a) for a in original.attachments])
+
+    @override_settings(EMAIL_BACKEND="tareas.correo.EmailBackend", TAREAS_SINCRONO=False,
+                       TAREAS_EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+    def test_send_mail_pasa_por_la_cola(self):
+        send_mail("Hola", "Cuerpo", "tienda@example.com", ["cliente@example.com"])
+        self.assertEqual(len(mail.outbox), 0)
+        t = Tarea.objects.get()
+        self.assertEqual(t.nombre, "tareas.enviar_correo")
+
+        self.assertEqual(tomar(1), [t.pk])
+        self.assertTrue(ejecutar(t.pk))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual((mail.outbox[0].subject, mail.outbox[0].to), ("Hola", ["cliente@example.com"]))
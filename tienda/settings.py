@@ -57,6 +57,7 @@ INSTALLED_APPS = [
     "catalogo",
     "accounts",
     "auditoria",   
+    "tareas",
     
     "api",  
 ]
@@ -159,6 +160,9 @@ LOGIN_REDIRECT_URL = "/"
 LOGOUT_REDIRECT_URL = "/"
 LOGIN_URL = "login"
 
+# Sesiones en BD + índice sesión -> usuario (accounts.UserSession) para el admin
+SESSION_ENGINE = "accounts.sessions"
+
 # Política de cuentas (allauth) para DEMO (sin verificación de email)
 ACCOUNT_AUTHENTICATION_METHOD = "username_email"  # compatible con todas las versiones
 ACCOUNT_EMAIL_REQUIRED = True
@@ -192,6 +196,100 @@ JAZZMIN_SETTINGS = {
     "welcome_sign": "Bienvenido al Panel",
 }
 
+# ---------- Cache compartido ----------
+# Debe ser compartido entre los workers de gunicorn (LocMem es por proceso).
+# DJ_CACHE_BACKEND:
+#   file      -> archivos en DJ_CACHE_LOCATION (default var/cache; sin servicios extra)
+#   db        -> tabla en la BD (correr `manage.py createcachetable` una vez)
+#   memcached -> DJ_CACHE_LOCATION=127.0.0.1:11211 (requiere pymemcache)
+#   redis     -> DJ_CACHE_LOCATION=redis://127.0.0.1:6379/1 (requiere redis)
+#   locmem    -> por proceso, solo para desarrollo
+_CACHE_BACKENDS = {
+    "file": ("django.core.cache.backends.filebased.FileBasedCache", str(BASE_DIR / "var" / "cache")),
+    "db": ("django.core.cache.backends.db.DatabaseCache", "cache_table"),
+    "memcached": ("django.core.cache.backends.memcached.PyMemcacheCache", "127.0.0.1:11211"),
+    "redis": ("django.core.cache.backends.redis.RedisCache", "redis://127.0.0.1:6379/1"),
+    "locmem": ("django.core.cache.backends.locmem.LocMemCache", "tienda"),
+}
+_cache_tipo = ENV("DJ_CACHE_BACKEND", "file")
+_cache_backend, _cache_location = _CACHE_BACKENDS[_cache_tipo]
+CACHES = {
+    "default": {
+        "BACKEND": _cache_backend,
+        "LOCATION": ENV("DJ_CACHE_LOCATION", _cache_location),
+        "TIMEOUT": 600,
+    }
+}
+if _cache_tipo in ("file", "db", "locmem"):
+    # Purgan al pasar de MAX_ENTRIES (default 300: poco para páginas y consultas)
+    CACHES["default"]["OPTIONS"] = {"MAX_ENTRIES": 20000, "CULL_FREQUENCY": 4}
+
+# ---------- Cache del catálogo ----------
+# Segundos máximos que vive el menú en cache (se invalida antes si cambia el catálogo)
+CATALOGO_MENU_CACHE_TIMEOUT = int(ENV("DJ_MENU_CACHE_TIMEOUT", "300"))
+
+# Resultados de catalogo.cache.cached_query (se invalidan antes por versión)
+CATALOGO_QUERY_CACHE_TIMEOUT = int(ENV("DJ_QUERY_CACHE_TIMEOUT", "600"))
+
+# Índice de facetas por proceso (catalogo.facetas): se pone al día con la
+# bitácora de cambios y se reconstruye entero cada tantos segundos
+CATALOGO_FACETAS_TTL = int(ENV("DJ_FACETAS_TTL", "600"))
+
+# Foto columnar de productos disponibles (catalogo.snapshot): ProductoLista
+# filtra y ordena contra este archivo mapeado (mmap) por todos los workers
+CATALOGO_SNAPSHOT = ENV("DJ_CATALOGO_SNAPSHOT", "true").lower() == "true"
+CATALOGO_SNAPSHOT_PATH = ENV("DJ_CATALOGO_SNAPSHOT_PATH", str(BASE_DIR / "var" / "catalogo.snap"))
+
+# Paginación de listados (catalogo.paginacion): "keyset" (cursor, sin OFFSET
+# ni COUNT completo) o "numeros" (Paginator de Django con ?page=). El total
+# se cuenta solo hasta el tope ("Más de 1000 productos").
+CATALOGO_PAGINACION = ENV("DJ_CATALOGO_PAGINACION", "keyset")
+CATALOGO_PAGINACION_TOPE = int(ENV("DJ_CATALOGO_PAGINACION_TOPE", "1000"))
+
+# Cache de página completa (anónimos) para home y listados del catálogo
+CATALOGO_PAGE_CACHE = ENV("DJ_PAGE_CACHE", "true").lower() == "true"
+CATALOGO_PAGE_CACHE_TIMEOUT = int(ENV("DJ_PAGE_CACHE_TIMEOUT", "600"))
+
+# Tarjetas de categoría del home: (slug, título, imagen si no hay producto)
+CATALOGO_HOME_CATEGORIAS = [
+    ("playeras", "Playeras", "https://images.unsplash.com/photo-1484515991647-c5760fcecfc7?q=80&w=1200&auto=format&fit=crop"),
+    ("hoodies", "Hoodies", "https://images.unsplash.com/photo-1515378791036-0648a3ef77b2?q=80&w=1200&auto=format&fit=crop"),
+    ("pantalones", "Pantalones", "https://images.unsplash.com/photo-1583496661160-cf9a8c2a7d7d?q=80&w=1200&auto=format&fit=crop"),
+    ("calzado", "Calzado", "https://images.unsplash.com/photo-1542291026-7eec264c27ff?q=80&w=1200&auto=format&fit=crop"),
+]
+
+# ---------- Imágenes derivadas (catalogo.imagenes) ----------
+# Hilos que generan thumbnails WebP/AVIF en segundo plano
+CATALOGO_IMAGENES_WORKERS = int(ENV("DJ_IMAGENES_WORKERS", "2"))
+# false = se generan en la misma petición (útil en scripts/pruebas)
+CATALOGO_IMAGENES_ASYNC = ENV("DJ_IMAGENES_ASYNC", "true").lower() == "true"
+# Segundos que se confía en "las derivadas ya existen" antes de volver a
+# mirar el storage (si alguien las borra, se regeneran tras este plazo)
+CATALOGO_IMAGENES_LISTA_TTL = int(ENV("DJ_IMAGENES_LISTA_TTL", "86400"))
+
+# ---------- Cola de tareas (tareas/, `manage.py run_worker`) ----------
+TAREAS_HILOS = int(ENV("DJ_TAREAS_HILOS", "4"))
+TAREAS_MAX_INTENTOS = 5
+# Reintentos: 30s, 60s, 120s... hasta 1 h entre intentos
+TAREAS_BACKOFF_BASE = 30
+TAREAS_BACKOFF_MAX = 3600
+# Una tarea EN_CURSO más de esto se da por perdida y vuelve a la cola
+TAREAS_TIMEOUT = 600
+TAREAS_RETENCION_DIAS = 7
+# true = se ejecutan al confirmar la petición, sin worker (dev sin run_worker)
+TAREAS_SINCRONO = ENV("DJ_TAREAS_SINCRONO", "false").lower() == "true"
+
+# ---------- Campañas de newsletter (catalogo.campanias) ----------
+# Destinatarios por conexión SMTP y mensajes por segundo (0 = sin límite).
+# Usan TAREAS_EMAIL_BACKEND salvo que se defina NEWSLETTER_EMAIL_BACKEND.
+NEWSLETTER_LOTE = int(ENV("DJ_NEWSLETTER_LOTE", "200"))
+NEWSLETTER_TASA = float(ENV("DJ_NEWSLETTER_TASA", "10"))
+
+# ---------- Bitácora de cambios (catalogo.models.ProductoCambio) ----------
+# Segundos que un hueco de ids se trata como transacción todavía abierta:
+# el sync_token no lo pasa hasta entonces (más que la transacción más larga).
+CATALOGO_CAMBIOS_ESPERA = int(ENV("DJ_CATALOGO_CAMBIOS_ESPERA", "60"))
+
 # ---------- CKEditor ----------
 CKEDITOR_CONFIGS = {
     "default": {
@@ -239,7 +337,6 @@ if ENV("DATABASE_URL"):
     import dj_database_url
     DATABASES["default"] = dj_database_url.config(
         default=ENV("DATABASE_URL"),
-        conn_max_age=600,
         ssl_require=True
     )
 
@@ -260,6 +357,13 @@ EMAIL_HOST_PASSWORD = ENV("DJ_EMAIL_PASS", EMAIL_HOST_PASSWORD)
 DEFAULT_FROM_EMAIL = ENV("DJ_DEFAULT_FROM", DEFAULT_FROM_EMAIL)
 SERVER_EMAIL = DEFAULT_FROM_EMAIL
 
+# Los correos pasan por la cola (tareas.correo): la petición solo escribe la
+# tarea y `manage.py run_worker` los envía con el backend real de arriba.
+# DJ_EMAIL_COLA=false = envío directo en la petición, como antes.
+TAREAS_EMAIL_BACKEND = EMAIL_BACKEND
+if ENV("DJ_EMAIL_COLA", "true").lower() == "true":
+    EMAIL_BACKEND = "tareas.correo.EmailBackend"
+
 # WhiteNoise solo cuando no estás en DEBUG (hosting simple sin Nginx)
 if not DEBUG:
     # Añade soporte de staticfiles sin cambiar tu estructura
@@ -292,4 +396,30 @@ _dburl = _os.environ.get("DATABASE_URL")
 if _dburl:
     import dj_database_url as _dj
     # Fuerza a tomar la URL exacta que hay en el entorno
-    DATABASES["default"] = _dj.parse(_dburl, conn_max_age=600, ssl_require=True)
+    DATABASES["default"] = _dj.parse(_dburl, ssl_require=True)
+
+# === Conexiones a la BD (se aplica igual a MySQL, DJ_DB_* y DATABASE_URL) ===
+# Reutiliza la conexión entre peticiones en vez de abrir una por request y
+# comprueba que siga viva antes de usarla (MySQL corta las inactivas).
+DB_CONN_MAX_AGE = int(ENV("DJ_DB_CONN_MAX_AGE", "600"))
+# Pool en proceso (ASGI): con async las conexiones no se reutilizan por
+# CONN_MAX_AGE. Solo PostgreSQL (Django >= 5.1, requiere psycopg-pool).
+DB_POOL = ENV("DJ_DB_POOL", "false").lower() == "true"
+for _db in DATABASES.values():
+    _db["CONN_HEALTH_CHECKS"] = True
+    if DB_POOL and _db["ENGINE"] == "django.db.backends.postgresql":
+        try:
+            import psycopg_pool  # noqa: F401
+        except ImportError:
+            from django.core.exceptions import ImproperlyConfigured
+            raise ImproperlyConfigured(
+                "DJ_DB_POOL=true necesita psycopg-pool (pip install -r requirements.txt)"
+            )
+        _db["CONN_MAX_AGE"] = 0  # el pool no admite conexiones persistentes
+        _db.setdefault("OPTIONS", {})["pool"] = {
+            "min_size": int(ENV("DJ_DB_POOL_MIN", "2")),
+            "max_size": int(ENV("DJ_DB_POOL_MAX", "10")),
+            "timeout": 10,
+        }
+    else:
+        _db["CONN_MAX_AGE"] = DB_CONN_MAX_AGE